@@ -0,0 +1,74 @@
+"""keep one rating watermark for every club
+
+Revision ID: 1e6b8d4f2a97
+Revises: 7c3a5e9d1f42
+Create Date: 2026-10-18 10:26:03.551904
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "1e6b8d4f2a97"
+down_revision: Union[str, None] = "7c3a5e9d1f42"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The last match of each club with a rank history, as kept before
+CLUB_WATERMARK_SQL = """
+INSERT INTO rating_watermark (club_id, session_id, session_index)
+SELECT club_id, session_id, session_index
+FROM (
+    SELECT
+        "session".club_id,
+        "match".session_id,
+        "match".session_index,
+        ROW_NUMBER() OVER (
+            PARTITION BY "session".club_id
+            ORDER BY "session".date DESC, "match".session_index DESC, "match".id DESC
+        ) AS position
+    FROM "match"
+    INNER JOIN "session"
+        ON "session".id = "match".session_id
+    WHERE EXISTS (
+        SELECT 1 FROM rank_history WHERE rank_history.match_id = "match".id
+    )
+)
+WHERE position = 1
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_table("rating_watermark")
+    op.create_table(
+        "rating_watermark",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("match_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["match_id"], ["match.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # The ratings were carried from club to club rather than in the order played,
+    # so without a watermark the next run of ranking_history.py rates every match
+    # again
+    op.execute("DELETE FROM current_rating")
+    op.execute("DELETE FROM rating_snapshot")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("rating_watermark")
+    op.create_table(
+        "rating_watermark",
+        sa.Column("club_id", sa.Integer(), nullable=False),
+        sa.Column("session_id", sa.Integer(), nullable=False),
+        sa.Column("session_index", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["club_id"], ["club.id"]),
+        sa.ForeignKeyConstraint(["session_id"], ["session.id"]),
+        sa.PrimaryKeyConstraint("club_id"),
+    )
+    op.execute(CLUB_WATERMARK_SQL)
@@ -0,0 +1,59 @@
+"""add rating undo log
+
+Revision ID: 2d6b8f4a1e37
+Revises: 9e4a1c7d2b56
+Create Date: 2026-10-17 17:03:44.981265
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "2d6b8f4a1e37"
+down_revision: Union[str, None] = "9e4a1c7d2b56"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The rating each person went into every match already rated with is their rating
+# after the match before
+RATING_UNDO_SQL = """
+INSERT INTO rating_undo (match_id, person_id, mu, sigma)
+SELECT
+    rank_history.match_id,
+    rank_history.person_id,
+    LAG(rank_history.mu) OVER history,
+    LAG(rank_history.sigma) OVER history
+FROM rank_history
+INNER JOIN "match"
+    ON "match".id = rank_history.match_id
+INNER JOIN "session"
+    ON "session".id = "match".session_id
+WINDOW history AS (
+    PARTITION BY rank_history.person_id
+    ORDER BY "session".date, "match".session_index, "match".id
+)
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "rating_undo",
+        sa.Column("match_id", sa.Integer(), nullable=False),
+        sa.Column("person_id", sa.Integer(), nullable=False),
+        sa.Column("mu", sa.Float(), nullable=True),
+        sa.Column("sigma", sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(["match_id"], ["match.id"]),
+        sa.ForeignKeyConstraint(["person_id"], ["person.id"]),
+        sa.PrimaryKeyConstraint("match_id", "person_id"),
+    )
+    op.execute(RATING_UNDO_SQL)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("rating_undo")
@@ -0,0 +1,93 @@
+"""add rating watermark and current rating tables
+
+Revision ID: 3c1f0d9a7b21
+Revises: abc5f560bcdf
+Create Date: 2026-10-17 09:12:40.118532
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3c1f0d9a7b21"
+down_revision: Union[str, None] = "abc5f560bcdf"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Seed both tables from any rank history already computed, so the next run carries
+# on from where the last full replay finished.
+CURRENT_RATING_SQL = """
+INSERT INTO current_rating (player_id, mu, sigma)
+SELECT player_id, mu, sigma
+FROM (
+    SELECT
+        rank_history.player_id,
+        rank_history.mu,
+        rank_history.sigma,
+        ROW_NUMBER() OVER (
+            PARTITION BY rank_history.player_id
+            ORDER BY "session".date DESC, "match".session_index DESC
+        ) AS position
+    FROM rank_history
+    INNER JOIN "match"
+        ON "match".id = rank_history.match_id
+    INNER JOIN "session"
+        ON "session".id = "match".session_id
+)
+WHERE position = 1
+"""
+
+WATERMARK_SQL = """
+INSERT INTO rating_watermark (club_id, session_id, session_index)
+SELECT club_id, session_id, session_index
+FROM (
+    SELECT
+        "session".club_id,
+        "match".session_id,
+        "match".session_index,
+        ROW_NUMBER() OVER (
+            PARTITION BY "session".club_id
+            ORDER BY "session".date DESC, "match".session_index DESC
+        ) AS position
+    FROM "match"
+    INNER JOIN "session"
+        ON "session".id = "match".session_id
+    WHERE EXISTS (
+        SELECT 1 FROM rank_history WHERE rank_history.match_id = "match".id
+    )
+)
+WHERE position = 1
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "rating_watermark",
+        sa.Column("club_id", sa.Integer(), nullable=False),
+        sa.Column("session_id", sa.Integer(), nullable=False),
+        sa.Column("session_index", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["club_id"], ["club.id"]),
+        sa.ForeignKeyConstraint(["session_id"], ["session.id"]),
+        sa.PrimaryKeyConstraint("club_id"),
+    )
+    op.create_table(
+        "current_rating",
+        sa.Column("player_id", sa.Integer(), nullable=False),
+        sa.Column("mu", sa.Float(), nullable=False),
+        sa.Column("sigma", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["player_id"], ["player.id"]),
+        sa.PrimaryKeyConstraint("player_id"),
+    )
+    op.execute(CURRENT_RATING_SQL)
+    op.execute(WATERMARK_SQL)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("current_rating")
+    op.drop_table("rating_watermark")
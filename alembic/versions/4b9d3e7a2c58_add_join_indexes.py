@@ -0,0 +1,37 @@
+"""add indexes on the columns the views and queries join on
+
+Revision ID: 4b9d3e7a2c58
+Revises: c8e2f5a1d639
+Create Date: 2026-10-17 21:12:09.417630
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4b9d3e7a2c58"
+down_revision: Union[str, None] = "c8e2f5a1d639"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_match_session_id_session_index", "match", ["session_id", "session_index"]
+    )
+    op.create_index("ix_result_match_id", "result", ["match_id", "winner", "team_id"])
+    op.create_index("ix_team_member_team_id", "team_member", ["team_id", "player_id"])
+    op.create_index("ix_player_person_id", "player", ["person_id"])
+    op.create_index("ix_rank_history_match_id", "rank_history", ["match_id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_rank_history_match_id", table_name="rank_history")
+    op.drop_index("ix_player_person_id", table_name="player")
+    op.drop_index("ix_team_member_team_id", table_name="team_member")
+    op.drop_index("ix_result_match_id", table_name="result")
+    op.drop_index("ix_match_session_id_session_index", table_name="match")
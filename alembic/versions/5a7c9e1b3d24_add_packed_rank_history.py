@@ -0,0 +1,39 @@
+"""add packed rank history table
+
+Revision ID: 5a7c9e1b3d24
+Revises: 8d2e4b6f1a93
+Create Date: 2026-10-17 13:40:51.207316
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5a7c9e1b3d24"
+down_revision: Union[str, None] = "8d2e4b6f1a93"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Filled by the next run of ranking_history.py, which packs everyone rated but
+    # not yet packed
+    op.create_table(
+        "packed_rank_history",
+        sa.Column("person_id", sa.Integer(), nullable=False),
+        sa.Column("club_id", sa.Integer(), nullable=False),
+        sa.Column("history", sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(["club_id"], ["club.id"]),
+        sa.ForeignKeyConstraint(["person_id"], ["person.id"]),
+        sa.PrimaryKeyConstraint("person_id", "club_id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("packed_rank_history")
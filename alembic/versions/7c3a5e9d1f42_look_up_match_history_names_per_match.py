@@ -0,0 +1,187 @@
+"""look up the names in match_history per match
+
+Revision ID: 7c3a5e9d1f42
+Revises: 4b9d3e7a2c58
+Create Date: 2026-10-17 23:40:51.208377
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7c3a5e9d1f42"
+down_revision: Union[str, None] = "4b9d3e7a2c58"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The names of each team's players are joined on per result, through the indexes
+# on result, team_member and player, so filtering by club only reads that club's
+# matches instead of naming every team first.
+SQLTEXTNEW = """
+    SELECT
+        m.id,
+        c.name as club_name,
+        s."date",
+        m."type",
+        winner_a.name as winner_a,
+        winner_b.name as winner_b,
+        m.winner_score,
+        loser_a.name as loser_a,
+        loser_b.name as loser_b,
+        m.loser_score,
+        (m.winner_score - m.loser_score) as margin,
+        m.duration,
+        m.session_index,
+        m.start_time,
+        m.end_time
+    FROM club c
+    INNER JOIN "session" s
+        ON s.club_id = c.id
+    INNER JOIN "match" m
+        ON m.session_id = s.id
+    INNER JOIN "result" won
+        ON won.match_id = m.id
+        AND won.winner
+    INNER JOIN team_member won_1
+        ON won_1.team_id = won.team_id
+    INNER JOIN team_member won_2
+        ON won_2.team_id = won.team_id
+        AND won_1.player_id < won_2.player_id
+    INNER JOIN player won_player_1
+        ON won_player_1.id = won_1.player_id
+    INNER JOIN person winner_a
+        ON winner_a.id = won_player_1.person_id
+    INNER JOIN player won_player_2
+        ON won_player_2.id = won_2.player_id
+    INNER JOIN person winner_b
+        ON winner_b.id = won_player_2.person_id
+    INNER JOIN "result" lost
+        ON lost.match_id = m.id
+        AND NOT lost.winner
+    INNER JOIN team_member lost_1
+        ON lost_1.team_id = lost.team_id
+    INNER JOIN team_member lost_2
+        ON lost_2.team_id = lost.team_id
+        AND lost_1.player_id < lost_2.player_id
+    INNER JOIN player lost_player_1
+        ON lost_player_1.id = lost_1.player_id
+    INNER JOIN person loser_a
+        ON loser_a.id = lost_player_1.person_id
+    INNER JOIN player lost_player_2
+        ON lost_player_2.id = lost_2.player_id
+    INNER JOIN person loser_b
+        ON loser_b.id = lost_player_2.person_id
+"""
+
+SQLTEXTOLD = """
+    WITH player_names as (
+        SELECT p.id, pe.name
+        FROM player p
+        INNER JOIN person pe
+            ON p.person_id = pe.id
+    ),
+
+    team_players as (
+        SELECT
+            tm.team_id, tm.player_id as "player_1_id",
+            tm2.player_id as "player_2_id"
+        FROM team_member tm
+        INNER JOIN team_member tm2
+            ON tm.team_id = tm2.team_id
+            AND tm.player_id < tm2.player_id
+    ),
+
+    team_names as (
+        SELECT
+            tp.team_id,
+            pe1.name as player_1,
+            pe2.name as player_2
+        FROM team_players tp
+        INNER JOIN player_names pe1
+            ON tp.player_1_id = pe1.id
+        INNER JOIN player_names pe2
+            ON tp.player_2_id = pe2.id
+    ),
+
+    club_matches as (
+        SELECT
+            m.id,
+            c.name as club_name,
+            s."date",
+            m."type",
+            m.session_index,
+            m.winner_score,
+            m.loser_score,
+            m.margin,
+            m.duration,
+            m.start_time,
+            m.end_time
+        FROM club c
+        INNER JOIN "session" s
+            ON s.club_id = c.id
+        INNER JOIN "match" m
+            ON m.session_id = s.id
+    ),
+
+    winners as (
+        SELECT
+            r.match_id,
+            tn.player_1 as winner_a,
+            tn.player_2 as winner_b
+        FROM "result" r
+        INNER JOIN team_names tn
+            ON tn.team_id = r.team_id
+        WHERE
+            r.winner
+    ),
+
+    losers as (
+        SELECT
+            r.match_id,
+            tn.player_1 as loser_a,
+            tn.player_2 as loser_b
+        FROM "result" r
+        INNER JOIN team_names tn
+            ON tn.team_id = r.team_id
+        WHERE
+            NOT r.winner
+    )
+
+    SELECT
+        cm.id,
+        cm.club_name,
+        cm.date,
+        cm."type",
+        w.winner_a,
+        w.winner_b,
+        cm.winner_score,
+        l.loser_a,
+        l.loser_b,
+        cm.loser_score,
+        (cm.winner_score - cm.loser_score) as margin,
+        cm.duration,
+        cm.session_index,
+        cm.start_time,
+        cm.end_time
+    FROM club_matches cm
+    INNER JOIN winners w
+        ON w.match_id = cm.id
+    INNER JOIN losers l
+        ON l.match_id = cm.id
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.text('DROP VIEW IF EXISTS "match_history"'))
+    op.execute(f"CREATE VIEW match_history AS {SQLTEXTNEW}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.text('DROP VIEW IF EXISTS "match_history"'))
+    op.execute(f"CREATE VIEW match_history AS {SQLTEXTOLD}")
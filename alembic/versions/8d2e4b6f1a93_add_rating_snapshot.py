@@ -0,0 +1,80 @@
+"""add rating snapshot table
+
+Revision ID: 8d2e4b6f1a93
+Revises: 3c1f0d9a7b21
+Create Date: 2026-10-17 11:02:17.450913
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8d2e4b6f1a93"
+down_revision: Union[str, None] = "3c1f0d9a7b21"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Snapshot every session already rated: each player's latest rating from the club's
+# matches up to the end of the session.
+RATING_SNAPSHOT_SQL = """
+INSERT INTO rating_snapshot (session_id, player_id, club_id, mu, sigma, ordinal)
+SELECT session_id, player_id, club_id, mu, sigma, mu - 3.0 * sigma
+FROM (
+    SELECT
+        "session".id AS session_id,
+        rank_history.player_id,
+        "session".club_id,
+        rank_history.mu,
+        rank_history.sigma,
+        ROW_NUMBER() OVER (
+            PARTITION BY "session".id, rank_history.player_id
+            ORDER BY played.date DESC, "match".session_index DESC
+        ) AS position
+    FROM "session"
+    INNER JOIN "session" AS played
+        ON played.club_id = "session".club_id
+        AND played.date <= "session".date
+    INNER JOIN "match"
+        ON "match".session_id = played.id
+    INNER JOIN rank_history
+        ON rank_history.match_id = "match".id
+    WHERE EXISTS (
+        SELECT 1
+        FROM "match" AS rated
+        INNER JOIN rank_history AS rated_history
+            ON rated_history.match_id = rated.id
+        WHERE rated.session_id = "session".id
+    )
+)
+WHERE position = 1
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "rating_snapshot",
+        sa.Column("session_id", sa.Integer(), nullable=False),
+        sa.Column("player_id", sa.Integer(), nullable=False),
+        sa.Column("club_id", sa.Integer(), nullable=False),
+        sa.Column("mu", sa.Float(), nullable=False),
+        sa.Column("sigma", sa.Float(), nullable=False),
+        sa.Column("ordinal", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["club_id"], ["club.id"]),
+        sa.ForeignKeyConstraint(["player_id"], ["player.id"]),
+        sa.ForeignKeyConstraint(["session_id"], ["session.id"]),
+        sa.PrimaryKeyConstraint("session_id", "player_id"),
+    )
+    # Finding a club's last session before a date
+    op.create_index("ix_session_club_id_date", "session", ["club_id", "date"])
+    op.execute(RATING_SNAPSHOT_SQL)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_session_club_id_date", table_name="session")
+    op.drop_table("rating_snapshot")
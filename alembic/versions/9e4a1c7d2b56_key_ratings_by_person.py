@@ -0,0 +1,204 @@
+"""key ratings by person
+
+Revision ID: 9e4a1c7d2b56
+Revises: 5a7c9e1b3d24
+Create Date: 2026-10-17 15:21:08.664127
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9e4a1c7d2b56"
+down_revision: Union[str, None] = "5a7c9e1b3d24"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every player needs a person to be rated: give those without one the person of the
+# same name, creating it if there is none.
+CREATE_PEOPLE_SQL = """
+INSERT INTO person (name)
+SELECT DISTINCT name
+FROM player
+WHERE person_id IS NULL
+    AND name NOT IN (SELECT name FROM person)
+"""
+
+LINK_PLAYERS_SQL = """
+UPDATE player
+SET person_id = (SELECT MIN(person.id) FROM person WHERE person.name = player.name)
+WHERE person_id IS NULL
+"""
+
+# Until the next run rates people directly, keep each person's history from the
+# player they played under in each match
+PERSON_HISTORY_SQL = """
+INSERT OR IGNORE INTO rank_history (person_id, match_id, mu, sigma)
+SELECT player.person_id, player_rank_history.match_id, player_rank_history.mu,
+    player_rank_history.sigma
+FROM player_rank_history
+INNER JOIN player
+    ON player.id = player_rank_history.player_id
+"""
+
+PLAYER_HISTORY_SQL = """
+INSERT INTO rank_history (player_id, match_id, mu, sigma)
+SELECT player.id, person_rank_history.match_id, person_rank_history.mu,
+    person_rank_history.sigma
+FROM person_rank_history
+INNER JOIN "result" r
+    ON r.match_id = person_rank_history.match_id
+INNER JOIN team_member tm
+    ON tm.team_id = r.team_id
+INNER JOIN player
+    ON player.id = tm.player_id
+    AND player.person_id = person_rank_history.person_id
+"""
+
+# The history is already per person, so the last match of each day is found without
+# going through the players
+VIEW_SQL = """
+    CREATE VIEW IF NOT EXISTS detailed_ranking_history AS
+        WITH last_game_per_session AS (
+	SELECT s.date, rh.person_id, MAX(m.session_index) AS last_match_index
+	FROM rank_history rh
+	INNER JOIN "match" m
+		ON m.id = rh.match_id
+	INNER JOIN "session" s
+		ON s.id = m.session_id
+	GROUP BY s.date, rh.person_id
+)
+
+SELECT s.club_id, rh.person_id, rh.match_id, s.date, m.start_time, r.winner, rh.mu, rh.sigma
+FROM rank_history rh
+INNER JOIN "match" m
+	ON m.id = rh.match_id
+INNER JOIN "session" s
+	ON m.session_id = s.id
+INNER JOIN last_game_per_session lg
+	ON lg.date = s.date
+	AND lg.last_match_index = m.session_index
+	AND lg.person_id = rh.person_id
+INNER JOIN "result" r
+	ON r.match_id = rh.match_id
+	AND r.team_id IN (
+		SELECT tm.team_id
+		FROM team_member tm
+		INNER JOIN player p
+			ON p.id = tm.player_id
+		WHERE p.person_id = rh.person_id
+	)
+ORDER BY s.date, m.start_time ASC
+"""
+
+PLAYER_VIEW_SQL = """
+    CREATE VIEW IF NOT EXISTS detailed_ranking_history AS
+        WITH last_game_per_session AS (
+	SELECT s.date, p.person_id, MAX(m.session_index) AS last_match_index
+	FROM "match" m
+	INNER JOIN "session" s
+		ON s.id = m.session_id
+	INNER JOIN "result" r
+		ON r.match_id = m.id
+	INNER JOIN team t
+		ON r.team_id = t.id
+	INNER JOIN team_member tm
+		ON tm.team_id = t.id
+	INNER JOIN player p
+		ON p.id = tm.player_id
+	GROUP BY s.date, p.person_id
+)
+
+SELECT s.club_id, p.person_id, r.match_id, s.date, m.start_time, r.winner, rh.mu, rh.sigma
+FROM "result" r
+INNER JOIN team t
+	ON t.id = r.team_id
+INNER JOIN team_member tm
+	ON t.id = tm.team_id
+INNER JOIN rank_history rh
+	ON rh.player_id = tm.player_id AND rh.match_id = r.match_id
+INNER JOIN "match" m
+	ON m.id = r.match_id
+INNER JOIN "session" s
+	ON m.session_id = s.id
+INNER JOIN player p
+	ON rh.player_id = p.id
+INNER JOIN last_game_per_session lg
+	ON lg.date = s.date
+	AND lg.last_match_index = m.session_index
+	AND lg.person_id = p.person_id
+ORDER BY s.date, m.start_time ASC
+"""
+
+
+def _create_rank_history(key: str, table: str):
+    op.create_table(
+        "rank_history",
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column("match_id", sa.Integer(), nullable=False),
+        sa.Column("mu", sa.Integer(), nullable=False),
+        sa.Column("sigma", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["match_id"], ["match.id"]),
+        sa.ForeignKeyConstraint([key], [f"{table}.id"]),
+        sa.PrimaryKeyConstraint(key, "match_id"),
+    )
+
+
+def _create_ratings(key: str, table: str):
+    """The current ratings and snapshots, left empty for the next run to fill"""
+    op.create_table(
+        "current_rating",
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column("mu", sa.Float(), nullable=False),
+        sa.Column("sigma", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint([key], [f"{table}.id"]),
+        sa.PrimaryKeyConstraint(key),
+    )
+    op.create_table(
+        "rating_snapshot",
+        sa.Column("session_id", sa.Integer(), nullable=False),
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column("club_id", sa.Integer(), nullable=False),
+        sa.Column("mu", sa.Float(), nullable=False),
+        sa.Column("sigma", sa.Float(), nullable=False),
+        sa.Column("ordinal", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["club_id"], ["club.id"]),
+        sa.ForeignKeyConstraint([key], [f"{table}.id"]),
+        sa.ForeignKeyConstraint(["session_id"], ["session.id"]),
+        sa.PrimaryKeyConstraint("session_id", key),
+    )
+    # Without watermarks the next run of ranking_history.py rates every match again
+    op.execute("DELETE FROM rating_watermark")
+    op.execute("DELETE FROM packed_rank_history")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(CREATE_PEOPLE_SQL)
+    op.execute(LINK_PLAYERS_SQL)
+    op.execute("DROP VIEW IF EXISTS detailed_ranking_history")
+    op.rename_table("rank_history", "player_rank_history")
+    _create_rank_history("person_id", "person")
+    op.execute(PERSON_HISTORY_SQL)
+    op.drop_table("player_rank_history")
+    op.execute(sa.text(VIEW_SQL))
+    op.drop_table("current_rating")
+    op.drop_table("rating_snapshot")
+    _create_ratings("person_id", "person")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP VIEW IF EXISTS detailed_ranking_history")
+    op.rename_table("rank_history", "person_rank_history")
+    _create_rank_history("player_id", "player")
+    op.execute(PLAYER_HISTORY_SQL)
+    op.drop_table("person_rank_history")
+    op.execute(sa.text(PLAYER_VIEW_SQL))
+    op.drop_table("current_rating")
+    op.drop_table("rating_snapshot")
+    _create_ratings("player_id", "player")
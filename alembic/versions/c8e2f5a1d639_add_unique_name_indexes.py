@@ -0,0 +1,189 @@
+"""add unique indexes on player, person and club names
+
+Revision ID: c8e2f5a1d639
+Revises: f3a7c2e9b814
+Create Date: 2026-10-17 19:48:30.552871
+
+"""
+
+from itertools import groupby
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c8e2f5a1d639"
+down_revision: Union[str, None] = "f3a7c2e9b814"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Each row whose name an earlier row already has, with the id of the earliest
+DUPLICATES_SQL = """
+SELECT t.id, first.id AS first
+FROM {table} t
+INNER JOIN (SELECT name, MIN(id) AS id FROM {table} GROUP BY name) first
+    ON first.name = t.name
+WHERE t.id != first.id
+ORDER BY t.id
+"""
+
+# Merging players, people or clubs changes whose matches make up a rating, so the
+# ratings are cleared and the next run rates every match again
+RATED_TABLES = [
+    "rating_undo",
+    "rank_history",
+    "current_rating",
+    "rating_snapshot",
+    "packed_rank_history",
+    "rating_watermark",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    duplicates = {
+        table: connection.execute(sa.text(DUPLICATES_SQL.format(table=table))).all()
+        for table in ["player", "person", "club"]
+    }
+    if any(duplicates.values()):
+        for table in RATED_TABLES:
+            connection.execute(sa.text(f"DELETE FROM {table}"))
+    merge_players(connection, duplicates["player"])
+    merge_people(connection, duplicates["person"])
+    merge_clubs(connection, duplicates["club"])
+
+    op.create_index("ix_player_name", "player", ["name"], unique=True)
+    op.create_index("ix_person_name", "person", ["name"], unique=True)
+    op.create_index("ix_club_name", "club", ["name"], unique=True)
+
+
+def merge_players(connection: sa.Connection, duplicates: Sequence[sa.Row]):
+    """Move the duplicates' places in teams to the first, then merge equal teams"""
+    teams: set[int] = set()
+    for row in duplicates:
+        parameters = {"id": row.id, "first": row.first}
+        # The first keeps their person, or takes the duplicate's if they have none
+        connection.execute(
+            sa.text(
+                "UPDATE player SET person_id = COALESCE(person_id, "
+                "(SELECT person_id FROM player WHERE id = :id)) WHERE id = :first"
+            ),
+            parameters,
+        )
+        teams.update(
+            connection.scalars(
+                sa.text("SELECT team_id FROM team_member WHERE player_id = :id"),
+                parameters,
+            )
+        )
+        # A team of both would otherwise hold the first twice
+        connection.execute(
+            sa.text(
+                "DELETE FROM team_member WHERE player_id = :id AND team_id IN "
+                "(SELECT team_id FROM team_member WHERE player_id = :first)"
+            ),
+            parameters,
+        )
+        connection.execute(
+            sa.text("UPDATE team_member SET player_id = :first WHERE player_id = :id"),
+            parameters,
+        )
+        connection.execute(sa.text("DELETE FROM player WHERE id = :id"), parameters)
+    if not teams:
+        return
+
+    # The changed teams' keys, as in f3a7c2e9b814: a team whose new key another
+    # already has is a duplicate of it, and its matches move to that one
+    members = connection.execute(
+        sa.text(
+            "SELECT team_id, player_id FROM team_member "
+            f"WHERE team_id IN ({', '.join(map(str, sorted(teams)))}) "
+            "ORDER BY team_id, player_id"
+        )
+    ).all()
+    for team_id, rows in groupby(members, key=lambda row: row.team_id):
+        key = ",".join(str(row.player_id) for row in rows)
+        parameters = {"key": key, "id": team_id}
+        first = connection.scalar(
+            sa.text("SELECT id FROM team WHERE key = :key AND id != :id"), parameters
+        )
+        if first is None:
+            connection.execute(
+                sa.text("UPDATE team SET key = :key WHERE id = :id"), parameters
+            )
+            continue
+        parameters["first"] = first
+        connection.execute(
+            sa.text("UPDATE result SET team_id = :first WHERE team_id = :id"),
+            parameters,
+        )
+        connection.execute(
+            sa.text("DELETE FROM team_member WHERE team_id = :id"), parameters
+        )
+        connection.execute(sa.text("DELETE FROM team WHERE id = :id"), parameters)
+
+
+def merge_people(connection: sa.Connection, duplicates: Sequence[sa.Row]):
+    """Move the duplicates' players to the first"""
+    for row in duplicates:
+        parameters = {"id": row.id, "first": row.first}
+        connection.execute(
+            sa.text("UPDATE player SET person_id = :first WHERE person_id = :id"),
+            parameters,
+        )
+        connection.execute(sa.text("DELETE FROM person WHERE id = :id"), parameters)
+
+
+def merge_clubs(connection: sa.Connection, duplicates: Sequence[sa.Row]):
+    """
+    Move the duplicates' sessions to the first. A session on a day the first
+    already has one is merged into it, its matches numbered after that one's.
+    """
+    for row in duplicates:
+        sessions = connection.execute(
+            sa.text("SELECT id, date FROM session WHERE club_id = :id"),
+            {"id": row.id},
+        ).all()
+        for session_id, date in sessions:
+            parameters = {"id": session_id, "first": row.first, "date": date}
+            existing = connection.scalar(
+                sa.text(
+                    "SELECT id FROM session WHERE club_id = :first AND date = :date"
+                ),
+                parameters,
+            )
+            if existing is None:
+                connection.execute(
+                    sa.text("UPDATE session SET club_id = :first WHERE id = :id"),
+                    parameters,
+                )
+                continue
+            parameters["existing"] = existing
+            parameters["offset"] = connection.scalar(
+                sa.text(
+                    'SELECT COALESCE(MAX(session_index) + 1, 0) FROM "match" '
+                    "WHERE session_id = :existing"
+                ),
+                parameters,
+            )
+            connection.execute(
+                sa.text(
+                    'UPDATE "match" SET session_id = :existing, '
+                    "session_index = session_index + :offset WHERE session_id = :id"
+                ),
+                parameters,
+            )
+            connection.execute(
+                sa.text("DELETE FROM session WHERE id = :id"), parameters
+            )
+        connection.execute(sa.text("DELETE FROM club WHERE id = :id"), {"id": row.id})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_club_name", table_name="club")
+    op.drop_index("ix_person_name", table_name="person")
+    op.drop_index("ix_player_name", table_name="player")
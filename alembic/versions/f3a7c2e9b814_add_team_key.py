@@ -0,0 +1,62 @@
+"""add canonical team key
+
+Revision ID: f3a7c2e9b814
+Revises: 2d6b8f4a1e37
+Create Date: 2026-10-17 18:26:12.307419
+
+"""
+
+from itertools import groupby
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f3a7c2e9b814"
+down_revision: Union[str, None] = "2d6b8f4a1e37"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("team", sa.Column("key", sa.String(), nullable=True))
+
+    # The ids of the members, ascending and comma separated, as TeamRepo.key
+    connection = op.get_bind()
+    members = connection.execute(
+        sa.text(
+            "SELECT team_id, player_id FROM team_member ORDER BY team_id, player_id"
+        )
+    ).all()
+    keys: dict[str, int] = {}
+    for team_id, rows in groupby(members, key=lambda row: row.team_id):
+        key = ",".join(str(row.player_id) for row in rows)
+        first = keys.setdefault(key, team_id)
+        if first == team_id:
+            connection.execute(
+                sa.text("UPDATE team SET key = :key WHERE id = :id"),
+                {"key": key, "id": team_id},
+            )
+            continue
+        # A duplicate of an earlier team: its matches move to that one
+        parameters = {"first": first, "id": team_id}
+        connection.execute(
+            sa.text("UPDATE result SET team_id = :first WHERE team_id = :id"),
+            parameters,
+        )
+        connection.execute(
+            sa.text("DELETE FROM team_member WHERE team_id = :id"), parameters
+        )
+        connection.execute(sa.text("DELETE FROM team WHERE id = :id"), parameters)
+
+    op.create_index("ix_team_key", "team", ["key"], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_team_key", table_name="team")
+    # Dropped in place: rebuilding the table would break the views that use it
+    op.drop_column("team", "key")
@@ -22,6 +22,46 @@ export interface RankHistory {
   history: RankHistoryEntry[];
 }
 
+/**
+ * A rank history as columns, decoded from `/rank_history/{player_id}?format=packed`.
+ * Entry `i` of every column belongs to the same match, oldest first.
+ */
+export interface PackedRankHistory {
+  matchId: Uint32Array;
+  mu: Float32Array;
+  sigma: Float32Array;
+  /** Start of each match, in milliseconds since the Unix epoch */
+  time: Float64Array;
+  winner: Uint8Array;
+}
+
+const PACKED_HEADER_SIZE = 12;
+const SECONDS_PER_DAY = 86400;
+
+/** Decode the layout described in `scripts/packed_history.py`. */
+export function decodePackedRankHistory(buffer: ArrayBuffer): PackedRankHistory {
+  const header = new DataView(buffer, 0, PACKED_HEADER_SIZE);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== "RHP1") {
+    throw new Error("decodePackedRankHistory: not a packed rank history.");
+  }
+  const count = header.getUint32(4, true);
+  const firstDay = header.getInt32(8, true);
+  const column = (index: number) => PACKED_HEADER_SIZE + 4 * count * index;
+  const seconds = new Uint32Array(buffer, column(3), count);
+  const time = new Float64Array(count);
+  for (let i = 0; i < count; i++) {
+    time[i] = (firstDay * SECONDS_PER_DAY + seconds[i]) * 1000;
+  }
+  return {
+    mu: new Float32Array(buffer, column(0), count),
+    sigma: new Float32Array(buffer, column(1), count),
+    matchId: new Uint32Array(buffer, column(2), count),
+    time,
+    winner: new Uint8Array(buffer, column(4), count),
+  };
+}
+
 export interface PlayerStats {
   player_id: number;
   averagePointsDifference: number;
@@ -49,6 +89,42 @@ export interface OpponentStats {
   opponents: OtherPlayerStatsEntry[];
 }
 
+export interface LeaderboardEntry {
+  playerId: number;
+  playerName: string;
+  mu: number;
+  sigma: number;
+  ordinal: number;
+}
+
+export interface Leaderboard {
+  clubId: number;
+  /** YYYY-MM-DD */
+  date: string;
+  players: LeaderboardEntry[];
+}
+
+export type MatchmakingObjective = "total" | "minimum";
+
+export interface MatchmakingRequest {
+  playerIds: number[];
+  courts?: number;
+  objective?: MatchmakingObjective;
+}
+
+export interface Court {
+  court: number;
+  teamOne: number[];
+  teamTwo: number[];
+  drawProbability: number;
+}
+
+export interface Matchmaking {
+  objective: MatchmakingObjective;
+  courts: Court[];
+  resting: number[];
+}
+
 export interface ValidationError {
   loc: Array<string | number>;
   msg: string;
@@ -123,6 +199,30 @@ export class SpiralOpenskillClient {
     );
   }
 
+  /** GET /rank_history/{player_id}?format=packed — Rank history as columns */
+  async getPackedRankHistory(
+    player_id: number,
+    signal?: AbortSignal
+  ): Promise<PackedRankHistory> {
+    if (!Number.isFinite(player_id)) {
+      throw new Error(
+        "getPackedRankHistory: 'player_id' must be a finite number."
+      );
+    }
+    const url = `${this.baseUrl}/rank_history/${encodeURIComponent(
+      String(player_id)
+    )}?format=packed`;
+    const res = await fetch(url, {
+      method: "GET",
+      headers: { ...this.defaultHeaders, accept: "application/octet-stream" },
+      signal,
+    });
+    if (!res.ok) {
+      throw new ApiError(`HTTP ${res.status}`, { status: res.status, url });
+    }
+    return decodePackedRankHistory(await res.arrayBuffer());
+  }
+
   async getPlayerStats(
     player_id: number,
     signal?: AbortSignal
@@ -194,6 +294,41 @@ export class SpiralOpenskillClient {
       }
     );
   }
+
+  /** GET /leaderboard/{club_id} — Ratings of a club's players as of a date */
+  async getLeaderboard(
+    club_id: number,
+    as_of?: string,
+    signal?: AbortSignal
+  ): Promise<Leaderboard> {
+    if (!Number.isFinite(club_id)) {
+      throw new Error("getLeaderboard: 'club_id' must be a finite number.");
+    }
+    const path = `/leaderboard/${encodeURIComponent(String(club_id))}`;
+    if (as_of === undefined) {
+      return this.request<Leaderboard>(path, { method: "GET", signal });
+    }
+    return this.request<Leaderboard>(
+      `${path}?as_of=${encodeURIComponent(as_of)}`,
+      {
+        method: "GET",
+        signal,
+      }
+    );
+  }
+
+  /** POST /matchmaking — Assign the players present to courts */
+  async getMatchmaking(
+    request: MatchmakingRequest,
+    signal?: AbortSignal
+  ): Promise<Matchmaking> {
+    return this.request<Matchmaking>("/matchmaking", {
+      method: "POST",
+      headers: { "content-type": "application/json" },
+      body: JSON.stringify(request),
+      signal,
+    });
+  }
   // ---- internals ----
 
   private async request<T>(
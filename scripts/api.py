@@ -1,25 +1,35 @@
+import enum
 import os
 from contextlib import asynccontextmanager
 from datetime import date, datetime, time
 from typing import Annotated, Iterator
 
 from dotenv import find_dotenv, load_dotenv
-from fastapi import Depends, FastAPI, Request
-from pydantic import BaseModel, ConfigDict
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from pydantic import BaseModel, ConfigDict, Field
 from pydantic.alias_generators import to_camel
+from sqlalchemy.orm import sessionmaker
 
-from .database import Database
+from .database import Database, connect
+from .matchmaking import Objective, assign_courts
+from .packed_history import INITIAL_ENTRY, pack_history
 
 load_dotenv(find_dotenv())
 
-DB_PATH = os.getenv("DB_PATH", "data.db")
+DB_PATH = os.getenv("DB_PATH", "data/data.db")
 DB_ECHO = False
+# The API only reads, alongside the scripts writing to the same file
+DB_PROFILE = os.getenv("DB_PROFILE", "reader")
 
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
-    app.state.db_factory = lambda: Database(DB_PATH, echo=DB_ECHO)
+    # One engine and pool for the life of the app: each request only opens a session
+    engine = connect(DB_PATH, echo=DB_ECHO, profile=DB_PROFILE)
+    session_factory = sessionmaker(engine)
+    app.state.db_factory = lambda: Database(session_factory=session_factory)
     yield
+    engine.dispose()
 
 
 def get_db(request: Request) -> Iterator[Database]:
@@ -50,6 +60,11 @@ class RankHistory(BaseModel):
     history: list[RankHistoryEntry]
 
 
+class RankHistoryFormat(enum.StrEnum):
+    JSON = "json"
+    PACKED = "packed"
+
+
 app = FastAPI(lifespan=lifespan, title="Spiral Openskill")
 
 
@@ -61,35 +76,35 @@ def get_people(db: Db) -> list[Player]:
 
 
 @app.get("/rank_history/{player_id}", response_model=RankHistory)
-def get_rank_history(player_id: int, db: Db) -> RankHistory:
-    with db:
-        history = db.views.detailed_ranking_history(player_id)
-        initial_date = datetime(2025, 1, 1, 0, 0, 0)
-        initial_rank = RankHistoryEntry(
-            match_id=0,
-            date=initial_date.date(),
-            start_time=initial_date.time(),
-            datetime=initial_date,
-            mu=25,
-            sigma=25 / 3,
-            winner=False,
+def get_rank_history(
+    player_id: int,
+    db: Db,
+    format_: RankHistoryFormat = Query(RankHistoryFormat.JSON, alias="format"),
+    club_id: int = 1,
+) -> RankHistory | Response:
+    if format_ == RankHistoryFormat.PACKED:
+        # Precomputed by the replay, see ``packed_history`` for the layout
+        with db:
+            history = db.packed_history.get(player_id, club_id)
+        return Response(
+            content=history or pack_history([INITIAL_ENTRY]),
+            media_type="application/octet-stream",
         )
+    with db:
+        history = db.views.detailed_ranking_history(player_id, club_id)
         return RankHistory(
             player_id=player_id,
             history=[
-                initial_rank,
-                *(
-                    RankHistoryEntry(
-                        match_id=entry.match_id,
-                        date=entry.date,
-                        start_time=entry.start_time,
-                        datetime=datetime.combine(entry.date, entry.start_time),
-                        mu=entry.mu,
-                        sigma=entry.sigma,
-                        winner=entry.winner,
-                    )
-                    for entry in history
-                ),
+                RankHistoryEntry(
+                    match_id=entry.match_id,
+                    date=entry.date,
+                    start_time=entry.start_time,
+                    datetime=datetime.combine(entry.date, entry.start_time),
+                    mu=entry.mu,
+                    sigma=entry.sigma,
+                    winner=entry.winner,
+                )
+                for entry in [INITIAL_ENTRY, *history]
             ],
         )
 
@@ -191,3 +206,110 @@ def get_opponent_stats(player_id: int, db: Db, club_id: int = 1) -> OpponentStat
             for row in stats
         ],
     )
+
+
+class LeaderboardEntry(BaseModel):
+    model_config = ConfigDict(
+        alias_generator=to_camel, populate_by_name=True, from_attributes=True
+    )
+    player_id: int
+    player_name: str
+    mu: float
+    sigma: float
+    ordinal: float
+
+
+class Leaderboard(BaseModel):
+    model_config = ConfigDict(
+        alias_generator=to_camel, populate_by_name=True, from_attributes=True
+    )
+    club_id: int
+    date: date
+    players: list[LeaderboardEntry]
+
+
+@app.get("/leaderboard/{club_id}", response_model=Leaderboard)
+def get_leaderboard(club_id: int, db: Db, as_of: date | None = None) -> Leaderboard:
+    as_of = as_of or date.today()
+    with db:
+        snapshot = db.snapshots.get_leaderboard(club_id, as_of)
+        return Leaderboard(
+            club_id=club_id,
+            date=as_of,
+            players=[
+                LeaderboardEntry(
+                    player_id=row.person_id,
+                    player_name=row.person.name,
+                    mu=row.mu,
+                    sigma=row.sigma,
+                    ordinal=row.ordinal,
+                )
+                for row in snapshot
+            ],
+        )
+
+
+class MatchmakingRequest(BaseModel):
+    model_config = ConfigDict(
+        alias_generator=to_camel, populate_by_name=True, from_attributes=True
+    )
+    player_ids: list[int]
+    courts: int = Field(default=4, ge=1)
+    objective: Objective = Objective.TOTAL
+    # Rate the players as they were going into this match, to replay a session
+    before_match_id: int | None = None
+
+
+class Court(BaseModel):
+    model_config = ConfigDict(
+        alias_generator=to_camel, populate_by_name=True, from_attributes=True
+    )
+    court: int
+    team_one: list[int]
+    team_two: list[int]
+    draw_probability: float
+
+
+class Matchmaking(BaseModel):
+    model_config = ConfigDict(
+        alias_generator=to_camel, populate_by_name=True, from_attributes=True
+    )
+    objective: Objective
+    courts: list[Court]
+    resting: list[int]
+
+
+@app.post("/matchmaking", response_model=Matchmaking)
+def get_matchmaking(request: MatchmakingRequest, db: Db) -> Matchmaking:
+    player_ids = list(dict.fromkeys(request.player_ids))
+    with db:
+        if request.before_match_id is None:
+            ranks = db.rank_history.get_latest_by_people(player_ids)
+            latest = {id_: (rank.mu, rank.sigma) for id_, rank in ranks.items()}
+        else:
+            index = db.rank_history.as_of_index(player_ids)
+            if request.before_match_id not in index.ordinals:
+                raise HTTPException(status_code=404, detail="Match not found")
+            latest = index.before_many(player_ids, request.before_match_id)
+    ratings = [latest.get(id_, (25, 25 / 3)) for id_ in player_ids]
+    assignment = assign_courts(
+        [mu for mu, _ in ratings],
+        [sigma for _, sigma in ratings],
+        request.courts,
+        request.objective,
+    )
+    return Matchmaking(
+        objective=request.objective,
+        courts=[
+            Court(
+                court=number,
+                team_one=[player_ids[player] for player in players[:2]],
+                team_two=[player_ids[player] for player in players[2:]],
+                draw_probability=probability,
+            )
+            for number, (players, probability) in enumerate(
+                zip(assignment.courts, assignment.probabilities), start=1
+            )
+        ],
+        resting=[player_ids[player] for player in assignment.resting],
+    )
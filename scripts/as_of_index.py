@@ -0,0 +1,164 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Mapping
+
+import numpy as np
+
+
+class AsOfIndex:
+    """
+    Every rating of every person, in memory, by when it was earned.
+
+    Matches are numbered by a global ordinal, their position in the order
+    ``(date, session_index, match id)`` across every club. Each person's ratings
+    are kept in parallel arrays sorted by the ordinal of the match they followed,
+    so the rating someone had going into a match is found with one ``bisect``, in
+    ``O(log n)`` of the length of their history.
+
+    Lookups for many people at once search one sorted array of every rating, keyed
+    by person and then ordinal, which is built on the first such lookup after a
+    rating is added.
+    """
+
+    def __init__(self, ordinals: Mapping[int, int]):
+        """
+        Parameters
+        ----------
+        ordinals : Mapping[int, int]
+            The global ordinal of every match, by match id
+        """
+        self.ordinals = ordinals
+        self._history: dict[int, tuple[array, array, array]] = {}
+        self._flat: tuple[np.ndarray, ...] | None = None
+
+    def __len__(self) -> int:
+        return sum(len(ordinals) for ordinals, _, _ in self._history.values())
+
+    def add(self, person_id: int, match_id: int, mu: float, sigma: float):
+        """
+        Record a person's rating after a match.
+
+        Ratings added in the order played are appended, others are inserted in
+        place. A rating already held for the match is replaced.
+
+        Raises
+        ------
+        KeyError
+            If the match was not given an ordinal when the index was made
+        """
+        ordinal = self.ordinals[match_id]
+        self._flat = None
+        history = self._history.get(person_id)
+        if history is None:
+            history = self._history[person_id] = (array("q"), array("d"), array("d"))
+        ordinals, mus, sigmas = history
+        if not ordinals or ordinals[-1] < ordinal:
+            ordinals.append(ordinal)
+            mus.append(mu)
+            sigmas.append(sigma)
+            return
+        position = bisect_left(ordinals, ordinal)
+        if position < len(ordinals) and ordinals[position] == ordinal:
+            mus[position] = mu
+            sigmas[position] = sigma
+            return
+        ordinals.insert(position, ordinal)
+        mus.insert(position, mu)
+        sigmas.insert(position, sigma)
+
+    def at(self, person_id: int, ordinal: int) -> tuple[float, float] | None:
+        """
+        A person's rating going into the match with the given ordinal.
+
+        Parameters
+        ----------
+        person_id : int
+            Id of the person
+        ordinal : int
+            Global ordinal of the match
+
+        Returns
+        -------
+        tuple[float, float] | None
+            The mu and sigma after their last match before it, or None if they had
+            not played before it
+        """
+        history = self._history.get(person_id)
+        if history is None:
+            return None
+        ordinals, mus, sigmas = history
+        position = bisect_left(ordinals, ordinal)
+        if position == 0:
+            return None
+        return mus[position - 1], sigmas[position - 1]
+
+    def before(self, person_id: int, match_id: int) -> tuple[float, float] | None:
+        """A person's rating right before a match, or None if it was their first"""
+        return self.at(person_id, self.ordinals[match_id])
+
+    def before_many(
+        self, person_ids: Iterable[int], match_id: int
+    ) -> dict[int, tuple[float, float]]:
+        """
+        The ratings of many people right before a match.
+
+        Parameters
+        ----------
+        person_ids : Iterable[int]
+            Ids of the people
+        match_id : int
+            Id of the match
+
+        Returns
+        -------
+        dict[int, tuple[float, float]]
+            The mu and sigma of each person who had played before the match, by
+            person id
+        """
+        ordinal = self.ordinals[match_id]
+        ids = np.fromiter(person_ids, dtype=np.int64)
+        if not self._history:
+            return {}
+        people, starts, keys, mus, sigmas = self._flatten()
+        slots = np.minimum(np.searchsorted(people, ids), len(people) - 1)
+        # The last rating before the match sorts just before the person's key for it
+        positions = np.searchsorted(keys, slots * self._stride + ordinal) - 1
+        found = (people[slots] == ids) & (positions >= starts[slots])
+        positions = positions[found]
+        return dict(
+            zip(
+                ids[found].tolist(),
+                zip(mus[positions].tolist(), sigmas[positions].tolist()),
+            )
+        )
+
+    @property
+    def _stride(self) -> int:
+        return len(self.ordinals) + 1
+
+    def _flatten(self) -> tuple[np.ndarray, ...]:
+        """
+        Every rating in one array, sorted by person and then ordinal.
+
+        Returns the sorted person ids, where each person's ratings start, the key
+        ``slot * stride + ordinal`` of each rating, where ``slot`` is the person's
+        position among the ids, and the mu and sigma of each rating.
+        """
+        if self._flat is None:
+            people = sorted(self._history)
+            histories = [self._history[person] for person in people]
+            lengths = np.array([len(ordinals) for ordinals, _, _ in histories])
+            starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            keys = np.concatenate(
+                [
+                    np.frombuffer(ordinals, dtype=np.int64)
+                    for ordinals, _, _ in histories
+                ]
+            )
+            keys += np.repeat(np.arange(len(people)) * self._stride, lengths)
+            mus = np.concatenate([np.frombuffer(mus) for _, mus, _ in histories])
+            sigmas = np.concatenate(
+                [np.frombuffer(sigmas) for _, _, sigmas in histories]
+            )
+            self._flat = (np.array(people, dtype=np.int64), starts, keys, mus, sigmas)
+        return self._flat
@@ -7,7 +7,7 @@ from typing import Iterator
 from bs4 import BeautifulSoup
 from bs4.element import Tag
 from common import Match, MatchRow, Player, SafeList, Type
-from database import Club, Database
+from database import DB_PATH, Club, Database
 from database import Match as DbMatch
 from database import Result, Session
 
@@ -147,9 +147,12 @@ def main():
     pages_root = root / "ebadders_pages"
     clubs = ["racquetiers"]
 
-    database = Database("./data.db")
+    database = Database(DB_PATH, profile="ingest")
 
     with database:
+        # Every match looks its players up by name
+        database.players.preload()
+        database.clubs.preload()
         for club_name in clubs:
             pages_dir = pages_root / club_name
             club = database.clubs.get_or_create(club_name)
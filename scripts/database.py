@@ -1,34 +1,55 @@
 from __future__ import annotations
 
 import datetime
-from dataclasses import dataclass
-from typing import Any, Sequence
+import os
+from dataclasses import dataclass, field
+from itertools import batched, groupby
+from typing import Any, Iterable, Iterator, Mapping, Sequence
 
 try:
+    from as_of_index import AsOfIndex
     from common import MatchRow, Type
+    from packed_history import INITIAL_ENTRY, HistoryEntry, pack_history
 except ModuleNotFoundError:
+    from .as_of_index import AsOfIndex
     from .common import Type
+    from .packed_history import INITIAL_ENTRY, HistoryEntry, pack_history
 
 from sqlalchemy import (
     Boolean,
     Column,
     Date,
+    Engine,
     Float,
     ForeignKey,
+    Index,
     Integer,
+    LargeBinary,
     String,
     Table,
     Time,
     UniqueConstraint,
-    case,
+    bindparam,
     create_engine,
+    delete,
+    event,
     func,
     insert,
     select,
+    tuple_,
+    update,
 )
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import Session as DatabaseSession
-from sqlalchemy.orm import declarative_base, mapped_column, relationship, sessionmaker
+from sqlalchemy.orm import (
+    aliased,
+    declarative_base,
+    joinedload,
+    mapped_column,
+    relationship,
+    sessionmaker,
+)
 from sqlalchemy.sql import text
 
 Base = declarative_base()
@@ -38,6 +59,8 @@ team_member = Table(
     Base.metadata,
     Column("player_id", ForeignKey("player.id"), primary_key=True),
     Column("team_id", ForeignKey("team.id"), primary_key=True),
+    # The primary key finds the teams of a player, this the players of a team
+    Index("ix_team_member_team_id", "team_id", "player_id"),
 )
 
 
@@ -52,9 +75,11 @@ class Player(Base, AsDictMixin):
     __tablename__ = "player"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    name: Mapped[str] = mapped_column(
+        String(100), nullable=False, index=True, unique=True
+    )
     person_id: Mapped[int] = mapped_column(
-        ForeignKey("person.id", name="person_id_fkey"), nullable=True
+        ForeignKey("person.id", name="person_id_fkey"), nullable=True, index=True
     )
 
     teams: Mapped[list[Team]] = relationship(
@@ -62,22 +87,23 @@ class Player(Base, AsDictMixin):
         back_populates="members",
     )
     person: Mapped[Player] = relationship("Person", back_populates="players")
-    rank_history: Mapped[list[RankHistory]] = relationship(
-        "RankHistory", back_populates="player"
-    )
 
 
 class RankHistory(Base):
+    """The rating of a person after one of their matches"""
+
     __tablename__ = "rank_history"
 
-    player_id: Mapped[int] = mapped_column(ForeignKey("player.id"), primary_key=True)
+    person_id: Mapped[int] = mapped_column(ForeignKey("person.id"), primary_key=True)
     match_id: Mapped[int] = mapped_column(ForeignKey("match.id"), primary_key=True)
     mu: Mapped[int] = mapped_column(nullable=False)
     sigma: Mapped[int] = mapped_column(nullable=False)
 
-    player: Mapped[Player] = relationship(Player, back_populates="rank_history")
+    person: Mapped[Person] = relationship("Person", back_populates="rank_history")
     match: Mapped[Match] = relationship("Match")
 
+    __table_args__ = (Index("ix_rank_history_match_id", "match_id"),)
+
 
 class Result(Base):
     __tablename__ = "result"
@@ -88,11 +114,18 @@ class Result(Base):
     match: Mapped[Match] = relationship("Match", back_populates="teams")
     team: Mapped[Team] = relationship("Team", back_populates="matches")
 
+    # Covers finding the winning or losing team of a match
+    __table_args__ = (Index("ix_result_match_id", "match_id", "winner", "team_id"),)
+
 
 class Team(Base, AsDictMixin):
     __tablename__ = "team"
 
     id: Mapped[int] = mapped_column(primary_key=True)
+    # The ids of the members, ascending and comma separated: see ``TeamRepo.key``
+    key: Mapped[str | None] = mapped_column(
+        String, nullable=True, index=True, unique=True
+    )
     members: Mapped[list[Player]] = relationship(
         secondary=team_member,
         back_populates="teams",
@@ -119,6 +152,10 @@ class Match(Base):
     session: Mapped[Session] = relationship("Session", back_populates="matches")
     teams: Mapped[list[Result]] = relationship(Result, back_populates="match")
 
+    __table_args__ = (
+        Index("ix_match_session_id_session_index", "session_id", "session_index"),
+    )
+
 
 class Session(Base):
     __tablename__ = "session"
@@ -130,22 +167,88 @@ class Session(Base):
     matches: Mapped[list[Match]] = relationship("Match", back_populates="session")
     club: Mapped[Club] = relationship("Club", back_populates="sessions")
 
-    __table_args__ = (UniqueConstraint("date", "club_id", name="unique_club_session"),)
+    __table_args__ = (
+        UniqueConstraint("date", "club_id", name="unique_club_session"),
+        Index("ix_session_club_id_date", "club_id", "date"),
+    )
 
 
 class Club(Base, AsDictMixin):
     __tablename__ = "club"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(nullable=False)
+    name: Mapped[str] = mapped_column(nullable=False, index=True, unique=True)
     sessions: Mapped[list[Session]] = relationship(Session, back_populates="club")
 
 
 class Person(Base):
     __tablename__ = "person"
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(nullable=False)
+    name: Mapped[str] = mapped_column(nullable=False, index=True, unique=True)
     players: Mapped[list[Player]] = relationship(Player, back_populates="person")
+    rank_history: Mapped[list[RankHistory]] = relationship(
+        RankHistory, back_populates="person"
+    )
+
+
+class RatingWatermark(Base):
+    """The last match whose ratings have been computed, in the order played"""
+
+    __tablename__ = "rating_watermark"
+
+    # There is only ever the one row
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    match_id: Mapped[int] = mapped_column(ForeignKey("match.id"), nullable=False)
+
+    match: Mapped[Match] = relationship("Match")
+
+
+class CurrentRating(Base):
+    """The rating of a person after the last match computed"""
+
+    __tablename__ = "current_rating"
+
+    person_id: Mapped[int] = mapped_column(ForeignKey("person.id"), primary_key=True)
+    mu: Mapped[float] = mapped_column(Float, nullable=False)
+    sigma: Mapped[float] = mapped_column(Float, nullable=False)
+
+
+class RatingSnapshot(Base):
+    """The rating of every person of a club at the end of one of its sessions"""
+
+    __tablename__ = "rating_snapshot"
+
+    session_id: Mapped[int] = mapped_column(ForeignKey("session.id"), primary_key=True)
+    person_id: Mapped[int] = mapped_column(ForeignKey("person.id"), primary_key=True)
+    club_id: Mapped[int] = mapped_column(ForeignKey("club.id"), nullable=False)
+    mu: Mapped[float] = mapped_column(Float, nullable=False)
+    sigma: Mapped[float] = mapped_column(Float, nullable=False)
+    ordinal: Mapped[float] = mapped_column(Float, nullable=False)
+
+    person: Mapped[Person] = relationship(Person)
+    session: Mapped[Session] = relationship(Session)
+
+
+class PackedRankHistory(Base):
+    """A person's rank history at a club, packed by :func:`pack_history`"""
+
+    __tablename__ = "packed_rank_history"
+
+    person_id: Mapped[int] = mapped_column(ForeignKey("person.id"), primary_key=True)
+    club_id: Mapped[int] = mapped_column(ForeignKey("club.id"), primary_key=True)
+    history: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+
+class RatingUndo(Base):
+    """A person's rating going into a match, so its rating can be undone"""
+
+    __tablename__ = "rating_undo"
+
+    match_id: Mapped[int] = mapped_column(ForeignKey("match.id"), primary_key=True)
+    person_id: Mapped[int] = mapped_column(ForeignKey("person.id"), primary_key=True)
+    # Null before a person's first match
+    mu: Mapped[float | None] = mapped_column(Float, nullable=True)
+    sigma: Mapped[float | None] = mapped_column(Float, nullable=True)
 
 
 detailed_ranking_history = Table(
@@ -216,11 +319,48 @@ class SessionRepo:
         return self.session.scalars(query).all()
 
 
+@dataclass(slots=True)
+class Lineup:
+    """Who played in a match, as person ids, and how it finished"""
+
+    match_id: int
+    session_id: int
+    club_id: int
+    date: datetime.date
+    session_index: int
+    winners: list[int]
+    losers: list[int]
+    winner_score: int
+    loser_score: int
+    type_: Type = Type.UNDEFINED
+    winner_names: list[str] = field(default_factory=list)
+    loser_names: list[str] = field(default_factory=list)
+
+    @property
+    def players(self) -> list[int]:
+        """Ids of the people who played, winners first"""
+        return [*self.winners, *self.losers]
+
+    @property
+    def names(self) -> list[str]:
+        """Names of the people who played, winners first"""
+        return [*self.winner_names, *self.loser_names]
+
+
 class MatchRepo:
     def __init__(self, db: Database):
         self.session = db.session
         self.db = db
 
+    def get_by_ids(self, ids: Iterable[int]) -> Sequence[Match]:
+        return self.session.scalars(select(Match).where(Match.id.in_(ids))).all()
+
+    def delete(self, ids: Iterable[int]):
+        """Delete matches and their results"""
+        ids = list(ids)
+        self.session.execute(delete(Result).where(Result.match_id.in_(ids)))
+        self.session.execute(delete(Match).where(Match.id.in_(ids)))
+
     def get_ordered(self, session_id: int) -> Sequence[Match]:
         """Get all the matches in a given session in the order that they were played
 
@@ -241,16 +381,167 @@ class MatchRepo:
         )
         return self.session.scalars(query).all()
 
+    def stream(
+        self,
+        club_id: int | None = None,
+        after: RatingWatermark | tuple[datetime.date, int] | None = None,
+        yield_per: int = 1000,
+    ) -> Iterator[Lineup]:
+        """Stream who played in every match of a club, in the order played
+
+        The matches are ordered by the database and read ``yield_per`` rows at a
+        time, so the whole history is never held in memory. Players are resolved to
+        their person here, so everything rated from the lineups is keyed by person.
+
+        Matches played on the same day at different clubs are ordered by their
+        index in the session and then their id, the order they are rated in.
+
+        Parameters
+        ----------
+        club_id : int | None, optional
+            Id of the club, by default every club's matches
+        after : RatingWatermark | tuple[datetime.date, int] | None, optional
+            Only get matches after this watermark, or from this date and session
+            index on, by default every match
+        yield_per : int, optional
+            Number of rows fetched at a time, by default 1000
+
+        Yields
+        ------
+        Lineup
+            The players and scores of each match
+        """
+        query = (
+            select(
+                Match.id,
+                Match.session_id,
+                Session.club_id,
+                Session.date,
+                Match.session_index,
+                Match.winner_score,
+                Match.loser_score,
+                Match.type_,
+                Result.winner,
+                Player.person_id,
+                Person.name,
+            )
+            .join(Session)
+            .join(Result, Result.match_id == Match.id)
+            .join(team_member, team_member.c.team_id == Result.team_id)
+            .join(Player, Player.id == team_member.c.player_id)
+            .join(Person, Person.id == Player.person_id)
+            # Each team's people in the order match_history names them
+            .order_by(Session.date, Match.session_index, Match.id, Player.id)
+            .execution_options(yield_per=yield_per)
+        )
+        if club_id is not None:
+            query = query.where(Session.club_id == club_id)
+        if isinstance(after, RatingWatermark):
+            last = after.match
+            query = query.where(
+                tuple_(Session.date, Match.session_index, Match.id)
+                > tuple_(last.session.date, last.session_index, last.id)
+            )
+        elif after is not None:
+            query = query.where(
+                tuple_(Session.date, Match.session_index) >= tuple_(*after)
+            )
+
+        lineup = None
+        for row in self.session.execute(query):
+            if lineup is None or lineup.match_id != row.id:
+                if lineup is not None:
+                    yield lineup
+                lineup = Lineup(
+                    row.id,
+                    row.session_id,
+                    row.club_id,
+                    row.date,
+                    row.session_index,
+                    [],
+                    [],
+                    row.winner_score,
+                    row.loser_score,
+                    row.type_,
+                )
+            if row.winner:
+                lineup.winners.append(row.person_id)
+                lineup.winner_names.append(row.name)
+            else:
+                lineup.losers.append(row.person_id)
+                lineup.loser_names.append(row.name)
+        if lineup is not None:
+            yield lineup
+
+    def get_lineups(
+        self, club_id: int | None, start: tuple[datetime.date, int]
+    ) -> list[Lineup]:
+        """Get who played in every match of a club from a point on, in the order played
+
+        Parameters
+        ----------
+        club_id : int | None
+            Id of the club, or None for every club's matches
+        start : tuple[datetime.date, int]
+            Date and session index of the first match to get
+
+        Returns
+        -------
+        list[Lineup]
+            The players and scores of each match
+        """
+        return list(self.stream(club_id, start))
+
+
+class ByNameMixin:
+    """
+    Looks rows up by their unique name through a cache kept for the session.
+
+    After :meth:`preload` has read every row in one query, every lookup is answered
+    from memory. Before that, each name is queried once and remembered. Rows made
+    through the repo are remembered as they are created.
+    """
+
+    model: Any
+    session: DatabaseSession
+
+    def _init_cache(self):
+        self._by_name: dict[str, Any] = {}
+        self._complete = False
+
+    def preload(self):
+        """Read every row into the cache"""
+        rows = self.session.scalars(select(self.model)).all()
+        self._by_name = {row.name: row for row in rows}
+        self._complete = True
+
+    def forget(self):
+        """Empty the cache, for when rows were changed without going through it"""
+        self._init_cache()
+
+    def get(self, name: str) -> Any | None:
+        if name in self._by_name:
+            return self._by_name[name]
+        if self._complete:
+            return None
+        row = self.session.scalars(
+            select(self.model).where(self.model.name == name)
+        ).one_or_none()
+        if row is not None:
+            self._by_name[name] = row
+        return row
+
+    def _remember(self, row: Any):
+        self._by_name[row.name] = row
+
+
+class PlayerRepo(ByNameMixin):
+    model = Player
 
-class PlayerRepo:
     def __init__(self, db: Database):
         self.session = db.session
         self.db = db
-
-    def get(self, name: str) -> Player | None:
-        return self.session.scalars(
-            select(Player).where(Player.name == name)
-        ).one_or_none()
+        self._init_cache()
 
     def get_by_id(self, id_: int) -> Player | None:
         return self.session.scalars(
@@ -262,6 +553,7 @@ class PlayerRepo:
         if player is None:
             player = Player(name=name)
             self.session.add(player)
+            self._remember(player)
         return player
 
 
@@ -269,128 +561,717 @@ class TeamRepo:
     def __init__(self, db: Database):
         self.session = db.session
         self.db = db
+        # Teams already looked up in this session, by key
+        self._cache: dict[str, Team | None] = {}
+
+    @staticmethod
+    def key(player_ids: Iterable[int]) -> str:
+        """The canonical key of the team of exactly these players"""
+        return ",".join(str(player_id) for player_id in sorted(player_ids))
+
+    def forget(self):
+        self._cache.clear()
 
     def get(self, players: list[Player]) -> Team | None:
-        target_ids = [player.id for player in players]
-        num_players = len(target_ids)
-        team_subquery = (
-            select(team_member.c.team_id)
-            .group_by(team_member.c.team_id)
-            .having(
-                func.sum(case((team_member.c.player_id.in_(target_ids), 1), else_=0))
-                == num_players
-            )
-        ).subquery()
-        return self.session.scalars(
-            select(Team).join(team_subquery, Team.id == team_subquery.c.team_id)
-        ).one_or_none()
+        if any(player.id is None for player in players):
+            # A player not yet in the database has no team
+            return None
+        key = self.key(player.id for player in players)
+        if key not in self._cache:
+            self._cache[key] = self.session.scalars(
+                select(Team).where(Team.key == key)
+            ).one_or_none()
+        return self._cache[key]
 
     def get_or_create(self, players: list[Player]) -> Team:
         team = self.get(players)
         if team is None:
-            team = Team(members=players)
+            if any(player.id is None for player in players):
+                self.session.flush()
+            key = self.key(player.id for player in players)
+            team = Team(members=players, key=key)
             self.session.add(team)
+            self._cache[key] = team
         return team
 
 
-class ClubRepo:
+class ClubRepo(ByNameMixin):
+    model = Club
+
     def __init__(self, db: Database):
         self.session = db.session
         self.db = db
+        self._init_cache()
 
     def insert(self, name: str) -> Club:
         self.session.execute(insert(Club), [{"name": name}])
         club = self.session.scalars(select(Club).where(Club.name == name)).first()
         assert club is not None
+        self._remember(club)
         return club
 
-    def get(self, name: str) -> Club | None:
-        return self.session.scalars(select(Club).where(Club.name == name)).one_or_none()
-
     def get_or_create(self, name: str) -> Club:
         club = self.get(name)
         if club is None:
             club = Club(name=name)
             self.session.add(club)
+            self._remember(club)
         return club
 
     def all(self) -> Sequence[Club]:
         return self.session.scalars(select(Club)).all()
 
 
-class PersonRepo:
+class PersonRepo(ByNameMixin):
+    model = Person
+
     def __init__(self, db: Database):
         self.session = db.session
-
-    def get(self, name: str) -> Person | None:
-        return self.session.scalars(
-            select(Person).where(Person.name == name)
-        ).one_or_none()
+        self._init_cache()
 
     def get_or_create(self, name: str) -> Person:
         person = self.get(name)
         if person is None:
             person = Person(name=name)
             self.session.add(person)
+            self._remember(person)
         return person
 
     def get_all(self) -> Sequence[Person]:
         return self.session.scalars(select(Person).order_by(Person.name)).all()
 
+    def link_unassociated(self) -> int:
+        """
+        Give every player without a person the person of the same name.
+
+        Ratings are kept per person, so a player has to belong to one before their
+        matches can be rated. A person is created for any name without one.
+
+        Returns
+        -------
+        int
+            Number of players linked
+        """
+        unlinked = select(Player.name).where(Player.person_id.is_(None))
+        self.session.execute(
+            insert(Person).from_select(
+                ["name"],
+                unlinked.where(Player.name.not_in(select(Person.name))).distinct(),
+            )
+        )
+        # The people were made without the cache
+        self.forget()
+        person_id = (
+            select(func.min(Person.id))
+            .where(Person.name == Player.name)
+            .scalar_subquery()
+        )
+        return self.session.execute(
+            update(Player)
+            .where(Player.person_id.is_(None))
+            .values(person_id=person_id)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
 
 class RankHistoryRepo:
     def __init__(self, db: Database):
         self.session = db.session
 
-    def get_latest(self, player_id: int) -> RankHistory | None:
+    def get_latest(self, person_id: int) -> RankHistory | None:
         return self.session.scalars(
             select(RankHistory)
             .join(Match)
             .join(Session)
-            .where(RankHistory.player_id == player_id)
+            .where(RankHistory.person_id == person_id)
             .order_by(
                 Session.date.desc(),
                 Match.session_index.desc(),
+                Match.id.desc(),
             )
         ).first()
 
-    def get_all(self, player_id: int) -> list[RankHistory]:
+    def get_latest_before(
+        self, start: tuple[datetime.date, int]
+    ) -> dict[int, tuple[float, float]]:
+        """The latest rating of every person from matches before a point"""
+        position = (
+            func.row_number()
+            .over(
+                partition_by=RankHistory.person_id,
+                order_by=(
+                    Session.date.desc(),
+                    Match.session_index.desc(),
+                    Match.id.desc(),
+                ),
+            )
+            .label("position")
+        )
+        ranked = (
+            select(RankHistory.person_id, RankHistory.mu, RankHistory.sigma, position)
+            .join(Match, RankHistory.match_id == Match.id)
+            .join(Session)
+            .where(tuple_(Session.date, Match.session_index) < tuple_(*start))
+            .subquery()
+        )
+        rows = self.session.execute(
+            select(ranked.c.person_id, ranked.c.mu, ranked.c.sigma).where(
+                ranked.c.position == 1
+            )
+        )
+        return {person_id: (mu, sigma) for person_id, mu, sigma in rows}
+
+    def get_since(
+        self, club_id: int | None, start: tuple[datetime.date, int]
+    ) -> dict[tuple[int, int], tuple[float, float]]:
+        """
+        Every rating of a club's matches, or of every club's matches if None, from a
+        point on, by person and match id
+        """
+        query = (
+            select(
+                RankHistory.person_id,
+                RankHistory.match_id,
+                RankHistory.mu,
+                RankHistory.sigma,
+            )
+            .join(Match, RankHistory.match_id == Match.id)
+            .join(Session)
+            .where(tuple_(Session.date, Match.session_index) >= tuple_(*start))
+        )
+        if club_id is not None:
+            query = query.where(Session.club_id == club_id)
+        rows = self.session.execute(query)
+        return {
+            (person_id, match_id): (mu, sigma)
+            for person_id, match_id, mu, sigma in rows
+        }
+
+    def delete(self, person_id: int, match_id: int):
+        self.session.execute(
+            delete(RankHistory)
+            .where(RankHistory.person_id == person_id)
+            .where(RankHistory.match_id == match_id)
+        )
+
+    def delete_matches(self, match_ids: Iterable[int]):
+        self.session.execute(
+            delete(RankHistory).where(RankHistory.match_id.in_(list(match_ids)))
+        )
+
+    def clear(self):
+        """Delete every rating, before rating every match again"""
+        self.session.execute(delete(RankHistory))
+
+    def get_latest_by_people(self, person_ids: Sequence[int]) -> dict[int, RankHistory]:
+        """The most recent rating of each person"""
+        position = (
+            func.row_number()
+            .over(
+                partition_by=RankHistory.person_id,
+                order_by=(
+                    Session.date.desc(),
+                    Match.session_index.desc(),
+                    Match.id.desc(),
+                ),
+            )
+            .label("position")
+        )
+        latest = (
+            select(RankHistory, position)
+            .join(Match)
+            .join(Session)
+            .where(RankHistory.person_id.in_(person_ids))
+            .subquery()
+        )
+        rank = aliased(RankHistory, latest)
+        rows = self.session.scalars(select(rank).where(latest.c.position == 1))
+        return {rank.person_id: rank for rank in rows}
+
+    def as_of_index(self, person_ids: Iterable[int] | None = None) -> AsOfIndex:
+        """
+        Load every rating into an index of what each person's rating was going into
+        any match.
+
+        Every match is given its global ordinal, rated or not, so ratings of
+        matches rated later can be added to the index.
+
+        Parameters
+        ----------
+        person_ids : Iterable[int] | None, optional
+            Only load the ratings of these people, by default everyone's
+
+        Returns
+        -------
+        AsOfIndex
+            The index of the rank history
+        """
+        match_ids = self.session.scalars(
+            select(Match.id)
+            .join(Session)
+            .order_by(Session.date, Match.session_index, Match.id)
+        )
+        index = AsOfIndex(
+            {match_id: ordinal for ordinal, match_id in enumerate(match_ids)}
+        )
+        query = (
+            select(
+                RankHistory.person_id,
+                RankHistory.match_id,
+                RankHistory.mu,
+                RankHistory.sigma,
+            )
+            .join(Match, RankHistory.match_id == Match.id)
+            .join(Session)
+            .order_by(
+                RankHistory.person_id, Session.date, Match.session_index, Match.id
+            )
+            .execution_options(yield_per=10000)
+        )
+        if person_ids is not None:
+            query = query.where(RankHistory.person_id.in_(list(person_ids)))
+        rows = self.session.execute(query)
+        for person_id, match_id, mu, sigma in rows:
+            index.add(person_id, match_id, mu, sigma)
+        return index
+
+    def get_all(self, person_id: int) -> list[RankHistory]:
         return list(
             self.session.scalars(
                 select(RankHistory)
-                .where(RankHistory.player_id == player_id)
+                .where(RankHistory.person_id == person_id)
                 .order_by(RankHistory.match_id)
             ).all()
         )
 
     def get_all_by_person(self, person_id: int) -> Sequence[RankHistory]:
-        return self.session.scalars(
-            select(RankHistory)
-            .join(Player)
-            .where(Player.person_id == person_id)
-            .order_by(RankHistory.match_id)
-        ).all()
+        return self.get_all(person_id)
 
-    def get(self, player_id: int, match_id: int) -> RankHistory | None:
+    def get(self, person_id: int, match_id: int) -> RankHistory | None:
         return self.session.scalars(
             select(RankHistory)
-            .where(RankHistory.player_id == player_id)
+            .where(RankHistory.person_id == person_id)
             .where(RankHistory.match_id == match_id)
         ).one_or_none()
 
     def new(
-        self, player_id: int, match_id: int, mu: float, sigma: float
+        self, person_id: int, match_id: int, mu: float, sigma: float
     ) -> RankHistory:
-        existing_rank = self.get(player_id, match_id)
+        existing_rank = self.get(person_id, match_id)
         if existing_rank is not None:
             return existing_rank
+        return self.add(person_id, match_id, mu, sigma)
+
+    def bulk_upsert(
+        self, rows: Iterable[Mapping[str, Any]], batch_size: int = 1000
+    ) -> int:
+        """
+        Insert or update many ratings without loading them into the session.
+
+        Parameters
+        ----------
+        rows : Iterable[Mapping[str, Any]]
+            Ratings with ``person_id``, ``match_id``, ``mu`` and ``sigma`` keys
+        batch_size : int, optional
+            Number of rows sent to the database per statement, by default 1000
+
+        Returns
+        -------
+        int
+            Number of rows written
+        """
+        table = RankHistory.__table__
+        statement = sqlite_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.person_id, table.c.match_id],
+            set_={"mu": statement.excluded.mu, "sigma": statement.excluded.sigma},
+        )
+        written = 0
+        for batch in batched(rows, batch_size):
+            self.session.execute(statement, list(batch))
+            written += len(batch)
+        return written
+
+    def add(
+        self, person_id: int, match_id: int, mu: float, sigma: float
+    ) -> RankHistory:
+        """Add a rating without checking for an existing one"""
         rank_history = RankHistory(
-            player_id=player_id, match_id=match_id, mu=mu, sigma=sigma
+            person_id=person_id, match_id=match_id, mu=mu, sigma=sigma
         )
         self.session.add(rank_history)
         return rank_history
 
 
+class WatermarkRepo:
+    def __init__(self, db: Database):
+        self.session = db.session
+
+    def get(self) -> RatingWatermark | None:
+        return self.session.get(RatingWatermark, 1)
+
+    def set(self, match_id: int):
+        statement = sqlite_insert(RatingWatermark).values(id=1, match_id=match_id)
+        self.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[RatingWatermark.id],
+                set_={"match_id": statement.excluded.match_id},
+            )
+        )
+
+    def reset(self, before: datetime.date):
+        """
+        Move the watermark back to the last match played before a date, if it is on
+        or after the date, so it never moves past a match not yet rated
+        """
+        watermark = self.get()
+        if watermark is None or watermark.match.session.date < before:
+            return
+        match_id = self.session.scalars(
+            select(Match.id)
+            .join(Session)
+            .where(Session.date < before)
+            .order_by(Session.date.desc(), Match.session_index.desc(), Match.id.desc())
+            .limit(1)
+        ).first()
+        if match_id is None:
+            self.session.execute(delete(RatingWatermark))
+        else:
+            self.set(match_id)
+
+
+class CurrentRatingRepo:
+    def __init__(self, db: Database):
+        self.session = db.session
+
+    def get_all(self) -> dict[int, tuple[float, float]]:
+        """The current rating of every person, by person id"""
+        rows = self.session.execute(
+            select(CurrentRating.person_id, CurrentRating.mu, CurrentRating.sigma)
+        )
+        return {person_id: (mu, sigma) for person_id, mu, sigma in rows}
+
+    def clear(self):
+        self.session.execute(delete(CurrentRating))
+
+    def restore(
+        self, ratings: Mapping[int, tuple[float, float] | None], batch_size: int = 1000
+    ):
+        """Set the current rating of many people, removing those given None"""
+        removed = [person_id for person_id, rating in ratings.items() if rating is None]
+        self.session.execute(
+            delete(CurrentRating).where(CurrentRating.person_id.in_(removed))
+        )
+        self.bulk_upsert(
+            {
+                person_id: rating
+                for person_id, rating in ratings.items()
+                if rating is not None
+            },
+            batch_size,
+        )
+
+    def bulk_upsert(
+        self, ratings: Mapping[int, tuple[float, float]], batch_size: int = 1000
+    ):
+        """Set the current rating of many people"""
+        table = CurrentRating.__table__
+        statement = sqlite_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.person_id],
+            set_={"mu": statement.excluded.mu, "sigma": statement.excluded.sigma},
+        )
+        rows = (
+            {"person_id": person_id, "mu": mu, "sigma": sigma}
+            for person_id, (mu, sigma) in ratings.items()
+        )
+        for batch in batched(rows, batch_size):
+            self.session.execute(statement, list(batch))
+
+
+class RatingSnapshotRepo:
+    def __init__(self, db: Database):
+        self.session = db.session
+
+    def get_latest(
+        self, club_id: int, before: datetime.date | None = None
+    ) -> dict[int, tuple[float, float]]:
+        """The ratings of a club's last snapshot, or last before a date, by person id"""
+        query = select(RatingSnapshot.session_id).join(Session)
+        query = query.where(RatingSnapshot.club_id == club_id)
+        if before is not None:
+            query = query.where(Session.date < before)
+        session_id = query.order_by(Session.date.desc()).limit(1).scalar_subquery()
+        rows = self.session.execute(
+            select(
+                RatingSnapshot.person_id, RatingSnapshot.mu, RatingSnapshot.sigma
+            ).where(RatingSnapshot.session_id == session_id)
+        )
+        return {person_id: (mu, sigma) for person_id, mu, sigma in rows}
+
+    def get_leaderboard(
+        self, club_id: int, date: datetime.date
+    ) -> Sequence[RatingSnapshot]:
+        """
+        The rating of every person of a club as it stood on a date.
+
+        Only the club's last session on or before the date is looked up, and its
+        snapshot read, so the cost grows with the number of people rather than the
+        length of the history.
+
+        Parameters
+        ----------
+        club_id : int
+            Id of the club
+        date : datetime.date
+            The date to rank the people on
+
+        Returns
+        -------
+        Sequence[RatingSnapshot]
+            The people's ratings, highest ordinal first
+        """
+        session_id = (
+            select(Session.id)
+            .where(Session.club_id == club_id)
+            .where(Session.date <= date)
+            .where(
+                select(RatingSnapshot.person_id)
+                .where(RatingSnapshot.session_id == Session.id)
+                .exists()
+            )
+            .order_by(Session.date.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+        return self.session.scalars(
+            select(RatingSnapshot)
+            .options(joinedload(RatingSnapshot.person))
+            .where(RatingSnapshot.session_id == session_id)
+            .order_by(RatingSnapshot.ordinal.desc())
+        ).all()
+
+    def delete_since(self, date: datetime.date):
+        """Delete the snapshots of every session from a date on"""
+        self.session.execute(
+            delete(RatingSnapshot).where(
+                RatingSnapshot.session_id.in_(
+                    select(Session.id).where(Session.date >= date)
+                )
+            )
+        )
+
+    def replace(
+        self,
+        club_id: int,
+        session_id: int,
+        ratings: Mapping[int, tuple[float, float]],
+        batch_size: int = 1000,
+    ):
+        """Set the snapshot of a session, removing anyone no longer in it"""
+        self.session.execute(
+            delete(RatingSnapshot).where(RatingSnapshot.session_id == session_id)
+        )
+        rows = (
+            {
+                "club_id": club_id,
+                "session_id": session_id,
+                "person_id": person_id,
+                "mu": mu,
+                "sigma": sigma,
+                "ordinal": mu - 3.0 * sigma,
+            }
+            for person_id, (mu, sigma) in ratings.items()
+        )
+        for batch in batched(rows, batch_size):
+            self.session.execute(insert(RatingSnapshot.__table__), list(batch))
+
+
+class PackedHistoryRepo:
+    def __init__(self, db: Database):
+        self.session = db.session
+
+    # Built once: this is the most requested query, so it skips building a statement
+    _get = (
+        select(PackedRankHistory.history)
+        .where(PackedRankHistory.person_id == bindparam("person_id"))
+        .where(PackedRankHistory.club_id == bindparam("club_id"))
+    )
+
+    def get(self, person_id: int, club_id: int) -> bytes | None:
+        return self.session.scalar(
+            self._get, {"person_id": person_id, "club_id": club_id}
+        )
+
+    def stale(self, person_ids: Iterable[int]) -> set[int]:
+        """The given people, and anyone rated but not yet packed"""
+        people = set(person_ids)
+        unpacked = (
+            select(RankHistory.person_id)
+            .where(RankHistory.person_id.not_in(select(PackedRankHistory.person_id)))
+            .distinct()
+        )
+        people.update(self.session.scalars(unpacked))
+        return people
+
+    def refresh(self, person_ids: Iterable[int] | None = None, batch_size: int = 1000):
+        """
+        Pack the rank history of people again from ``rank_history``.
+
+        As in the ``detailed_ranking_history`` view, only each person's last match
+        of a day is kept, whichever club it was at, and each history starts with
+        the initial entry the API serves.
+
+        Parameters
+        ----------
+        person_ids : Iterable[int] | None, optional
+            Ids of the people to pack, by default everyone
+        batch_size : int, optional
+            Number of histories written per statement, by default 1000
+        """
+        query = (
+            select(
+                RankHistory.person_id,
+                Session.club_id,
+                Session.date,
+                Match.session_index,
+                Match.start_time,
+                RankHistory.match_id,
+                Result.winner,
+                RankHistory.mu,
+                RankHistory.sigma,
+            )
+            .join(Match, Match.id == RankHistory.match_id)
+            .join(Session)
+            .join(Result, Result.match_id == Match.id)
+            .join(team_member, team_member.c.team_id == Result.team_id)
+            .join(
+                Player,
+                (Player.id == team_member.c.player_id)
+                & (Player.person_id == RankHistory.person_id),
+            )
+            .order_by(RankHistory.person_id, Session.date, Match.session_index)
+        )
+        clear = delete(PackedRankHistory)
+        if person_ids is not None:
+            person_ids = list(person_ids)
+            query = query.where(RankHistory.person_id.in_(person_ids))
+            clear = clear.where(PackedRankHistory.person_id.in_(person_ids))
+        self.session.execute(clear)
+
+        def packed():
+            rows = self.session.execute(query)
+            for person_id, history in groupby(rows, key=lambda row: row.person_id):
+                history = list(history)
+                # The index of the last match of each day, at any club
+                last = {row.date: row.session_index for row in history}
+                clubs: dict[int, list] = {}
+                for row in history:
+                    if row.session_index == last[row.date]:
+                        clubs.setdefault(row.club_id, []).append(row)
+                for club_id, club_history in clubs.items():
+                    entries = [
+                        HistoryEntry(
+                            match_id=row.match_id,
+                            date=row.date,
+                            start_time=row.start_time,
+                            winner=row.winner,
+                            mu=row.mu,
+                            sigma=row.sigma,
+                        )
+                        for row in sorted(
+                            club_history, key=lambda row: (row.date, row.start_time)
+                        )
+                    ]
+                    yield {
+                        "person_id": person_id,
+                        "club_id": club_id,
+                        "history": pack_history([INITIAL_ENTRY, *entries]),
+                    }
+
+        for batch in batched(packed(), batch_size):
+            self.session.execute(insert(PackedRankHistory.__table__), list(batch))
+
+
+class UndoLogRepo:
+    def __init__(self, db: Database):
+        self.session = db.session
+
+    def bulk_upsert(self, rows: Iterable[Mapping[str, Any]], batch_size: int = 1000):
+        """
+        Record the ratings people went into matches with.
+
+        Parameters
+        ----------
+        rows : Iterable[Mapping[str, Any]]
+            Ratings with ``match_id``, ``person_id``, ``mu`` and ``sigma`` keys, mu
+            and sigma None before a person's first match
+        batch_size : int, optional
+            Number of rows sent to the database per statement, by default 1000
+        """
+        table = RatingUndo.__table__
+        statement = sqlite_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.match_id, table.c.person_id],
+            set_={"mu": statement.excluded.mu, "sigma": statement.excluded.sigma},
+        )
+        for batch in batched(rows, batch_size):
+            self.session.execute(statement, list(batch))
+
+    def delete(self, person_id: int, match_id: int):
+        self.session.execute(
+            delete(RatingUndo)
+            .where(RatingUndo.person_id == person_id)
+            .where(RatingUndo.match_id == match_id)
+        )
+
+    def clear(self):
+        self.session.execute(delete(RatingUndo))
+
+    def roll_back(
+        self, since: datetime.date
+    ) -> tuple[list[int], dict[int, tuple[float, float] | None]]:
+        """
+        Undo the ratings of every match from a date on, across every club.
+
+        The log is read newest first, in the order the matches were rated, so each
+        person ends up with the rating they went into the earliest of the matches
+        with, in one pass over the ``K`` matches undone. Their log entries are
+        deleted.
+
+        Parameters
+        ----------
+        since : datetime.date
+            Date of the first session to undo
+
+        Returns
+        -------
+        tuple[list[int], dict[int, tuple[float, float] | None]]
+            Ids of the matches undone, and the rating of everyone in them before
+            the first, None if they had not played before it
+        """
+        rows = self.session.execute(
+            select(
+                RatingUndo.match_id,
+                RatingUndo.person_id,
+                RatingUndo.mu,
+                RatingUndo.sigma,
+            )
+            .join(Match, RatingUndo.match_id == Match.id)
+            .join(Session)
+            .where(Session.date >= since)
+            .order_by(Session.date.desc(), Match.session_index.desc(), Match.id.desc())
+        )
+        match_ids: dict[int, None] = {}
+        ratings: dict[int, tuple[float, float] | None] = {}
+        for match_id, person_id, mu, sigma in rows:
+            match_ids[match_id] = None
+            ratings[person_id] = None if mu is None else (mu, sigma)
+        undone = list(match_ids)
+        self.session.execute(delete(RatingUndo).where(RatingUndo.match_id.in_(undone)))
+        return undone, ratings
+
+
 @dataclass(frozen=True, slots=True)
 class OtherPlayerStats:
     player_id: int
@@ -405,12 +1286,12 @@ class ViewsRepo:
         self.session = db.session
 
     def detailed_ranking_history(
-        self, player_id: int
+        self, player_id: int, club_id: int = 1
     ) -> Sequence[DetailedRankingHistory]:
         return self.session.scalars(
             select(DetailedRankingHistory)
             .where(DetailedRankingHistory.person_id == player_id)
-            .where(DetailedRankingHistory.club_id == 1)
+            .where(DetailedRankingHistory.club_id == club_id)
         ).all()
 
     def player_stats(self, player_id: int) -> PlayerStats | None:
@@ -438,6 +1319,7 @@ class ViewsRepo:
                         start_time,
                         end_time
                     FROM match_history
+                    ORDER BY "date", session_index, id
                 """
                 )
             ).all()
@@ -461,9 +1343,10 @@ class ViewsRepo:
                         end_time
                     FROM match_history
                     WHERE club_name = :club_name
+                    ORDER BY "date", session_index, id
                 """
                 ),
-                {club_name: club_name},
+                {"club_name": club_name},
             ).all()
         return [
             MatchRow(
@@ -561,7 +1444,7 @@ class ViewsRepo:
                 FROM result r
                 JOIN team_member tm   ON tm.team_id = r.team_id
                 JOIN target_players tp ON tp.player_id = tm.player_id
-                WHERE r.match_id IN (SELECT match_id FROM club_match_ids)
+                JOIN club_match_ids cmi ON cmi.match_id = r.match_id
             ),
             opponents AS (                         -- players on the opposing team(s)
                 SELECT DISTINCT
@@ -599,18 +1482,175 @@ class ViewsRepo:
         return [OtherPlayerStats(**row) for row in result.mappings().all()]
 
 
+# Where the scripts keep the database, relative to the directory they are run from.
+# The database has a directory of its own so the API container can bind it, sharing
+# the -wal and -shm files with the scripts as well as the database.
+DB_PATH = os.getenv("DB_PATH", "data/data.db")
+
+# The pragmas set on every new connection, by profile, in the order they are set.
+# The busy timeout comes first so switching the journal mode waits for a lock. In
+# WAL mode readers never block on a writer, and with synchronous=NORMAL a commit is
+# not synced to disk: only checkpoints are, so a crash can lose the last commits but
+# never corrupts.
+PRAGMA_PROFILES: dict[str, dict[str, str | int]] = {
+    "default": {},
+    # API workers: a large cache and memory map over a database they never write
+    "reader": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,
+        "cache_size": -65536,
+        "temp_store": "MEMORY",
+        "query_only": "ON",
+    },
+    # Ingestion and rating runs: fewer, larger checkpoints and a patient lock wait
+    "ingest": {
+        "busy_timeout": 30000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,
+        "cache_size": -262144,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 10000,
+    },
+}
+
+_SWITCH = {"ON", "OFF", "TRUE", "FALSE", "YES", "NO", "0", "1"}
+# The pragmas that can be set, and the keywords each can be set to besides an
+# integer, None for an integer only. Anything else is refused before it reaches SQL.
+PRAGMA_VALUES: dict[str, set[str] | None] = {
+    "busy_timeout": None,
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "mmap_size": None,
+    "cache_size": None,
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+    "query_only": _SWITCH,
+    "wal_autocheckpoint": None,
+    "foreign_keys": _SWITCH,
+    "locking_mode": {"NORMAL", "EXCLUSIVE"},
+}
+
+
+def _checked_pragma(name: str, value: str | int) -> str | int:
+    """A pragma's value as it is set, raising a ValueError if it is not allowed"""
+    if name not in PRAGMA_VALUES:
+        raise ValueError(
+            f"Unknown pragma {name!r}, expected one of {', '.join(PRAGMA_VALUES)}"
+        )
+    keywords = PRAGMA_VALUES[name] or set()
+    text = str(value).strip()
+    if text.upper() in keywords:
+        return text.upper()
+    try:
+        return int(text)
+    except ValueError:
+        raise ValueError(f"Invalid value {value!r} for pragma {name!r}") from None
+
+
+def pragmas_for(
+    profile: str | None = None, overrides: Mapping[str, str | int] | None = None
+) -> dict[str, str | int]:
+    """
+    The pragmas to set on each connection.
+
+    Parameters
+    ----------
+    profile : str | None, optional
+        A key of ``PRAGMA_PROFILES``, by default the ``DB_PROFILE`` environment
+        variable or else "default"
+    overrides : Mapping[str, str | int] | None, optional
+        Pragmas to set over those of the profile. A pragma can also be set with an
+        environment variable of its name in capitals after ``DB_PRAGMA_``, such as
+        ``DB_PRAGMA_MMAP_SIZE``, which ``overrides`` takes precedence over.
+
+    Returns
+    -------
+    dict[str, str | int]
+        The value of each pragma, in the order to set them, ``busy_timeout`` first
+
+    Raises
+    ------
+    ValueError
+        If the profile is not known, or a pragma is not in ``PRAGMA_VALUES`` or is
+        given a value it does not take
+    """
+    profile = profile or os.getenv("DB_PROFILE") or "default"
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(
+            f"Unknown database profile {profile!r}, "
+            f"expected one of {', '.join(PRAGMA_PROFILES)}"
+        )
+    pragmas = dict(PRAGMA_PROFILES[profile])
+    for name, value in os.environ.items():
+        if name.startswith("DB_PRAGMA_"):
+            pragmas[name.removeprefix("DB_PRAGMA_").lower()] = value
+    pragmas.update(overrides or {})
+    if "busy_timeout" in pragmas:
+        pragmas = {"busy_timeout": pragmas.pop("busy_timeout"), **pragmas}
+    return {name: _checked_pragma(name, value) for name, value in pragmas.items()}
+
+
+def connect(
+    path: str,
+    echo: bool = False,
+    profile: str | None = None,
+    pragmas: Mapping[str, str | int] | None = None,
+) -> Engine:
+    """
+    The engine of a database file, holding its pool of connections.
+
+    Make one per process and share it: see :class:`Database`.
+
+    Parameters
+    ----------
+    path : str
+        Path to the database file.
+    echo : bool, optional
+        Output any performed queries into the log, by default False
+    profile : str | None, optional
+        The pragmas to set on each connection, see :func:`pragmas_for`
+    pragmas : Mapping[str, str | int] | None, optional
+        Pragmas to set over those of the profile
+    """
+    db_path = f"sqlite:///{path}"
+    settings = pragmas_for(profile, pragmas)
+    print(f"connecting to {db_path}")
+    engine = create_engine(db_path, echo=echo)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in settings.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return engine
+
+
 class Database:
     """
     The Database connection.
 
     A context manager that controls the querying and changing of records in the database.
 
+    Each ``with`` block is a unit of work on one session, borrowing a connection from
+    the engine's pool. Entering a database that is already entered reuses its
+    session, and only the outermost block closes it. A long-lived process, like the
+    API, makes the engine and session factory once and gives that factory to a
+    cheap ``Database`` per unit of work.
+
     Example Usage:
     ```python
         db = Database("__memory__", echo=False)
         with db:
             match_history = db.views.matches()
             db.commit()
+
+        session_factory = sessionmaker(connect("data.db"))
+        with Database(session_factory=session_factory) as db:
+            people = db.people.get_all()
     ```
 
     """
@@ -624,23 +1664,50 @@ class Database:
     people: PersonRepo
     rank_history: RankHistoryRepo
     matches: MatchRepo
-
-    def __init__(self, path: str, echo: bool = False):
+    watermarks: WatermarkRepo
+    current_ratings: CurrentRatingRepo
+    snapshots: RatingSnapshotRepo
+    packed_history: PackedHistoryRepo
+    undo_log: UndoLogRepo
+
+    def __init__(
+        self,
+        path: str | None = None,
+        echo: bool = False,
+        session_factory: sessionmaker | None = None,
+        profile: str | None = None,
+        pragmas: Mapping[str, str | int] | None = None,
+    ):
         """The Database
 
         Parameters
         ----------
-        path : str
-            Path to the database file.
+        path : str | None, optional
+            Path to the database file, used to make a new engine when no
+            ``session_factory`` is given
         echo : bool, optional
             Output any performed queries into the log, by default False
+        session_factory : sessionmaker | None, optional
+            A factory of sessions bound to an engine that is already shared, by
+            default a new one for ``path``
+        profile : str | None, optional
+            The pragmas of a new engine, a key of ``PRAGMA_PROFILES``, by default
+            the ``DB_PROFILE`` environment variable or else "default"
+        pragmas : Mapping[str, str | int] | None, optional
+            Pragmas of a new engine to set over those of the profile
         """
-        db_path = f"sqlite:///{path}"
-        print(f"connecting to {db_path}")
-        engine = create_engine(db_path, echo=echo)
-        self.session_factory = sessionmaker(engine)
+        if session_factory is None:
+            if path is None:
+                raise ValueError("Either a path or a session factory is needed")
+            engine = connect(path, echo=echo, profile=profile, pragmas=pragmas)
+            session_factory = sessionmaker(engine)
+        self.session_factory = session_factory
+        self._depth = 0
 
     def __enter__(self) -> Database:
+        self._depth += 1
+        if self._depth > 1:
+            return self
         self._session = self.session_factory()
         self.sessions = SessionRepo(self)
         self.clubs = ClubRepo(self)
@@ -650,10 +1717,17 @@ class Database:
         self.people = PersonRepo(self)
         self.rank_history = RankHistoryRepo(self)
         self.matches = MatchRepo(self)
+        self.watermarks = WatermarkRepo(self)
+        self.current_ratings = CurrentRatingRepo(self)
+        self.snapshots = RatingSnapshotRepo(self)
+        self.packed_history = PackedHistoryRepo(self)
+        self.undo_log = UndoLogRepo(self)
         return self
 
     def __exit__(self, *args, **kwargs):
-        self._session.close()
+        self._depth -= 1
+        if self._depth == 0:
+            self._session.close()
 
     def commit(self):
         """Save any performed changes in the database"""
@@ -664,6 +1738,9 @@ class Database:
         Undo any unsaved changes in the database.
         """
         self._session.rollback()
+        # The caches may hold rows that were never saved
+        for repo in (self.players, self.people, self.clubs, self.teams):
+            repo.forget()
 
     @property
     def session(self) -> DatabaseSession:
@@ -0,0 +1,60 @@
+"""
+The draw probability of ``ThurstoneMostellerFull.predict_draw`` for two pairs.
+
+Only arithmetic is used, so the same formula serves single matches with
+``math.erf`` and arrays of them with an element-wise ``erf``. This module does not
+need numpy, so the API can score courts without it.
+"""
+
+import math
+from functools import lru_cache
+from statistics import NormalDist
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+# The three ways of splitting a group of four players into two pairs, as positions in
+# the group: team one is the first two positions, team two the last two.
+SPLITS = ((0, 1, 2, 3), (0, 2, 1, 3), (0, 3, 1, 2))
+
+_SQRT2 = math.sqrt(2.0)
+
+
+@lru_cache(maxsize=None)
+def draw_margin(beta: float) -> float:
+    """The draw margin openskill's ``predict_draw`` uses for a match of four players"""
+    return math.sqrt(4) * beta * NormalDist().inv_cdf((1 + 1 / 4) / 2)
+
+
+def draw_probability(
+    team_one_mu: T,
+    team_one_sigma_squared: T,
+    team_two_mu: T,
+    team_two_sigma_squared: T,
+    beta: float,
+    erf: Callable[[T], T] = math.erf,
+) -> T:
+    """
+    Probability of a draw between pairs, as ``ThurstoneMostellerFull.predict_draw``.
+
+    Parameters
+    ----------
+    team_one_mu, team_two_mu : T
+        Sum of the mu of each team's players, floats or arrays
+    team_one_sigma_squared, team_two_sigma_squared : T
+        Sum of the squared sigma of each team's players
+    beta : float
+        The rating model's beta
+    erf : Callable[[T], T], optional
+        The error function to apply, by default ``math.erf`` for floats
+
+    Returns
+    -------
+    T
+        The draw probability of every match
+    """
+    margin = draw_margin(beta)
+    c = (2 * beta**2 + team_one_sigma_squared + team_two_sigma_squared) ** 0.5
+    upper = (margin - team_one_mu + team_two_mu) / c
+    lower = (team_two_mu - team_one_mu - margin) / c
+    return 0.5 * (erf(upper / _SQRT2) - erf(lower / _SQRT2))
@@ -0,0 +1,271 @@
+import math
+from statistics import NormalDist
+from typing import Iterator
+
+import draw_formula
+import numpy as np
+from draw_formula import draw_margin
+from special import erf
+
+# As positions in a group of four, see ``draw_formula.SPLITS``
+SPLITS = np.array(draw_formula.SPLITS)
+
+_SQRT2 = math.sqrt(2.0)
+
+
+def draw_probability(
+    team_one_mu: np.ndarray,
+    team_one_sigma_squared: np.ndarray,
+    team_two_mu: np.ndarray,
+    team_two_sigma_squared: np.ndarray,
+    beta: float,
+) -> np.ndarray:
+    """:func:`draw_formula.draw_probability` of arrays of matches"""
+    return draw_formula.draw_probability(
+        team_one_mu,
+        team_one_sigma_squared,
+        team_two_mu,
+        team_two_sigma_squared,
+        beta,
+        erf=erf,
+    )
+
+
+def groups(n: int, chunk_size: int = 1 << 16) -> Iterator[np.ndarray]:
+    """
+    Generate every group of four out of ``n`` players in chunks.
+
+    Groups are generated with their second player fixed, so each chunk is built from
+    one precomputed set of third/fourth player pairs.
+
+    Yields
+    ------
+    np.ndarray
+        ``(m, 4)`` array of ascending player indices
+    """
+    for second in range(1, n - 2):
+        third, fourth = np.triu_indices(n - second - 1, 1)
+        pairs = np.stack((third, fourth), axis=1).astype(np.int32) + second + 1
+        per_block = max(1, chunk_size // len(pairs))
+        for start in range(0, second, per_block):
+            firsts = np.arange(start, min(start + per_block, second), dtype=np.int32)
+            group = np.empty((len(firsts), len(pairs), 4), dtype=np.int32)
+            group[:, :, 0] = firsts[:, None]
+            group[:, :, 1] = second
+            group[:, :, 2:] = pairs
+            yield group.reshape(-1, 4)
+
+
+def draw_probabilities(
+    mu: np.ndarray,
+    sigma: np.ndarray,
+    beta: float = 25.0 / 6.0,
+    chunk_size: int = 1 << 16,
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """
+    Compute the draw probability of every possible match between the given players.
+
+    Nothing is built per match: each chunk is a block of groups of four and the
+    probability of each of the group's three possible splits.
+
+    Parameters
+    ----------
+    mu : np.ndarray
+        Mu of every player
+    sigma : np.ndarray
+        Sigma of every player
+    beta : float, optional
+        The rating model's beta, by default 25 / 6
+    chunk_size : int, optional
+        Approximate number of groups per chunk, by default 65536
+
+    Yields
+    ------
+    tuple[np.ndarray, np.ndarray]
+        ``(m, 4)`` array of player indices and ``(m, 3)`` array of the draw
+        probability of each split in :data:`SPLITS`
+    """
+    mu = np.asarray(mu, dtype=np.float64)
+    sigma_squared = np.asarray(sigma, dtype=np.float64) ** 2
+    for group in groups(len(mu), chunk_size):
+        teams = group[:, SPLITS]
+        team_mu = mu[teams[:, :, 0::2]] + mu[teams[:, :, 1::2]]
+        team_sigma_squared = (
+            sigma_squared[teams[:, :, 0::2]] + sigma_squared[teams[:, :, 1::2]]
+        )
+        yield group, draw_probability(
+            team_mu[:, :, 0],
+            team_sigma_squared[:, :, 0],
+            team_mu[:, :, 1],
+            team_sigma_squared[:, :, 1],
+            beta,
+        )
+
+
+def _spread_bound(spread: float, margin: float, c_low: float, c_high: float) -> float:
+    """
+    The highest draw probability of a match whose difference in team mu is at least
+    ``spread``, with ``c`` between ``c_low`` and ``c_high``.
+
+    The probability, ``Φ((margin - d) / c) - Φ((-margin - d) / c)``, falls as ``d``
+    grows, so the bound is at ``d = spread``. Within the margin it also falls as
+    ``c`` grows. Beyond the margin it peaks where ``1 / c`` is
+    ``sqrt(log((d + margin) / (d - margin)) / (2 d margin))``, and is taken there,
+    or at the end of the range of ``c`` nearest.
+    """
+    c = c_low
+    if spread > margin:
+        peak = math.sqrt(
+            2 * spread * margin / math.log((spread + margin) / (spread - margin))
+        )
+        c = min(max(peak, c_low), c_high)
+    upper = math.erf((margin - spread) / (c * _SQRT2))
+    lower = math.erf((-margin - spread) / (c * _SQRT2))
+    # Guard against rounding in the probabilities being compared with the bound
+    return 0.5 * (upper - lower) + 1e-12
+
+
+def _sigma_limit(probability: float, margin: float, beta: float) -> float:
+    """
+    The largest sum of four players' squared sigma that lets their match have a
+    draw probability above ``probability``.
+
+    However the mu fall, the probability is at most ``2Φ(margin / c) - 1``, that of
+    teams with the same mu.
+    """
+    if probability <= 0:
+        return math.inf
+    c = margin / NormalDist().inv_cdf((1 + probability) / 2)
+    # Guard against rounding in the probabilities being compared with the limit
+    return (c * c - 2 * beta**2) * (1 + 1e-9)
+
+
+def top_draw_probabilities(
+    mu: np.ndarray,
+    sigma: np.ndarray,
+    k: int,
+    beta: float = 25.0 / 6.0,
+    chunk_size: int = 1 << 20,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find the ``k`` possible matches with the highest draw probability.
+
+    A match is two disjoint pairs of players, so every pair is listed once, sorted
+    by the sum of its mu. The matches whose difference in team mu is at most a
+    spread are then the pairs of pairs within that spread of each other in the
+    sorted sums, found by binary search. The spread starts small and doubles,
+    evaluating only the matches it newly takes in, until the ``k`` best found beat
+    the bound of :func:`_spread_bound` on every match beyond it.
+
+    Sigma bounds the probability too: no match is more even than one between teams
+    of the same mu. Once ``k`` matches are found, that caps the players' summed
+    squared sigma, and matches over the cap are not evaluated. Pairs over it even
+    against the least uncertain pair are left out of later spreads altogether.
+
+    Parameters
+    ----------
+    mu : np.ndarray
+        Mu of every player
+    sigma : np.ndarray
+        Sigma of every player
+    k : int
+        Number of matches to find
+    beta : float, optional
+        The rating model's beta, by default 25 / 6
+    chunk_size : int, optional
+        Number of matches evaluated at a time, by default 1048576
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        ``(k, 4)`` array of the player indices of each match, team one followed by
+        team two, and the draw probability of each match, most even first
+    """
+    mu = np.asarray(mu, dtype=np.float64)
+    sigma = np.asarray(sigma, dtype=np.float64)
+    n = len(mu)
+    if k <= 0 or n < 4:
+        return np.empty((0, 4), dtype=np.int64), np.empty(0)
+
+    order = np.argsort(mu, kind="stable")
+    mu = mu[order]
+    sigma_squared = sigma[order] ** 2
+    margin = draw_margin(beta)
+    c_low = math.sqrt(2 * beta**2 + 4 * float(sigma_squared.min()))
+    c_high = math.sqrt(2 * beta**2 + 4 * float(sigma_squared.max()))
+
+    first, second = np.triu_indices(n, 1)
+    by_sum = np.argsort(mu[first] + mu[second], kind="stable")
+    first, second = first[by_sum], second[by_sum]
+    pair_mu = mu[first] + mu[second]
+    pair_sigma_squared = sigma_squared[first] + sigma_squared[second]
+    least_sigma_squared = float(pair_sigma_squared.min())
+
+    best = np.empty(0)
+    best_pairs = np.empty((0, 2), dtype=np.int64)
+    threshold = -math.inf
+    # The largest sum of the players' squared sigma a match may have to beat it
+    sigma_limit = math.inf
+    # Every pair has been matched with the pairs before ``low`` in the sorted sums
+    low = np.arange(1, len(pair_mu))
+    span = float(pair_mu[-1] - pair_mu[0])
+    # A sixteenth of a chunk of matches in the first spread, were sums even
+    spread = span * min(1.0, chunk_size / 16 / len(pair_mu) ** 2)
+    while True:
+        high = np.searchsorted(pair_mu, pair_mu[:-1] + spread, side="right")
+        able = pair_sigma_squared + least_sigma_squared <= sigma_limit
+        counts = np.where(able[:-1], high - low, 0)
+        totals = np.cumsum(counts)
+        splits = np.searchsorted(
+            totals, np.arange(chunk_size, int(totals[-1]), chunk_size), side="right"
+        )
+        for start, stop in zip([0, *splits.tolist()], [*splits.tolist(), len(counts)]):
+            chunk = counts[start:stop]
+            total = int(chunk.sum())
+            if total == 0:
+                continue
+            # Every pair of the chunk against each pair newly within the spread
+            one = np.repeat(np.arange(start, stop), chunk)
+            two = np.repeat(low[start:stop] - np.cumsum(chunk) + chunk, chunk)
+            two += np.arange(total)
+            one, two = one[able[two]], two[able[two]]
+            possible = (
+                (pair_sigma_squared[one] + pair_sigma_squared[two] <= sigma_limit)
+                & (first[one] != first[two])
+                & (first[one] != second[two])
+                & (second[one] != first[two])
+                & (second[one] != second[two])
+            )
+            one, two = one[possible], two[possible]
+            probability = draw_probability(
+                pair_mu[one],
+                pair_sigma_squared[one],
+                pair_mu[two],
+                pair_sigma_squared[two],
+                beta,
+            )
+            better = probability > threshold
+            best = np.concatenate((best, probability[better]))
+            best_pairs = np.concatenate(
+                (best_pairs, np.stack((one[better], two[better]), axis=1))
+            )
+            if len(best) >= k:
+                kept = np.argpartition(best, len(best) - k)[len(best) - k :]
+                best, best_pairs = best[kept], best_pairs[kept]
+                threshold = float(best.min())
+                sigma_limit = _sigma_limit(threshold, margin, beta)
+        low = np.maximum(low, high)
+        if spread >= span:
+            break
+        # Every match left has a larger difference than the spread
+        if len(best) == k and _spread_bound(spread, margin, c_low, c_high) <= threshold:
+            break
+        spread *= 2
+
+    # Team one holds the lowest player, and each team is in order of mu
+    one, two = best_pairs[:, 0], best_pairs[:, 1]
+    swap = first[two] < first[one]
+    one, two = np.where(swap, two, one), np.where(swap, one, two)
+    matches = np.stack((first[one], second[one], first[two], second[two]), axis=1)
+    ranked = np.lexsort((*matches.T[::-1], -best))
+    return order[matches[ranked]], best[ranked]
@@ -0,0 +1,290 @@
+import enum
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import combinations
+from typing import Sequence
+
+try:
+    from draw_formula import SPLITS, draw_probability
+except ModuleNotFoundError:
+    from .draw_formula import SPLITS, draw_probability
+
+DEFAULT_BETA = 25.0 / 6.0
+
+
+class Objective(enum.StrEnum):
+    TOTAL = "total"
+    MINIMUM = "minimum"
+
+
+@dataclass
+class CourtAssignment:
+    """
+    Players assigned to courts.
+
+    Attributes
+    ----------
+    courts : list[tuple[int, int, int, int]]
+        The players on each court as indices into the players given, team one
+        followed by team two
+    probabilities : list[float]
+        The draw probability of each court
+    resting : list[int]
+        Players not on a court
+    """
+
+    courts: list[tuple[int, int, int, int]] = field(default_factory=list)
+    probabilities: list[float] = field(default_factory=list)
+    resting: list[int] = field(default_factory=list)
+
+    @property
+    def total(self) -> float:
+        return sum(self.probabilities)
+
+    @property
+    def minimum(self) -> float:
+        return min(self.probabilities, default=0.0)
+
+
+class CourtScorer:
+    """
+    Draw probabilities of groups of four, as ``ThurstoneMostellerFull.predict_draw``.
+
+    Each group is scored by its best split and remembered, so moving a player only
+    costs the courts that changed.
+    """
+
+    def __init__(
+        self, mu: Sequence[float], sigma: Sequence[float], beta: float = DEFAULT_BETA
+    ):
+        self.mu = list(mu)
+        self.sigma_squared = [s * s for s in sigma]
+        self.beta = beta
+        self.best = lru_cache(maxsize=None)(self._best)
+
+    def update(self, player: int, mu: float, sigma: float):
+        """Change a player's rating, forgetting the groups scored with the old one"""
+        self.mu[player] = mu
+        self.sigma_squared[player] = sigma * sigma
+        self.best.cache_clear()
+
+    def draw_probability(self, team_one: Sequence[int], team_two: Sequence[int]):
+        mu = self.mu
+        sigma_squared = self.sigma_squared
+        return draw_probability(
+            mu[team_one[0]] + mu[team_one[1]],
+            sigma_squared[team_one[0]] + sigma_squared[team_one[1]],
+            mu[team_two[0]] + mu[team_two[1]],
+            sigma_squared[team_two[0]] + sigma_squared[team_two[1]],
+            self.beta,
+        )
+
+    def _best(
+        self, group: tuple[int, int, int, int]
+    ) -> tuple[float, tuple[int, int, int, int]]:
+        """The most even split of an ascending group of four and its probability"""
+        best = (-1.0, group)
+        for split in SPLITS:
+            court = tuple(group[position] for position in split)
+            probability = self.draw_probability(court[:2], court[2:])
+            if probability > best[0]:
+                best = (probability, court)
+        return best
+
+    def score(self, group: Sequence[int]) -> float:
+        return self.best(tuple(sorted(group)))[0]
+
+
+def _value(objective: Objective, scores: Sequence[float]) -> tuple[float, float]:
+    total = sum(scores)
+    if objective == Objective.MINIMUM:
+        return min(scores, default=0.0), total
+    return total, total
+
+
+def assign_courts(
+    mu: Sequence[float],
+    sigma: Sequence[float],
+    courts: int,
+    objective: Objective = Objective.TOTAL,
+    beta: float = DEFAULT_BETA,
+    exact_limit: int = 12,
+    time_limit: float = 0.05,
+    seed: int = 0,
+) -> CourtAssignment:
+    """
+    Put players on courts so the matches are as even as possible.
+
+    Small groups of players are searched exhaustively. Larger groups start from
+    players of similar mu grouped together and are improved by swapping players
+    between courts and the bench until no swap helps or time runs out.
+
+    Parameters
+    ----------
+    mu : Sequence[float]
+        Mu of every player available
+    sigma : Sequence[float]
+        Sigma of every player available
+    courts : int
+        Number of courts to fill
+    objective : Objective, optional
+        Maximise the total or the lowest draw probability of the courts, by default
+        the total
+    beta : float, optional
+        The rating model's beta, by default 25 / 6
+    exact_limit : int, optional
+        Largest number of players to search exhaustively, by default 12
+    time_limit : float, optional
+        Seconds the local search may run for, by default 0.05
+    seed : int, optional
+        Seed of the local search's random restarts, by default 0
+
+    Returns
+    -------
+    CourtAssignment
+        The best assignment found
+    """
+    objective = Objective(objective)
+    scorer = CourtScorer(mu, sigma, beta)
+    players = len(scorer.mu)
+    courts = max(0, min(courts, players // 4))
+    if courts == 0:
+        return CourtAssignment(resting=list(range(players)))
+    if players <= exact_limit:
+        groups = _exact(scorer, objective, players, courts)
+    else:
+        groups = _local_search(
+            scorer, objective, players, courts, time.perf_counter() + time_limit, seed
+        )
+
+    assignment = CourtAssignment()
+    playing = set()
+    for group in sorted(groups, key=lambda group: -scorer.score(group)):
+        probability, court = scorer.best(tuple(sorted(group)))
+        assignment.courts.append(court)
+        assignment.probabilities.append(probability)
+        playing.update(court)
+    assignment.resting = [player for player in range(players) if player not in playing]
+    return assignment
+
+
+def _exact(
+    scorer: CourtScorer, objective: Objective, players: int, courts: int
+) -> list[tuple[int, ...]]:
+    """Search every way of filling the courts, remembering solved sub-problems."""
+    everyone = (1 << players) - 1
+
+    @lru_cache(maxsize=None)
+    def solve(remaining: int, courts_left: int):
+        if courts_left == 0:
+            return (math.inf, 0.0) if objective == Objective.MINIMUM else (0.0, 0.0), ()
+        members = [player for player in range(players) if remaining >> player & 1]
+        if len(members) < 4 * courts_left:
+            return None
+        first, others = members[0], members[1:]
+        best = None
+        # The lowest player left either sits out or plays with three others
+        if len(members) > 4 * courts_left:
+            best = solve(remaining & ~(1 << first), courts_left)
+        for trio in combinations(others, 3):
+            group = (first, *trio)
+            rest = solve(
+                remaining & ~sum(1 << player for player in group), courts_left - 1
+            )
+            if rest is None:
+                continue
+            score = scorer.score(group)
+            (value, total), groups = rest
+            if objective == Objective.MINIMUM:
+                value = min(value, score)
+            else:
+                value += score
+            candidate = ((value, total + score), (group, *groups))
+            if best is None or candidate[0] > best[0]:
+                best = candidate
+        return best
+
+    result = solve(everyone, courts)
+    return list(result[1]) if result else []
+
+
+def _local_search(
+    scorer: CourtScorer,
+    objective: Objective,
+    players: int,
+    courts: int,
+    deadline: float,
+    seed: int,
+) -> list[tuple[int, ...]]:
+    """
+    Improve an assignment by swapping pairs of players until time runs out.
+
+    ``slots`` holds every player, four to a court followed by the bench, so a swap
+    between a court and the bench is the same move as one between two courts. Only
+    the scores of the courts involved in a swap are recomputed.
+    """
+    rng = random.Random(seed)
+    by_mu = sorted(range(players), key=lambda player: scorer.mu[player])
+    # Start from the courts of neighbouring mu that are most even
+    groups = sorted(
+        (tuple(by_mu[start : start + 4]) for start in range(0, players - 3, 4)),
+        key=lambda group: -scorer.score(group),
+    )[:courts]
+    chosen = {player for group in groups for player in group}
+    slots = [player for group in groups for player in group]
+    slots += [player for player in by_mu if player not in chosen]
+    seats = 4 * courts
+
+    def court_score(court: int) -> float:
+        return scorer.score(slots[4 * court : 4 * court + 4])
+
+    scores = [court_score(court) for court in range(courts)]
+    best_value = _value(objective, scores)
+    best_slots = list(slots)
+    while time.perf_counter() < deadline:
+        improved = _climb(slots, scores, court_score, objective, seats, deadline)
+        value = _value(objective, scores)
+        if value > best_value:
+            best_value = value
+            best_slots = list(slots)
+        elif not improved:
+            # Stuck: restart from the best assignment with a few random swaps
+            slots[:] = best_slots
+            for _ in range(2):
+                a = rng.randrange(seats)
+                b = rng.randrange(len(slots))
+                slots[a], slots[b] = slots[b], slots[a]
+            scores[:] = [court_score(court) for court in range(courts)]
+    return [tuple(best_slots[start : start + 4]) for start in range(0, seats, 4)]
+
+
+def _climb(slots, scores, court_score, objective, seats, deadline) -> bool:
+    """Make every improving swap in one pass, returning whether any was made."""
+    improved = False
+    current = _value(objective, scores)
+    for a in range(seats):
+        if time.perf_counter() >= deadline:
+            break
+        court_a = a // 4
+        # Swapping within a court changes nothing: the best split is always used
+        for b in range(4 * court_a + 4, len(slots)):
+            court_b = b // 4 if b < seats else None
+            slots[a], slots[b] = slots[b], slots[a]
+            old_a = scores[court_a]
+            scores[court_a] = court_score(court_a)
+            if court_b is not None:
+                old_b = scores[court_b]
+                scores[court_b] = court_score(court_b)
+            value = _value(objective, scores)
+            if value > current:
+                current = value
+                improved = True
+                continue
+            slots[a], slots[b] = slots[b], slots[a]
+            scores[court_a] = old_a
+            if court_b is not None:
+                scores[court_b] = old_b
+    return improved
@@ -0,0 +1,146 @@
+"""
+A person's rank history packed into columns of fixed size numbers.
+
+The layout, all little-endian, is a 12 byte header followed by the columns::
+
+    magic    4 bytes  b"RHP1"
+    count    uint32   number of entries, n
+    day      int32    date of the earliest entry, in days since 1970-01-01
+    mu       float32[n]
+    sigma    float32[n]
+    match_id uint32[n]
+    seconds  uint32[n]  start of the match, in seconds since midnight of ``day``
+    winner   uint8[n]
+
+Every column starts on a multiple of four bytes, so a client can read each one
+straight into a typed array without copying.
+"""
+
+import datetime
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Sequence
+
+MAGIC = b"RHP1"
+HEADER = struct.Struct("<4sIi")
+EPOCH = datetime.date(1970, 1, 1)
+
+# Type codes of the columns, in the order they are stored
+_COLUMNS = (("mu", "f"), ("sigma", "f"), ("match_id", "I"), ("seconds", "I"))
+
+
+@dataclass(slots=True)
+class HistoryEntry:
+    match_id: int
+    date: datetime.date
+    start_time: datetime.time
+    winner: bool
+    mu: float
+    sigma: float
+
+
+# Every history served starts from the default rating, on the day ratings began
+INITIAL_ENTRY = HistoryEntry(
+    match_id=0,
+    date=datetime.date(2025, 1, 1),
+    start_time=datetime.time(),
+    winner=False,
+    mu=25.0,
+    sigma=25 / 3,
+)
+
+
+def _seconds(time: datetime.time) -> int:
+    return time.hour * 3600 + time.minute * 60 + time.second
+
+
+def pack_history(entries: Sequence[HistoryEntry]) -> bytes:
+    """
+    Pack a rank history, in the order it is given.
+
+    Parameters
+    ----------
+    entries : Sequence[HistoryEntry]
+        The history, oldest first
+
+    Returns
+    -------
+    bytes
+        The packed history
+    """
+    # Not always the first entry: the initial one comes first whatever its date
+    first = min((entry.date for entry in entries), default=EPOCH)
+    columns = {
+        "mu": array("f", (entry.mu for entry in entries)),
+        "sigma": array("f", (entry.sigma for entry in entries)),
+        "match_id": array("I", (entry.match_id for entry in entries)),
+        "seconds": array(
+            "I",
+            (
+                (entry.date - first).days * 86400 + _seconds(entry.start_time)
+                for entry in entries
+            ),
+        ),
+    }
+    winner = array("B", (entry.winner for entry in entries))
+    if sys.byteorder == "big":
+        for column in columns.values():
+            column.byteswap()
+    parts = [HEADER.pack(MAGIC, len(entries), (first - EPOCH).days)]
+    parts.extend(columns[name].tobytes() for name, _ in _COLUMNS)
+    parts.append(winner.tobytes())
+    return b"".join(parts)
+
+
+def unpack_history(data: bytes) -> list[HistoryEntry]:
+    """
+    Unpack a rank history made by :func:`pack_history`.
+
+    Parameters
+    ----------
+    data : bytes
+        The packed history
+
+    Returns
+    -------
+    list[HistoryEntry]
+        The history, oldest first
+
+    Raises
+    ------
+    ValueError
+        If the data is not a packed rank history
+    """
+    magic, count, day = HEADER.unpack_from(data)
+    if magic != MAGIC or len(data) != HEADER.size + 17 * count:
+        raise ValueError("Not a packed rank history")
+    first = EPOCH + datetime.timedelta(days=day)
+    offset = HEADER.size
+    columns = {}
+    for name, code in _COLUMNS:
+        column = array(code)
+        column.frombytes(data[offset : offset + 4 * count])
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns[name] = column
+        offset += 4 * count
+    winner = data[offset:]
+
+    entries = []
+    for index in range(count):
+        start = datetime.datetime.combine(first, datetime.time()) + datetime.timedelta(
+            seconds=columns["seconds"][index]
+        )
+        entries.append(
+            HistoryEntry(
+                match_id=columns["match_id"][index],
+                date=start.date(),
+                start_time=start.time(),
+                winner=bool(winner[index]),
+                mu=columns["mu"][index],
+                sigma=columns["sigma"][index],
+            )
+        )
+    return entries
@@ -0,0 +1,410 @@
+import argparse
+from collections import Counter
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Mapping, Protocol, Sequence
+
+from as_of_index import AsOfIndex
+from database import DB_PATH, Club, Database, Lineup
+from ranking import COLUMNS, PartitionedModel
+from thurstone import ThurstoneMosteller2v2
+
+
+class RatingCache:
+    """
+    The current rating of every person, held in memory during a replay.
+
+    The cache is seeded once from the ``current_rating`` snapshot, so rating a match
+    never has to query the database, and remembers which people it changed so
+    only their snapshot rows are written back.
+    """
+
+    def __init__(self, db: Database, full: bool = False):
+        """
+        Parameters
+        ----------
+        db : Database
+            The database to seed the ratings from
+        full : bool, optional
+            Start everyone from the default rating instead, by default False
+        """
+        self.ratings: dict[int, tuple[float, float]] = (
+            {} if full else db.current_ratings.get_all()
+        )
+        self.changed: set[int] = set()
+
+    def get(self, person_id: int) -> tuple[float, float] | None:
+        return self.ratings.get(person_id)
+
+    def set(self, person_id: int, mu: float, sigma: float):
+        self.ratings[person_id] = (mu, sigma)
+        self.changed.add(person_id)
+
+    def changed_ratings(self) -> dict[int, tuple[float, float]]:
+        return {person_id: self.ratings[person_id] for person_id in self.changed}
+
+
+class RatedMatch:
+    """
+    A match and the ratings of the people in it after it, winners first.
+
+    ``before`` holds the rating each person went into the match with, or None if it
+    was their first, so the match can be undone.
+    """
+
+    __slots__ = ("club", "lineup", "mu", "sigma", "before")
+
+    def __init__(
+        self,
+        club: Club,
+        lineup: Lineup,
+        mu: Sequence[float],
+        sigma: Sequence[float],
+        before: Sequence[tuple[float, float] | None],
+    ):
+        self.club = club
+        self.lineup = lineup
+        self.mu = mu
+        self.sigma = sigma
+        self.before = before
+
+
+class Sink(Protocol):
+    """Somewhere rated matches are sent, in the order they were played"""
+
+    def consume(self, match: RatedMatch): ...
+
+    def close(self): ...
+
+
+class RatingEngine:
+    """
+    Rates a stream of matches from the cached ratings of the people in them.
+
+    Given an :class:`AsOfIndex`, every rating is also added to it as it is made, so
+    what anyone's rating was going into any match rated so far can be looked up.
+    """
+
+    def __init__(
+        self,
+        cache: RatingCache,
+        model: ThurstoneMosteller2v2 | None = None,
+        index: AsOfIndex | None = None,
+    ):
+        self.cache = cache
+        self.model = model or ThurstoneMosteller2v2()
+        self.index = index
+
+    def ratings_before(
+        self, person_ids: Iterable[int], match_id: int
+    ) -> dict[int, tuple[float, float]]:
+        """
+        The ratings of people going into a match, from the index.
+
+        Parameters
+        ----------
+        person_ids : Iterable[int]
+            Ids of the people
+        match_id : int
+            Id of the match
+
+        Returns
+        -------
+        dict[int, tuple[float, float]]
+            The mu and sigma of each person who had played before the match, by
+            person id
+
+        Raises
+        ------
+        ValueError
+            If the engine was made without an index
+        """
+        if self.index is None:
+            raise ValueError("The rating engine has no as-of index")
+        return self.index.before_many(person_ids, match_id)
+
+    def rate(
+        self, clubs: Mapping[int, Club], lineups: Iterable[Lineup]
+    ) -> Iterator[RatedMatch]:
+        model = self.model
+        default = (model.mu, model.sigma)
+        for lineup in lineups:
+            people = lineup.players
+            before = [self.cache.get(person) for person in people]
+            ratings = [rating or default for rating in before]
+            mu, sigma = model.rate(
+                [mu for mu, _ in ratings],
+                [sigma for _, sigma in ratings],
+                (lineup.winner_score, lineup.loser_score),
+            )
+            for person, person_mu, person_sigma in zip(people, mu, sigma):
+                self.cache.set(person, person_mu, person_sigma)
+                if self.index is not None:
+                    self.index.add(person, lineup.match_id, person_mu, person_sigma)
+            yield RatedMatch(clubs[lineup.club_id], lineup, mu, sigma, before)
+
+
+class RankHistorySink:
+    """
+    Writes the rank history and undo log, and once every match has been seen, the
+    watermark, the current ratings and the packed history of everyone rated.
+
+    A full replay starts by deleting the rank history, undo log and current
+    ratings, so no rating is left behind for a person who no longer played in a
+    match, such as when a player has been linked to a different person since the
+    last run.
+    """
+
+    def __init__(
+        self, db: Database, cache: RatingCache, full: bool, batch_size: int = 1000
+    ):
+        self.db = db
+        self.cache = cache
+        self.full = full
+        self.batch_size = batch_size
+        self.rows: list[dict[str, Any]] = []
+        self.undo: list[dict[str, Any]] = []
+        self.last: Lineup | None = None
+        if full:
+            db.rank_history.clear()
+            db.undo_log.clear()
+            db.current_ratings.clear()
+
+    def consume(self, match: RatedMatch):
+        lineup = match.lineup
+        for person, mu, sigma, before in zip(
+            lineup.players, match.mu, match.sigma, match.before
+        ):
+            self.rows.append(
+                {
+                    "person_id": person,
+                    "match_id": lineup.match_id,
+                    "mu": mu,
+                    "sigma": sigma,
+                }
+            )
+            self.undo.append(
+                {
+                    "person_id": person,
+                    "match_id": lineup.match_id,
+                    "mu": None if before is None else before[0],
+                    "sigma": None if before is None else before[1],
+                }
+            )
+        self.last = lineup
+        if len(self.rows) >= self.batch_size:
+            self._flush()
+
+    def close(self):
+        db = self.db
+        self._flush()
+        if self.last is not None:
+            db.watermarks.set(self.last.match_id)
+        db.current_ratings.bulk_upsert(self.cache.changed_ratings(), self.batch_size)
+        people = None if self.full else db.packed_history.stale(self.cache.changed)
+        db.packed_history.refresh(people, self.batch_size)
+
+    def _flush(self):
+        self.db.rank_history.bulk_upsert(self.rows, self.batch_size)
+        self.db.undo_log.bulk_upsert(self.undo, self.batch_size)
+        self.rows.clear()
+        self.undo.clear()
+
+
+class SnapshotSink:
+    """
+    Writes the ratings of a club's people at the end of every session rated.
+
+    The sessions of different clubs on the same day are rated interleaved, so one is
+    kept open for each club until the club's next session starts.
+    """
+
+    def __init__(self, db: Database, full: bool, batch_size: int = 1000):
+        self.db = db
+        self.full = full
+        self.batch_size = batch_size
+        # The session being rated at each club, by club id
+        self.sessions: dict[int, int] = {}
+        # The latest rating of each of a club's people, from its matches, by club id
+        self.latest: dict[int, dict[int, tuple[float, float]]] = {}
+
+    def consume(self, match: RatedMatch):
+        lineup = match.lineup
+        club_id = lineup.club_id
+        latest = self.latest.get(club_id)
+        if latest is None:
+            latest = self.latest[club_id] = (
+                {} if self.full else self.db.snapshots.get_latest(club_id)
+            )
+        elif lineup.session_id != self.sessions[club_id]:
+            self._write(club_id)
+        self.sessions[club_id] = lineup.session_id
+        for person, mu, sigma in zip(lineup.players, match.mu, match.sigma):
+            latest[person] = (mu, sigma)
+
+    def close(self):
+        for club_id in self.sessions:
+            self._write(club_id)
+
+    def _write(self, club_id: int):
+        self.db.snapshots.replace(
+            club_id, self.sessions[club_id], self.latest[club_id], self.batch_size
+        )
+
+
+class LeaderboardSink:
+    """
+    Writes the leaderboard of every club and match type partition to CSV.
+
+    The partitions are rated by a :class:`PartitionedModel`, fed in chunks as the
+    matches stream past, so it needs to see every match: use it with a full
+    replay. Every club's matches arrive together in the order played, which is the
+    order ``ranking.py`` rates ``matches.csv`` in, so the partitions of all clubs
+    agree with it. People are ranked under their name, as in ``matches.csv``.
+    """
+
+    def __init__(self, path: Path, workers: int = 1, chunk_size: int = 65536):
+        """
+        Parameters
+        ----------
+        path : Path
+            Directory to write ``{partition}.csv`` to
+        workers : int, optional
+            Number of processes used to rate the partitions, by default 1
+        chunk_size : int, optional
+            Number of matches passed to the model at a time, by default 65536
+        """
+        self.path = path
+        self.model = PartitionedModel(workers=workers)
+        self.chunk_size = chunk_size
+        self.columns: dict[str, list] = {
+            column: [] for column in ("club", "type_", *COLUMNS)
+        }
+
+    def consume(self, match: RatedMatch):
+        lineup = match.lineup
+        values = (
+            match.club.name,
+            lineup.type_.name,
+            *lineup.names,
+            lineup.winner_score,
+            lineup.loser_score,
+        )
+        for column, value in zip(self.columns.values(), values):
+            column.append(value)
+        if len(self.columns["club"]) >= self.chunk_size:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        for partition, results in self.model.results().items():
+            results.to_csv(self.path / f"{partition}.csv", index=False)
+
+    def _flush(self):
+        if self.columns["club"]:
+            self.model.update(self.columns)
+        self.columns = {column: [] for column in self.columns}
+
+
+def run(
+    db: Database,
+    cache: RatingCache,
+    sinks: Sequence[Sink],
+    full: bool = False,
+    yield_per: int = 1000,
+    index: AsOfIndex | None = None,
+):
+    """
+    Rate every match not yet rated, in one pass, sending each to every sink.
+
+    The matches of every club are streamed from the database together, in the order
+    played, starting after the watermark unless ``full``, and rated from the cached
+    ratings of the people in them. A person who plays at more than one club carries
+    one rating from match to match, whichever club they were played at. Players
+    without a person are first given one, so every rating is kept per person
+    however many player names they have played under.
+
+    Parameters
+    ----------
+    db : Database
+        The database to read the matches from, already entered
+    cache : RatingCache
+        The ratings to start from, updated as matches are rated
+    sinks : Sequence[Sink]
+        Where to send the rated matches
+    full : bool, optional
+        Ignore the watermark and rate every match again, by default False
+    yield_per : int, optional
+        Number of rows read from the database at a time, by default 1000
+    index : AsOfIndex | None, optional
+        An index to add every rating to, made by ``RankHistoryRepo.as_of_index``
+        after the matches were loaded, by default None
+    """
+    engine = RatingEngine(cache, index=index)
+    db.people.link_unassociated()
+    clubs = {club.id: club for club in db.clubs.all()}
+    watermark = None if full else db.watermarks.get()
+    counts: Counter[int] = Counter()
+    for match in engine.rate(clubs, db.matches.stream(None, watermark, yield_per)):
+        for sink in sinks:
+            sink.consume(match)
+        counts[match.club.id] += 1
+    for club in clubs.values():
+        print(f"Club: {club.name}, {counts[club.id]} new matches")
+    for sink in sinks:
+        sink.close()
+    return cache
+
+
+def main(full: bool = False, leaderboards: bool = False, workers: int = 1):
+    """
+    Rate the matches once, writing the rank history, rating snapshots and,
+    optionally, the leaderboards.
+
+    Parameters
+    ----------
+    full : bool, optional
+        Rate every match again instead of only those since the last run, by
+        default False
+    leaderboards : bool, optional
+        Also write the leaderboard CSVs to ``data/``, which needs every match, so
+        implies ``full``, by default False
+    workers : int, optional
+        Number of processes used to rate the leaderboard partitions, by default 1
+    """
+    full = full or leaderboards
+    db = Database(path=DB_PATH, echo=False, profile="ingest")
+    with db:
+        cache = RatingCache(db, full)
+        sinks: list[Sink] = [
+            RankHistorySink(db, cache, full),
+            SnapshotSink(db, full),
+        ]
+        if leaderboards:
+            data_path = Path(__file__).parent.parent / "data"
+            sinks.append(LeaderboardSink(data_path, workers))
+        run(db, cache, sinks, full)
+        db.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rate every match once and write everything derived from it"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="rate every match again instead of only those since the last run",
+    )
+    parser.add_argument(
+        "--leaderboards",
+        action="store_true",
+        help="also write the leaderboard of every club and match type to data/",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to rate the leaderboard partitions",
+    )
+    args = parser.parse_args()
+    main(full=args.full, leaderboards=args.leaderboards, workers=args.workers)
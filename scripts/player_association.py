@@ -1,16 +1,18 @@
 from csv import DictReader
 from pathlib import Path
 
-from database import Database
+from database import DB_PATH, Database
 
 
 def main():
-    database = Database("./data.db", echo=True)
+    database = Database(DB_PATH, echo=True, profile="ingest")
     data_path = Path(__file__).parent.parent / "data" / "player_person_map.csv"
 
     with open(data_path) as csvfile:
         reader = DictReader(csvfile)
         with database:
+            database.players.preload()
+            database.people.preload()
             for row in reader:
                 player_name = row["player_name"]
                 person_name = row["person"]
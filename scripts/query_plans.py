@@ -0,0 +1,351 @@
+"""
+Check that the views and the view and rank history queries use indexes.
+
+Every query made by ``ViewsRepo`` and ``RankHistoryRepo``, which between them read
+all three views, and the lookups by name and by team key that ingestion makes for
+every match, is recorded while running against a large synthetic database and
+then explained with ``EXPLAIN QUERY PLAN``. A query fails the check when its plan
+scans the whole of a large table, or builds an automatic index over one, unless
+that scan is expected of it in ``EXPECTED_SCANS``.
+
+Run from the root of the repository, it seeds a new database migrated to head::
+
+    python scripts/query_plans.py
+
+and exits with status 1 if any query fails.
+"""
+
+import argparse
+import datetime
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable
+
+from common import Type
+from database import Database, RankHistoryRepo, ViewsRepo
+from sqlalchemy import event
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Tables that grow with every match played
+LARGE_TABLES = {"match", "result", "team", "team_member", "player", "rank_history"}
+
+# The large tables some queries have to read in full, as they return or group
+# every row of them, by the full name of the query. Filtered by club, the matches
+# are found from the club, so that query has no entry.
+EXPECTED_SCANS: dict[str, set[str]] = {
+    "RankHistoryRepo.get_latest_before": {"rank_history"},
+    "RankHistoryRepo.as_of_index": {"rank_history"},
+    "ViewsRepo.matches": {"result"},
+}
+
+SQL_KEYWORDS = {
+    "as",
+    "cross",
+    "group",
+    "inner",
+    "join",
+    "left",
+    "limit",
+    "natural",
+    "on",
+    "order",
+    "outer",
+    "using",
+    "where",
+    "window",
+}
+TABLE_REFERENCE = re.compile(
+    r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?"?(\w+)"?)?', re.I
+)
+FULL_SCAN = re.compile(r"^(?:SCAN (\w+)|SEARCH (\w+) USING AUTOMATIC)")
+
+
+@dataclass
+class Plan:
+    name: str
+    statement: str
+    detail: list[str] = field(default_factory=list)
+    scans: set[str] = field(default_factory=set)
+
+    @property
+    def unexpected(self) -> set[str]:
+        return self.scans - EXPECTED_SCANS.get(self.name, set())
+
+
+def seed(
+    path: str,
+    clubs: int = 4,
+    people: int = 400,
+    sessions: int = 250,
+    matches_per_session: int = 20,
+    seed: int = 0,
+):
+    """
+    Migrate a new database to head and fill it with random matches.
+
+    Each person has one player, plus an alias for one in ten of them, and every
+    match is rated so each player has a rank history.
+
+    Parameters
+    ----------
+    path : str
+        Path of the database file to make
+    clubs : int, optional
+        Number of clubs, by default 4
+    people : int, optional
+        Number of people, shared between the clubs, by default 400
+    sessions : int, optional
+        Number of sessions at each club, by default 250
+    matches_per_session : int, optional
+        Number of matches in each session, by default 20
+    seed : int, optional
+        Seed of the random matches, by default 0
+    """
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(str(ROOT / "alembic.ini"))
+    config.set_main_option("script_location", str(ROOT / "alembic"))
+    config.set_main_option("prepend_sys_path", str(ROOT))
+    config.set_main_option("sqlalchemy.url", f"sqlite:///{path}")
+    command.upgrade(config, "head")
+
+    rng = random.Random(seed)
+    players = [(id_, f"player {id_}", id_) for id_ in range(1, people + 1)]
+    players += [
+        (people + id_, f"alias {id_}", id_)
+        for id_ in rng.sample(range(1, people + 1), people // 10)
+    ]
+    members = {
+        person: [id_ for id_, _, p in players if p == person]
+        for person in range(1, people + 1)
+    }
+    teams: dict[str, int] = {}
+    team_members = []
+    session_rows = []
+    match_rows = []
+    results = []
+    history = []
+    types = list(Type)
+    first_day = datetime.date(2020, 1, 1)
+    for club in range(1, clubs + 1):
+        for week in range(sessions):
+            session_id = len(session_rows) + 1
+            date = first_day + datetime.timedelta(weeks=week)
+            session_rows.append((session_id, date.isoformat(), club))
+            for index in range(matches_per_session):
+                match_id = len(match_rows) + 1
+                winner_score, loser_score = 21, rng.randrange(0, 20)
+                start = datetime.time(19, index % 60)
+                match_rows.append(
+                    (
+                        match_id,
+                        session_id,
+                        index,
+                        winner_score,
+                        loser_score,
+                        winner_score - loser_score,
+                        rng.randrange(300, 1200),
+                        rng.choice(types).name,
+                        start.isoformat(timespec="microseconds"),
+                        datetime.time(21).isoformat(timespec="microseconds"),
+                    )
+                )
+                four = rng.sample(range(1, people + 1), 4)
+                for won, pair in ((True, four[:2]), (False, four[2:])):
+                    player_ids = sorted(rng.choice(members[person]) for person in pair)
+                    key = ",".join(map(str, player_ids))
+                    team_id = teams.get(key)
+                    if team_id is None:
+                        team_id = teams[key] = len(teams) + 1
+                        team_members += [
+                            (player_id, team_id) for player_id in player_ids
+                        ]
+                    results.append((team_id, match_id, won))
+                history += [
+                    (person, match_id, rng.gauss(25, 3), rng.uniform(1, 8.3))
+                    for person in four
+                ]
+
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executemany(
+            "INSERT INTO club (id, name) VALUES (?, ?)",
+            [(club, f"club {club}") for club in range(1, clubs + 1)],
+        )
+        connection.executemany(
+            "INSERT INTO person (id, name) VALUES (?, ?)",
+            [(person, f"person {person}") for person in range(1, people + 1)],
+        )
+        connection.executemany(
+            "INSERT INTO player (id, name, person_id) VALUES (?, ?, ?)", players
+        )
+        connection.executemany(
+            'INSERT INTO "session" (id, date, club_id) VALUES (?, ?, ?)',
+            session_rows,
+        )
+        connection.executemany(
+            'INSERT INTO "match" (id, session_id, session_index, winner_score, '
+            "loser_score, margin, duration, type, start_time, end_time) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            match_rows,
+        )
+        connection.executemany(
+            "INSERT INTO team (id, key) VALUES (?, ?)",
+            [(team_id, key) for key, team_id in teams.items()],
+        )
+        connection.executemany(
+            "INSERT INTO team_member (player_id, team_id) VALUES (?, ?)",
+            team_members,
+        )
+        connection.executemany(
+            "INSERT INTO result (team_id, match_id, winner) VALUES (?, ?, ?)",
+            results,
+        )
+        connection.executemany(
+            "INSERT INTO rank_history (person_id, match_id, mu, sigma) "
+            "VALUES (?, ?, ?, ?)",
+            history,
+        )
+    connection.close()
+
+
+def queries(db: Database) -> list[tuple[str, Callable[[], Any]]]:
+    """Every query of ``ViewsRepo`` and ``RankHistoryRepo`` and lookup, by name"""
+    views = ViewsRepo(db)
+    ranks = RankHistoryRepo(db)
+    start = (datetime.date(2022, 6, 1), 5)
+    return [
+        (
+            "ViewsRepo.detailed_ranking_history",
+            lambda: views.detailed_ranking_history(7),
+        ),
+        ("ViewsRepo.player_stats", lambda: views.player_stats(7)),
+        ("ViewsRepo.matches", lambda: views.matches()),
+        ("ViewsRepo.matches(club_name)", lambda: views.matches("club 2")),
+        ("ViewsRepo.partner_stats", lambda: views.partner_stats(7, 1)),
+        ("ViewsRepo.opponent_stats", lambda: views.opponent_stats(7, 1)),
+        ("RankHistoryRepo.get_latest", lambda: ranks.get_latest(7)),
+        ("RankHistoryRepo.get_latest_before", lambda: ranks.get_latest_before(start)),
+        ("RankHistoryRepo.get_since", lambda: ranks.get_since(1, start)),
+        (
+            "RankHistoryRepo.get_latest_by_people",
+            lambda: ranks.get_latest_by_people([7, 8, 9, 10]),
+        ),
+        ("RankHistoryRepo.as_of_index", lambda: ranks.as_of_index()),
+        ("RankHistoryRepo.get_all", lambda: ranks.get_all(7)),
+        ("RankHistoryRepo.get", lambda: ranks.get(7, 1)),
+        ("RankHistoryRepo.new", lambda: ranks.new(7, 1, 25.0, 8.0)),
+        (
+            "RankHistoryRepo.add",
+            lambda: (ranks.add(8, 2, 25.0, 8.0), db.session.flush()),
+        ),
+        (
+            "RankHistoryRepo.bulk_upsert",
+            lambda: ranks.bulk_upsert(
+                [{"person_id": 7, "match_id": 1, "mu": 25.0, "sigma": 8.0}]
+            ),
+        ),
+        ("RankHistoryRepo.delete", lambda: ranks.delete(7, 1)),
+        ("RankHistoryRepo.delete_matches", lambda: ranks.delete_matches([1, 2, 3])),
+        ("RankHistoryRepo.clear", lambda: ranks.clear()),
+        ("PlayerRepo.get", lambda: db.players.get("player 7")),
+        ("PersonRepo.get", lambda: db.people.get("person 7")),
+        ("ClubRepo.get", lambda: db.clubs.get("club 2")),
+        (
+            "TeamRepo.get",
+            lambda: db.teams.get([db.players.get_by_id(7), db.players.get_by_id(8)]),
+        ),
+    ]
+
+
+def tables_by_alias(statement: str, connection: sqlite3.Connection) -> dict[str, str]:
+    """The table each name in a statement, or in the views it reads, refers to"""
+    views = dict(
+        connection.execute("SELECT name, sql FROM sqlite_master WHERE type = 'view'")
+    )
+    sources = [statement] + [
+        sql for name, sql in views.items() if re.search(rf"\b{name}\b", statement)
+    ]
+    tables = {}
+    for source in sources:
+        for table, alias in TABLE_REFERENCE.findall(source):
+            tables.setdefault(table.lower(), table.lower())
+            if alias and alias.lower() not in SQL_KEYWORDS:
+                tables.setdefault(alias.lower(), table.lower())
+    return tables
+
+
+def explain(path: str) -> list[Plan]:
+    """Run every query against the database and explain the statements they made"""
+    db = Database(path)
+    recorded: list[tuple[str, str, Any]] = []
+    current = [""]
+
+    @event.listens_for(db.session_factory.kw["bind"], "before_cursor_execute")
+    def record(_connection, _cursor, statement, parameters, _context, executemany):
+        if executemany:
+            parameters = parameters[0]
+        recorded.append((current[0], statement, parameters))
+
+    with db:
+        for name, query in queries(db):
+            current[0] = name
+            query()
+        db.session.rollback()
+
+    connection = sqlite3.connect(path)
+    plans = []
+    for name, statement, parameters in recorded:
+        if statement.lstrip().upper().startswith(("SAVEPOINT", "RELEASE", "ROLLBACK")):
+            continue
+        plan = Plan(name, statement)
+        tables = tables_by_alias(statement, connection)
+        for row in connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters):
+            detail = row[-1]
+            plan.detail.append(detail)
+            match = FULL_SCAN.match(detail)
+            if match is None:
+                continue
+            table = tables.get((match[1] or match[2]).lower())
+            if table in LARGE_TABLES:
+                plan.scans.add(table)
+        plans.append(plan)
+    connection.close()
+    return plans
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the plans of the queries")
+    parser.add_argument(
+        "--database",
+        help="check this database, already migrated to head, instead of seeding one",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="print the plan of every query"
+    )
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.database
+        if path is None:
+            path = str(Path(directory) / "query_plans.db")
+            seed(path)
+        plans = explain(path)
+
+    failures = 0
+    for plan in plans:
+        if plan.unexpected:
+            failures += 1
+            print(f"FAIL {plan.name}: scans {', '.join(sorted(plan.unexpected))}")
+        elif args.verbose:
+            print(f"ok   {plan.name}")
+        if plan.unexpected or args.verbose:
+            print("\n".join(f"    {detail}" for detail in plan.detail))
+    print(f"{len(plans) - failures} of {len(plans)} statements use their indexes")
+    sys.exit(1 if failures else 0)
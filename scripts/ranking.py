@@ -1,37 +1,110 @@
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
-from itertools import combinations
+from itertools import batched
 from pathlib import Path
+from typing import Iterable, Iterator, Mapping
 
+import numpy as np
 import pandas as pd
+from numpy.typing import ArrayLike
 from openskill.models import ThurstoneMostellerFull, ThurstoneMostellerFullRating
 from tqdm import tqdm
-from common import Type
+from common import MatchRow, Type
+from draws import SPLITS, draw_probabilities, top_draw_probabilities
+from rating_store import RatingStore
+from thurstone import ThurstoneMosteller2v2
+from waves import split_waves, wave_numbers
 
 MIN_MU = 10
 MAX_SIGMA = 8
 
+PLAYER_COLUMNS = ("winner_a", "winner_b", "loser_a", "loser_b")
+SCORE_COLUMNS = ("winner_score", "loser_score")
+COLUMNS = PLAYER_COLUMNS + SCORE_COLUMNS
+
+# Waves with fewer matches than this are cheaper to rate one match at a time
+BATCH_SIZE = 32
+
 
 class Player:
-    def __init__(
-        self,
-        rating: ThurstoneMostellerFullRating,
-        wins: int = 0,
-        game: int = 0,
-        avg_win_margin: float = 0,
-        avg_loss_margin: float = 0,
-    ):
-        self.rating = rating
-        self.wins = wins
-        self.games = game
-        self.avg_win_margin = avg_win_margin
-        self.avg_loss_margin = avg_loss_margin
-        self.wins_with: dict[str, int] = {}
-        self.loses_with: dict[str, int] = {}
-        self.loses_against: dict[str, int] = {}
+    """A lightweight view of one player's entry in a :class:`RatingStore`."""
+
+    __slots__ = ("store", "id")
+
+    def __init__(self, store: RatingStore, id_: int):
+        self.store = store
+        self.id = id_
 
     @property
     def name(self) -> str:
-        return self.rating.name
+        return self.store.names[self.id]
+
+    @property
+    def mu(self) -> float:
+        return float(self.store.mu[self.id])
+
+    @property
+    def sigma(self) -> float:
+        return float(self.store.sigma[self.id])
+
+    @property
+    def rating(self) -> ThurstoneMostellerFullRating:
+        return ThurstoneMostellerFullRating(
+            mu=self.mu, sigma=self.sigma, name=self.name
+        )
+
+    @rating.setter
+    def rating(self, rating: ThurstoneMostellerFullRating):
+        self.store.mu[self.id] = rating.mu
+        self.store.sigma[self.id] = rating.sigma
+
+    @property
+    def wins(self) -> int:
+        return int(self.store.wins[self.id])
+
+    @wins.setter
+    def wins(self, value: int):
+        self.store.wins[self.id] = value
+
+    @property
+    def games(self) -> int:
+        return int(self.store.games[self.id])
+
+    @games.setter
+    def games(self, value: int):
+        self.store.games[self.id] = value
+
+    @property
+    def avg_win_margin(self) -> float:
+        wins = self.wins
+        return float(self.store.win_margin[self.id] / wins) if wins else 0.0
+
+    @property
+    def avg_loss_margin(self) -> float:
+        losses = self.games - self.wins
+        return float(self.store.loss_margin[self.id] / losses) if losses else 0.0
+
+    @property
+    def wins_with(self) -> dict[str, int]:
+        return self._totals(self.store.won_with)
+
+    @property
+    def loses_with(self) -> dict[str, int]:
+        return self._totals(self.store.lost_with)
+
+    @property
+    def loses_against(self) -> dict[str, int]:
+        return self._totals(self.store.lost_against)
+
+    def _totals(self, counter: Counter[tuple[int, int]]) -> dict[str, int]:
+        names = self.store.names
+        return {
+            names[other]: total
+            for (player, other), total in counter.items()
+            if player == self.id
+        }
 
     def win_rate(self) -> float:
         return self.wins / self.games
@@ -52,52 +125,38 @@ class Player:
         return self.name < other.name
 
     def won_with(self, name: str):
-        player_total = self.wins_with.get(name)
-        if player_total is None:
-            player_total = 0
-        player_total = player_total + 1
-        self.wins_with[name] = player_total
+        self.store.count(self.store.won_with, [(self.id, self.store.id_of(name))])
 
     def lost_with(self, name: str):
-        player_total = self.loses_with.get(name)
-        if player_total is None:
-            player_total = 0
-        player_total = player_total + 1
-        self.loses_with[name] = player_total
+        self.store.count(self.store.lost_with, [(self.id, self.store.id_of(name))])
 
     def wins_with_most(self) -> str:
-        best_player = ""
-        best_total = 0
-        for player, total in self.wins_with.items():
-            if total > best_total:
-                best_total = total
-                best_player = player
-        return best_player
+        return self.store.most_frequent(self.store.won_with)[self.id]
 
     def lost_with_most(self) -> str:
-        worst_player = ""
-        biggest_loss = 0
-        for player, total in self.loses_with.items():
-            if total > biggest_loss:
-                biggest_loss = total
-                worst_player = player
-        return worst_player
+        return self.store.most_frequent(self.store.lost_with)[self.id]
 
     def lost_against(self, name: str):
-        player_total = self.loses_against.get(name)
-        if player_total is None:
-            player_total = 0
-        player_total = player_total + 1
-        self.loses_against[name] = player_total
+        self.store.count(self.store.lost_against, [(self.id, self.store.id_of(name))])
 
     def lost_against_most(self) -> str:
-        nemesis = ""
-        total_games = 0
-        for player, total in self.loses_against.items():
-            if total > total_games:
-                total_games = total
-                nemesis = player
-        return nemesis
+        return self.store.most_frequent(self.store.lost_against)[self.id]
+
+
+class Players(Mapping[str, Player]):
+    """Name to :class:`Player` view mapping over every player in a store."""
+
+    def __init__(self, store: RatingStore):
+        self.store = store
+
+    def __getitem__(self, name: str) -> Player:
+        return Player(self.store, self.store.ids[name])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.store.names)
+
+    def __len__(self) -> int:
+        return len(self.store)
 
 
 class Team:
@@ -145,47 +204,70 @@ class Match:
         ]
 
 
+@dataclass
+class MatchFilters:
+    """
+    Restrictions on the players considered when searching for matches.
+
+    Attributes
+    ----------
+    players : Iterable[str] | None
+        Only consider these players, e.g. those present at a session
+    min_games : int
+        Only consider players who have played at least this many games
+    max_sigma : float | None
+        Only consider players whose rating is at least this certain
+    """
+
+    players: Iterable[str] | None = None
+    min_games: int = 0
+    max_sigma: float | None = None
+
+
 class Model:
-    def __init__(self, name: str | None = None):
-        self.players: dict[str, Player] = {}
+    def __init__(
+        self,
+        name: str | None = None,
+        store: RatingStore | None = None,
+        progress: bool = True,
+    ):
         self.model = ThurstoneMostellerFull()
+        self.kernel = ThurstoneMosteller2v2(
+            mu=self.model.mu,
+            sigma=self.model.sigma,
+            beta=self.model.beta,
+            kappa=self.model.kappa,
+            epsilon=self.model.epsilon,
+            tau=self.model.tau,
+        )
+        self.store = (
+            store
+            if store is not None
+            else RatingStore(mu=self.model.mu, sigma=self.model.sigma)
+        )
+        self.players = Players(self.store)
         self.name = name if name is not None else ""
+        self.progress = progress
 
     def get_rating(self, name: str) -> ThurstoneMostellerFullRating:
-        if name not in self.players:
-            player = Player(self.model.rating(name=name))
-            self.players[name] = player
-        return self.players[name].rating
+        return self.get_player(name).rating
 
     def set_rating(self, name: str, rating: ThurstoneMostellerFullRating):
         player = self.players[name]
         player.rating = rating
 
     def get_player(self, name: str) -> Player:
-        if name not in self.players:
-            player = Player(self.model.rating(name=name))
-            self.players[name] = player
-        return self.players[name]
-
-    def set_player(self, player: Player):
-        self.players[player.name] = player
+        return Player(self.store, self.store.id_of(name))
 
     def update_rankings(
         self, winners: list[Player], losers: list[Player], scores: tuple[float, float]
     ):
-        winner_ratings = [winner.rating for winner in winners]
-        losers_ratings = [loser.rating for loser in losers]
-
-        # Update Ratings
-        [new_winners, new_losers] = self.model.rate(
-            teams=[winner_ratings, losers_ratings],
-            scores=list(scores),
+        ids = [player.id for player in (*winners, *losers)]
+        mu, sigma = self.kernel.rate(
+            self.store.mu[ids].tolist(), self.store.sigma[ids].tolist(), scores
         )
-
-        players = [*new_winners, *new_losers]
-
-        for player in players:
-            self.set_rating(player.name, player)
+        self.store.mu[ids] = mu
+        self.store.sigma[ids] = sigma
 
     def update_stats(
         self, winners: list[Player], losers: list[Player], scores: tuple[float, float]
@@ -197,64 +279,169 @@ class Model:
         losers[0].lost_with(losers[1].name)
         losers[1].lost_with(losers[0].name)
 
+        store = self.store
         margin = scores[0] - scores[1]
         for winner in winners:
             for loser in losers:
                 loser.lost_against(winner.name)
 
-            winner.games = winner.games + 1
-            winner.wins = winner.wins + 1
-
-            old_wins = winner.wins - 1 if winner.wins > 0 else winner.wins
-            old_average = winner.avg_win_margin * old_wins
-
-            winner.avg_win_margin = (old_average + margin) / winner.wins
-            self.set_player(winner)
+            store.games[winner.id] += 1
+            store.wins[winner.id] += 1
+            store.win_margin[winner.id] += margin
 
         for loser in losers:
-            loser.games = loser.games + 1
-            losses = loser.games - loser.wins
-            old_losses = losses - 1 if losses > 0 else losses
-            old_average_loss = loser.avg_loss_margin * old_losses
-
-            loser.avg_loss_margin = (old_average_loss + margin) / losses
-            self.set_player(loser)
-
-    def update(self, data: pd.DataFrame):
-        for _, row in tqdm(data.iterrows(), desc=f"{self.name} ranking update"):
-            winners = [
-                self.get_player(row["winner_a"]),
-                self.get_player(row["winner_b"]),
-            ]
-            losers = [self.get_player(row["loser_a"]), self.get_player(row["loser_b"])]
-
-            # Get scores
-            winner_score = float(row["winner_score"])
-            loser_score = float(row["loser_score"])
-            scores = (winner_score, loser_score)
-
-            self.update_stats(winners, losers, scores)
-            self.update_rankings(winners, losers, scores)
+            store.games[loser.id] += 1
+            store.loss_margin[loser.id] += margin
+
+    def update(
+        self,
+        data: pd.DataFrame | Mapping[str, ArrayLike] | Iterable[MatchRow],
+        chunk_size: int = 65536,
+    ):
+        """
+        Rate matches in the order they were played.
+
+        Parameters
+        ----------
+        data : pd.DataFrame | Mapping[str, ArrayLike] | Iterable[MatchRow]
+            The matches, as a DataFrame, a mapping of column name to column values
+            or an iterable of rows. Only the player name and score columns are read.
+        chunk_size : int, optional
+            Number of rows read from an iterable at a time, by default 65536
+        """
+        if isinstance(data, (pd.DataFrame, Mapping)):
+            self.update_columns(data)
+            return
+        for rows in batched(data, chunk_size):
+            self.update_columns(
+                {column: [getattr(row, column) for row in rows] for column in COLUMNS}
+            )
+
+    def update_columns(self, columns: pd.DataFrame | Mapping[str, ArrayLike]):
+        codes, names = _factorize_players(columns)
+        self.update_codes(codes, names, _scores(columns))
+
+    def update_codes(self, codes: np.ndarray, names: np.ndarray, scores: np.ndarray):
+        """
+        Rate matches whose players have already been factorised.
+
+        Parameters
+        ----------
+        codes : np.ndarray
+            ``(n, 4)`` array of indices into ``names``, the two winners followed by
+            the two losers
+        names : np.ndarray
+            Player names
+        scores : np.ndarray
+            ``(n, 2)`` array of the winning and losing scores
+        """
+        codes, names = _localise(codes, names)
+        # Look every distinct name up once, in the order they first appear
+        self.rate_matches(self.store.ids_of(names)[codes], scores)
+
+    def rate_matches(self, players: np.ndarray, scores: np.ndarray):
+        """
+        Rate matches in the order they were played.
+
+        The matches are grouped into waves of matches with no players in common.
+        Waves of at least :data:`BATCH_SIZE` matches are rated as one batch, which
+        agrees with rating their matches one at a time to within rounding.
+
+        Parameters
+        ----------
+        players : np.ndarray
+            ``(n, 4)`` array of player ids, the two winners followed by the two
+            losers
+        scores : np.ndarray
+            ``(n, 2)`` array of the winning and losing scores
+        """
+        self.record_stats(players, scores)
+
+        waves = wave_numbers(players)
+        if len(waves) == 0 or np.bincount(waves).max() < BATCH_SIZE:
+            # Nothing to batch: save splitting the matches up
+            self._rate_in_order(
+                tqdm(
+                    zip(players, scores.tolist()),
+                    total=len(players),
+                    desc=f"{self.name} ranking update",
+                    disable=not self.progress,
+                )
+            )
+            return
+        store = self.store
+        for wave in tqdm(
+            split_waves(waves),
+            desc=f"{self.name} ranking update",
+            disable=not self.progress,
+        ):
+            if len(wave) >= BATCH_SIZE:
+                ids = players[wave]
+                store.mu[ids], store.sigma[ids] = self.kernel.rate_batch(
+                    store.mu[ids], store.sigma[ids], scores[wave]
+                )
+            else:
+                self._rate_in_order(zip(players[wave], scores[wave].tolist()))
+
+    def _rate_in_order(self, matches: Iterable[tuple[np.ndarray, list[float]]]):
+        store = self.store
+        for ids, score in matches:
+            mu, sigma = self.kernel.rate(
+                store.mu[ids].tolist(), store.sigma[ids].tolist(), score
+            )
+            store.mu[ids] = mu
+            store.sigma[ids] = sigma
+
+    def record_stats(self, players: np.ndarray, scores: np.ndarray):
+        """Vectorised equivalent of :meth:`update_stats` for many matches"""
+        store = self.store
+        winners = players[:, :2]
+        margin = scores[:, 0] - scores[:, 1]
+
+        np.add.at(store.games, players, 1)
+        np.add.at(store.wins, winners, 1)
+        np.add.at(store.win_margin, winners, margin[:, None])
+        np.add.at(store.loss_margin, players[:, 2:], margin[:, None])
+
+        # Pairs are counted in the same order update_stats would see them
+        store.count(
+            store.won_with,
+            map(tuple, players[:, [0, 1, 1, 0]].reshape(-1, 2).tolist()),
+        )
+        store.count(
+            store.lost_with,
+            map(tuple, players[:, [2, 3, 3, 2]].reshape(-1, 2).tolist()),
+        )
+        store.count(
+            store.lost_against,
+            map(tuple, players[:, [2, 0, 3, 0, 2, 1, 3, 1]].reshape(-1, 2).tolist()),
+        )
 
     def results(self) -> pd.DataFrame:
+        store = self.store
+        played = store.games > 0
+        wins = store.wins
+        losses = store.games - wins
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg_win_margin = np.where(wins > 0, store.win_margin / wins, 0.0)
+            avg_loss_margin = np.where(losses > 0, store.loss_margin / losses, 0.0)
         return pd.DataFrame(
-            [
-                {
-                    "Player": name,
-                    "Mu": player.rating.mu,
-                    "Sigma": player.rating.sigma,
-                    "Ordinal": player.rating.ordinal(),
-                    "Wins": player.wins,
-                    "Total Games": player.games,
-                    "Win/Loss": player.win_rate(),
-                    "Average Win Margin": player.avg_win_margin,
-                    "Average Loss Margin": player.avg_loss_margin,
-                    "Player won with most": player.wins_with_most(),
-                    "Player lost with most": player.lost_with_most(),
-                    "Players beaten by most": player.lost_against_most(),
-                }
-                for name, player in self.players.items()
-            ]
+            {
+                "Player": np.array(store.names, dtype=object)[played],
+                "Mu": store.mu[played],
+                "Sigma": store.sigma[played],
+                "Ordinal": store.ordinal()[played],
+                "Wins": wins[played],
+                "Total Games": store.games[played],
+                "Win/Loss": wins[played] / store.games[played],
+                "Average Win Margin": avg_win_margin[played],
+                "Average Loss Margin": avg_loss_margin[played],
+                "Player won with most": store.most_frequent(store.won_with)[played],
+                "Player lost with most": store.most_frequent(store.lost_with)[played],
+                "Players beaten by most": store.most_frequent(store.lost_against)[
+                    played
+                ],
+            }
         ).sort_values(by=["Ordinal"], ascending=False)
 
     def predict_draw(self, match: Match) -> float:
@@ -264,47 +451,250 @@ class Model:
         ]
         return self.model.predict_draw(teams=teams)
 
-    def predict_draws(self) -> dict[Match, float]:
-        players = self.players.items()
-
-        unique_matches = set()
-        unique_groups = set()
-
-        for group in tqdm(
-            combinations(players, 4), desc=f"{self.name} draw predictions"
+    def predict_draws(
+        self, chunk_size: int = 1 << 16
+    ) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+        """
+        Predict the chance of a draw for every possible match between the players.
+
+        There are O(n⁴) matches, so they are produced a chunk at a time for the
+        caller to reduce as they arrive.
+
+        Parameters
+        ----------
+        chunk_size : int, optional
+            Approximate number of groups of four per chunk, by default 65536
+
+        Yields
+        ------
+        tuple[np.ndarray, np.ndarray]
+            ``(m, 4)`` array of the player ids of each match, team one followed by
+            team two, and the draw probability of each match
+        """
+        for group, probability in tqdm(
+            draw_probabilities(
+                self.store.mu, self.store.sigma, self.model.beta, chunk_size
+            ),
+            desc=f"{self.name} draw predictions",
+            disable=not self.progress,
         ):
-            group = tuple(sorted(group))
-            if group in unique_groups:
-                continue
-            unique_groups.add(group)
-            for team1 in combinations(group, 2):
-                team2 = tuple(sorted(set(group) - set(team1)))
-                match_ = Match(
-                    Team(team1[0][1], team1[1][1]), Team(team2[0][1], team2[1][1])
-                )
-                unique_matches.add(match_)
+            yield group[:, SPLITS].reshape(-1, 4), probability.ravel()
+
+    def top_balanced_matches(
+        self, k: int = 10, filters: MatchFilters | None = None
+    ) -> pd.DataFrame:
+        """
+        Find the matches most likely to end in a draw, without building every match.
+
+        Parameters
+        ----------
+        k : int, optional
+            Number of matches to return, by default 10
+        filters : MatchFilters | None, optional
+            Restrictions on the players to match up, by default every player
+
+        Returns
+        -------
+        pd.DataFrame
+            The ``k`` most even matches, in the format of :meth:`predict_draws_df`
+        """
+        filters = filters or MatchFilters()
+        store = self.store
+        keep = store.games >= filters.min_games
+        if filters.max_sigma is not None:
+            keep &= store.sigma <= filters.max_sigma
+        if filters.players is not None:
+            chosen = [store.ids[name] for name in filters.players if name in store]
+            keep &= np.isin(np.arange(len(store)), chosen)
+        ids = np.flatnonzero(keep)
+        matches, probabilities = top_draw_probabilities(
+            store.mu[ids], store.sigma[ids], k, self.model.beta
+        )
+        return self._draws_df(ids[matches], probabilities)
 
-        results: dict[Match, float] = {}
+    def predict_draws_df(self) -> pd.DataFrame:
+        # Every match is wanted here, so the chunks are joined
+        chunks = list(self.predict_draws())
+        if chunks:
+            matches = np.concatenate([matches for matches, _ in chunks])
+            probabilities = np.concatenate([chunk for _, chunk in chunks])
+        else:
+            matches, probabilities = np.empty((0, 4), dtype=np.int32), np.empty(0)
+        return self._draws_df(matches, probabilities).sort_values(
+            by="Draw Probability", ascending=False
+        )
 
-        for match in unique_matches:
-            results[match] = self.predict_draw(match)
+    def _draws_df(self, matches: np.ndarray, probabilities: np.ndarray) -> pd.DataFrame:
+        names = np.array(self.store.names, dtype=object)
+        return pd.DataFrame(
+            {
+                "Player 1": names[matches[:, 0]],
+                "Player 2:": names[matches[:, 1]],
+                "Player 3:": names[matches[:, 2]],
+                "Player 4:": names[matches[:, 3]],
+                "Draw Probability": probabilities,
+            }
+        )
 
-        return results
 
-    def predict_draws_df(self) -> pd.DataFrame:
-        draws = self.predict_draws()
-        return pd.DataFrame(
-            [
-                {
-                    "Player 1": match.team_one.players[0],
-                    "Player 2:": match.team_one.players[1],
-                    "Player 3:": match.team_two.players[0],
-                    "Player 4:": match.team_two.players[1],
-                    "Draw Probability": score,
-                }
-                for match, score in tqdm(draws.items())
-            ]
-        ).sort_values(by="Draw Probability", ascending=False)
+class PartitionedModel:
+    """
+    Rates matches into every leaderboard partition they belong to.
+
+    Each match is rated by a separate :class:`Model` for its club and type, its
+    club overall, all clubs for its type and all clubs overall. The match data is
+    scanned once: player names are factorised together, and every partition rates
+    its own rows of the shared arrays.
+
+    Partitions are independent of each other, so with more than one worker they
+    are rated in parallel processes, largest first. The results are the same
+    whatever the number of workers.
+    """
+
+    def __init__(self, workers: int = 1):
+        self.models: dict[str, Model] = {}
+        self.workers = workers
+
+    def update(self, data: pd.DataFrame | Mapping[str, ArrayLike]):
+        codes, names = _factorize_players(data)
+        scores = _scores(data)
+        jobs = {
+            partition: (codes[rows], scores[rows])
+            for partition, rows in partitions(data).items()
+        }
+        if self.workers > 1:
+            self._update_parallel(jobs, names)
+            return
+        progress = tqdm(jobs.items(), desc="ranking partitions")
+        for partition, (partition_codes, partition_scores) in progress:
+            progress.set_postfix_str(partition)
+            model = self.models.get(partition)
+            if model is None:
+                model = self.models[partition] = Model(partition, progress=False)
+            model.update_codes(partition_codes, names, partition_scores)
+
+    def _update_parallel(
+        self, jobs: dict[str, tuple[np.ndarray, np.ndarray]], names: np.ndarray
+    ):
+        stores: dict[str, RatingStore] = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {}
+            for partition in sorted(jobs, key=lambda p: len(jobs[p][0]), reverse=True):
+                partition_codes, partition_scores = jobs[partition]
+                partition_codes, partition_names = _localise(partition_codes, names)
+                model = self.models.get(partition)
+                future = executor.submit(
+                    _rate_partition,
+                    partition,
+                    model.store if model is not None else None,
+                    partition_codes,
+                    partition_names,
+                    partition_scores,
+                )
+                futures[future] = partition
+
+            progress = tqdm(
+                as_completed(futures), total=len(futures), desc="ranking partitions"
+            )
+            for future in progress:
+                partition = futures[future]
+                stores[partition] = future.result()
+                progress.set_postfix_str(partition)
+
+        for partition in jobs:
+            self.models[partition] = Model(
+                partition, store=stores[partition], progress=False
+            )
+
+    def results(self) -> dict[str, pd.DataFrame]:
+        return {partition: model.results() for partition, model in self.models.items()}
+
+
+def _rate_partition(
+    partition: str,
+    store: RatingStore | None,
+    codes: np.ndarray,
+    names: np.ndarray,
+    scores: np.ndarray,
+) -> RatingStore:
+    model = Model(partition, store=store, progress=False)
+    model.update_codes(codes, names, scores)
+    return model.store
+
+
+def partitions(data: pd.DataFrame | Mapping[str, ArrayLike]) -> dict[str, np.ndarray]:
+    """
+    Group matches into leaderboard partitions.
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        The rows of each partition, in their original order, keyed by the name of
+        the partition: ``{club}_{type}``, ``{club}_overall``, ``all_{type}`` and
+        ``all_overall``.
+    """
+    club_codes, clubs = pd.factorize(np.asarray(data["club"], dtype=object))
+    types = [type_ for type_ in Type if type_ != Type.UNDEFINED]
+    type_names = {str(type_).upper(): index for index, type_ in enumerate(types)}
+    type_codes = np.fromiter(
+        (type_names.get(type_, -1) for type_ in data["type_"]),
+        dtype=np.int64,
+        count=len(club_codes),
+    )
+
+    club_type_rows = _group_rows(
+        np.where(type_codes >= 0, club_codes * len(types) + type_codes, -1)
+    )
+    club_rows = _group_rows(club_codes)
+    type_rows = _group_rows(type_codes)
+
+    result: dict[str, np.ndarray] = {}
+    for club_index, club in enumerate(clubs):
+        for type_index, type_ in enumerate(types):
+            rows = club_type_rows.get(club_index * len(types) + type_index)
+            if rows is not None:
+                result[f"{club}_{type_}"] = rows
+        result[f"{club}_overall"] = club_rows[club_index]
+    for type_index, type_ in enumerate(types):
+        if type_index in type_rows:
+            result[f"all_{type_}"] = type_rows[type_index]
+    result["all_overall"] = np.arange(len(club_codes))
+    return result
+
+
+def _group_rows(keys: np.ndarray) -> dict[int, np.ndarray]:
+    order = np.argsort(keys, kind="stable")
+    bounds = np.flatnonzero(np.diff(keys[order])) + 1
+    return {
+        int(keys[group[0]]): group
+        for group in np.split(order, bounds)
+        if len(group) and keys[group[0]] >= 0
+    }
+
+
+def _factorize_players(
+    columns: pd.DataFrame | Mapping[str, ArrayLike],
+) -> tuple[np.ndarray, np.ndarray]:
+    names = np.column_stack(
+        [np.asarray(columns[column], dtype=object) for column in PLAYER_COLUMNS]
+    )
+    codes, uniques = pd.factorize(names.ravel(), use_na_sentinel=False)
+    return codes.reshape(-1, 4), np.asarray(uniques, dtype=object)
+
+
+def _localise(codes: np.ndarray, names: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Renumber codes densely, in the order each name first appears"""
+    present, first_seen = np.unique(codes, return_index=True)
+    present = present[np.argsort(first_seen)]
+    renumber = np.empty(len(names), dtype=np.int64)
+    renumber[present] = np.arange(len(present))
+    return renumber[codes], names[present]
+
+
+def _scores(columns: pd.DataFrame | Mapping[str, ArrayLike]) -> np.ndarray:
+    return np.column_stack(
+        [np.asarray(columns[column], dtype=np.float64) for column in SCORE_COLUMNS]
+    )
 
 
 def produce_ranks(data: pd.DataFrame) -> pd.DataFrame:
@@ -313,39 +703,36 @@ def produce_ranks(data: pd.DataFrame) -> pd.DataFrame:
     return model.results()
 
 
-def main():
-    data_path = Path(__file__).parent.parent / "data"
-    data = pd.read_csv(data_path / "matches.csv")
+def read_matches(path: Path) -> pd.DataFrame:
+    """
+    Read ``matches.csv`` in the order the matches were played.
+
+    The file is written in the order played, so the sort is stable to keep the
+    order of matches at the same point of the same day at different clubs.
+    """
+    data = pd.read_csv(path)
     data["score_diff"] = data["winner_score"] - data["loser_score"]
-    data = data.sort_values(by="date", ascending=True)
-
-    clubs = data["club"].unique()
-
-    for club in clubs:
-        club_data = data[data["club"] == club]
-        for type_ in Type:
-            if type_ == Type.UNDEFINED:
-                continue
-            filtered_data = club_data[club_data["type_"] == str(type_).upper()]
-            if filtered_data.shape[0] == 0:
-                continue
-            results = produce_ranks(filtered_data)
-            results.to_csv(data_path / f"{club}_{type_}.csv", index=False)
-        produce_ranks(club_data).to_csv(data_path / f"{club}_overall.csv", index=False)
-
-    for type_ in Type:
-        if type_ == Type.UNDEFINED:
-            continue
-        filtered_data = data[data["type_"] == str(type_).upper()]
-        if filtered_data.shape[0] == 0:
-            continue
-        model = Model(f"all_{type_}")
-        model.update(filtered_data)
-        results = model.results()
-        results.to_csv(data_path / f"all_{type_}.csv", index=False)
-
-    produce_ranks(data).to_csv(data_path / f"all_overall.csv", index=False)
+    return data.sort_values(by=["date", "session_index"], kind="stable")
+
+
+def main(workers: int = 1):
+    data_path = Path(__file__).parent.parent / "data"
+    data = read_matches(data_path / "matches.csv")
+
+    model = PartitionedModel(workers=workers)
+    model.update(data)
+    for partition, results in model.results().items():
+        results.to_csv(data_path / f"{partition}.csv", index=False)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(
+        description="Rank the players of every club and match type"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to rate the partitions, by default 1",
+    )
+    main(workers=parser.parse_args().workers)
@@ -1,58 +1,297 @@
-from typing import Sequence
+import argparse
+from typing import Any, Iterable, Sequence
 
-from database import Database, Player
-from openskill.models import ThurstoneMostellerFull, ThurstoneMostellerFullRating
+from database import DB_PATH, Database, Match
+from pipeline import RankHistorySink, RatingCache, SnapshotSink, run
+from thurstone import ThurstoneMosteller2v2
 
 
-def get_rankings(
-    players: Sequence[Player], model: ThurstoneMostellerFull, db: Database
-) -> list[ThurstoneMostellerFullRating]:
-    rankings = []
-    for player in players:
-        latest_rank = db.rank_history.get_latest(player.id)
-        if latest_rank:
-            rankings.append(
-                model.rating(mu=latest_rank.mu, sigma=latest_rank.sigma, name=player.id)
+def main(full: bool = False, batch_size: int = 1000):
+    """
+    Rate every match not yet rated and store the rank history.
+
+    The matches are streamed through :func:`pipeline.run`, which can also write the
+    leaderboards in the same pass: see ``pipeline.py --leaderboards``.
+
+    The watermark records the last match rated, across every club, and the
+    ``current_rating`` snapshot the ratings after it, so a run only rates the
+    matches played since the last one. Ratings are kept per person, whichever of
+    their players played. The ratings of each club's people at the end of each
+    session rated are kept in ``rating_snapshot``, and the packed history of
+    everyone rated is refreshed.
+
+    Parameters
+    ----------
+    full : bool, optional
+        Ignore the watermark and rate every match again, by default False
+    batch_size : int, optional
+        Number of rank history rows written per statement, by default 1000
+    """
+    db = Database(path=DB_PATH, echo=False, profile="ingest")
+    with db:
+        cache = RatingCache(db, full)
+        sinks = [
+            RankHistorySink(db, cache, full, batch_size),
+            SnapshotSink(db, full, batch_size),
+        ]
+        run(db, cache, sinks, full)
+        db.commit()
+
+
+def recompute(
+    match_ids: Iterable[int], tolerance: float = 1e-9, batch_size: int = 1000
+) -> int:
+    """
+    Re-rate what inserting or correcting matches in the rated history changed.
+
+    Starting from the day of the earliest changed match, every club's matches are
+    walked in the order they are rated in and only re-rated if they were changed or
+    include a person whose rating now differs from the stored one, which is the
+    dependency cone of the change. A person drops out of the cone once a new rating
+    is within ``tolerance`` of the stored one, and the walk stops once the cone is
+    empty at the end of a day. The rating snapshot of every session walked to the
+    end is written again.
+
+    Parameters
+    ----------
+    match_ids : Iterable[int]
+        Ids of the matches inserted or corrected
+    tolerance : float, optional
+        Largest difference in mu and sigma treated as unchanged, by default 1e-9
+    batch_size : int, optional
+        Number of rank history rows written per statement, by default 1000
+
+    Returns
+    -------
+    int
+        Number of matches re-rated
+    """
+    db = Database(path=DB_PATH, echo=False, profile="ingest")
+    rerated = 0
+    with db:
+        db.people.link_unassociated()
+        changed = db.matches.get_by_ids(match_ids)
+        touched: set[int] = set()
+        if changed:
+            rerated = _recompute_cone(db, changed, tolerance, batch_size, touched)
+        db.packed_history.refresh(db.packed_history.stale(touched), batch_size)
+        db.commit()
+    return rerated
+
+
+def _recompute_cone(
+    db: Database,
+    changed: Sequence[Match],
+    tolerance: float,
+    batch_size: int,
+    touched: set[int],
+) -> int:
+    """Re-rate the cone of the changes, adding whoever's history changed to touched"""
+    watermark = db.watermarks.get()
+    if watermark is None:
+        return 0
+    last = watermark.match
+    end = (last.session.date, last.session_index, last.id)
+    remaining = {match.id for match in changed}
+    # From the start of the day, so its sessions' snapshots can be rebuilt
+    start = (min(match.session.date for match in changed), 0)
+
+    model = ThurstoneMosteller2v2()
+    stored = db.rank_history.get_since(None, start)
+    current = db.rank_history.get_latest_before(start)
+    # Who was rated in each changed match, to find people taken out of it
+    rated_in: dict[int, list[int]] = {match_id: [] for match_id in remaining}
+    for person, match_id in stored:
+        if match_id in rated_in:
+            rated_in[match_id].append(person)
+    # The latest rating of each club's people, and the session being walked at it,
+    # by club id
+    latest: dict[int, dict[int, tuple[float, float]]] = {}
+    sessions: dict[int, int] = {}
+    date = None
+    dirty: set[int] = set()
+    rows: list[dict[str, Any]] = []
+    undo: list[dict[str, Any]] = []
+    rerated = 0
+    for lineup in db.matches.get_lineups(None, start):
+        if (lineup.date, lineup.session_index, lineup.match_id) > end:
+            # Past the last rated match
+            break
+        if lineup.date != date:
+            # Every session of the day before has been walked to its end
+            for club_id, session_id in sessions.items():
+                db.snapshots.replace(club_id, session_id, latest[club_id], batch_size)
+            sessions.clear()
+            if not (remaining or dirty):
+                # The change has been absorbed, so no later snapshot changes
+                break
+            date = lineup.date
+        club_latest = latest.get(lineup.club_id)
+        if club_latest is None:
+            club_latest = latest[lineup.club_id] = db.snapshots.get_latest(
+                lineup.club_id, before=start[0]
+            )
+        sessions[lineup.club_id] = lineup.session_id
+        people = lineup.players
+        keys = [(person, lineup.match_id) for person in people]
+        if (
+            lineup.match_id not in remaining
+            and dirty.isdisjoint(people)
+            and all(key in stored for key in keys)
+        ):
+            for person, key in zip(people, keys):
+                current[person] = club_latest[person] = stored[key]
+            continue
+
+        if lineup.match_id in remaining:
+            remaining.discard(lineup.match_id)
+            # People taken out of a corrected match lose its rating
+            for person in rated_in[lineup.match_id]:
+                if person not in people:
+                    db.rank_history.delete(person, lineup.match_id)
+                    db.undo_log.delete(person, lineup.match_id)
+                    dirty.add(person)
+                    touched.add(person)
+
+        before = [current.get(person) for person in people]
+        undo.extend(
+            {
+                "person_id": person,
+                "match_id": lineup.match_id,
+                "mu": None if rating is None else rating[0],
+                "sigma": None if rating is None else rating[1],
+            }
+            for person, rating in zip(people, before)
+        )
+        ratings = [rating or (model.mu, model.sigma) for rating in before]
+        new_mu, new_sigma = model.rate(
+            [mu for mu, _ in ratings],
+            [sigma for _, sigma in ratings],
+            (lineup.winner_score, lineup.loser_score),
+        )
+        rerated += 1
+        for person, mu, sigma in zip(people, new_mu, new_sigma):
+            old = stored.get((person, lineup.match_id))
+            if (
+                old is not None
+                and abs(old[0] - mu) <= tolerance
+                and abs(old[1] - sigma) <= tolerance
+            ):
+                current[person] = club_latest[person] = old
+                dirty.discard(person)
+                continue
+            current[person] = club_latest[person] = (mu, sigma)
+            dirty.add(person)
+            touched.add(person)
+            rows.append(
+                {
+                    "person_id": person,
+                    "match_id": lineup.match_id,
+                    "mu": mu,
+                    "sigma": sigma,
+                }
             )
-        else:
-            rankings.append(model.rating(name=player.id))
-    return rankings
+        if len(rows) >= batch_size:
+            db.rank_history.bulk_upsert(rows, batch_size)
+            rows.clear()
+        if len(undo) >= batch_size:
+            db.undo_log.bulk_upsert(undo, batch_size)
+            undo.clear()
 
+    for club_id, session_id in sessions.items():
+        db.snapshots.replace(club_id, session_id, latest[club_id], batch_size)
+    db.rank_history.bulk_upsert(rows, batch_size)
+    db.undo_log.bulk_upsert(undo, batch_size)
+    # People still in the cone at the end have a new latest rating, or none at all if
+    # they were taken out of the only matches they played
+    db.current_ratings.restore(
+        {person: current.get(person) for person in dirty}, batch_size
+    )
+    return rerated
 
-def main():
-    db = Database(path="data.db", echo=False)
+
+def retract(match_ids: Iterable[int], batch_size: int = 1000) -> int:
+    """
+    Delete matches and undo their ratings without replaying the whole history.
+
+    Every match from the first day with a retracted match on, across every club, is
+    rolled back with the undo log, so the cost grows with the number of matches
+    since then rather than with the length of the history. The current ratings go
+    back to what they were before that day, the watermark to the last match before
+    it unless it had not got that far, and their rank history and snapshots are
+    deleted. The matches are then
+    deleted and the rest rated again in the order played, as by :func:`main`.
+
+    Parameters
+    ----------
+    match_ids : Iterable[int]
+        Ids of the matches to delete
+    batch_size : int, optional
+        Number of rows written per statement, by default 1000
+
+    Returns
+    -------
+    int
+        Number of matches rolled back, including those deleted
+    """
+    db = Database(path=DB_PATH, echo=False, profile="ingest")
     with db:
-        for club in db.clubs.all():
-            model = ThurstoneMostellerFull()
-            print(f"Club: {club.name}")
-            for session in db.sessions.get_ordered(club.id):
-                for match in db.matches.get_ordered(session.id):
-                    winner_rankings = []
-                    loser_rankings = []
-                    winner_score = match.winner_score
-                    loser_score = match.loser_score
-                    for result in match.teams:
-                        if result.winner:
-                            winner_rankings.extend(
-                                get_rankings(result.team.members, model, db)
-                            )
-                        else:
-                            loser_rankings.extend(
-                                get_rankings(result.team.members, model, db)
-                            )
-                    [new_winner_rankings, new_loser_rankings] = model.rate(
-                        teams=[winner_rankings, loser_rankings],
-                        scores=[winner_score, loser_score],
-                    )
-                    for new_ranking in new_winner_rankings + new_loser_rankings:
-                        db.rank_history.new(
-                            player_id=new_ranking.name,
-                            match_id=match.id,
-                            mu=new_ranking.mu,
-                            sigma=new_ranking.sigma,
-                        )
+        retracted = db.matches.get_by_ids(match_ids)
+        if not retracted:
+            return 0
+        since = min(match.session.date for match in retracted)
+        undone, ratings = db.undo_log.roll_back(since)
+        db.rank_history.delete_matches(undone)
+        db.snapshots.delete_since(since)
+        db.current_ratings.restore(ratings, batch_size)
+        db.watermarks.reset(since)
+        db.matches.delete(match.id for match in retracted)
+
+        cache = RatingCache(db)
+        sinks = [
+            RankHistorySink(db, cache, False, batch_size),
+            SnapshotSink(db, False, batch_size),
+        ]
+        run(db, cache, sinks)
+        # Anyone who only played in the retracted matches was not rated again
+        db.packed_history.refresh(set(ratings) - cache.changed, batch_size)
         db.commit()
+    return len(undone)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Compute the rank history")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="rate every match again instead of only those since the last run",
+    )
+    parser.add_argument(
+        "--recompute",
+        nargs="+",
+        type=int,
+        metavar="MATCH_ID",
+        help="only re-rate what changed after inserting or correcting these matches",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1e-9,
+        help="largest rating difference treated as unchanged when recomputing",
+    )
+    parser.add_argument(
+        "--retract",
+        nargs="+",
+        type=int,
+        metavar="MATCH_ID",
+        help="delete these matches and undo their ratings, rating the rest again",
+    )
+    args = parser.parse_args()
+    if args.retract:
+        count = retract(args.retract)
+        print(f"Rolled back {count} matches")
+    elif args.recompute:
+        count = recompute(args.recompute, args.tolerance)
+        print(f"Re-rated {count} matches")
+    else:
+        main(full=args.full)
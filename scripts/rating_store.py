@@ -0,0 +1,170 @@
+from collections import Counter
+from typing import Iterable
+
+import numpy as np
+
+DEFAULT_MU = 25.0
+DEFAULT_SIGMA = 25.0 / 3.0
+
+
+class RatingStore:
+    """
+    Columnar storage of player ratings and match statistics.
+
+    Every player is given a dense integer id the first time they are seen. The id
+    indexes into contiguous NumPy arrays holding the rating (mu, sigma) and running
+    totals (wins, games, win and loss margin sums), so walking every player is a
+    vectorised operation instead of a loop over Python objects.
+
+    Partner and opponent counts are kept in counters keyed by ``(player_id,
+    other_id)`` pairs, in the order the pairs were first seen. Pairs are added with
+    :meth:`count`, so :meth:`most_frequent` only walks a counter again once it has
+    changed.
+    """
+
+    def __init__(
+        self,
+        mu: float = DEFAULT_MU,
+        sigma: float = DEFAULT_SIGMA,
+        capacity: int = 64,
+    ):
+        """
+        Parameters
+        ----------
+        mu : float, optional
+            Rating mean given to new players, by default 25
+        sigma : float, optional
+            Rating deviation given to new players, by default 25 / 3
+        capacity : int, optional
+            Number of players to allocate space for up front, by default 64
+        """
+        self.initial_mu = float(mu)
+        self.initial_sigma = float(sigma)
+        self.names: list[str] = []
+        self.ids: dict[str, int] = {}
+
+        capacity = max(capacity, 1)
+        self._mu = np.full(capacity, self.initial_mu)
+        self._sigma = np.full(capacity, self.initial_sigma)
+        self._wins = np.zeros(capacity, dtype=np.int64)
+        self._games = np.zeros(capacity, dtype=np.int64)
+        self._win_margin = np.zeros(capacity)
+        self._loss_margin = np.zeros(capacity)
+
+        self.won_with: Counter[tuple[int, int]] = Counter()
+        self.lost_with: Counter[tuple[int, int]] = Counter()
+        self.lost_against: Counter[tuple[int, int]] = Counter()
+        # Results of most_frequent, by the id of the counter they were found from
+        self._most_frequent: dict[int, tuple[Counter, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.ids
+
+    @property
+    def mu(self) -> np.ndarray:
+        return self._mu[: len(self.names)]
+
+    @property
+    def sigma(self) -> np.ndarray:
+        return self._sigma[: len(self.names)]
+
+    @property
+    def wins(self) -> np.ndarray:
+        return self._wins[: len(self.names)]
+
+    @property
+    def games(self) -> np.ndarray:
+        return self._games[: len(self.names)]
+
+    @property
+    def win_margin(self) -> np.ndarray:
+        """Sum of the margins of every match won"""
+        return self._win_margin[: len(self.names)]
+
+    @property
+    def loss_margin(self) -> np.ndarray:
+        """Sum of the margins of every match lost"""
+        return self._loss_margin[: len(self.names)]
+
+    def ordinal(self) -> np.ndarray:
+        return self.mu - 3.0 * self.sigma
+
+    def id_of(self, name: str) -> int:
+        """Get the id of a player, adding them to the store if they are new"""
+        id_ = self.ids.get(name)
+        if id_ is None:
+            id_ = len(self.names)
+            self._reserve(id_ + 1)
+            self.names.append(name)
+            self.ids[name] = id_
+            self._most_frequent.clear()
+        return id_
+
+    def ids_of(self, names: Iterable[str]) -> np.ndarray:
+        """Get the ids of many players, adding any that are new"""
+        return np.fromiter((self.id_of(name) for name in names), dtype=np.int64)
+
+    def _reserve(self, size: int):
+        capacity = self._mu.shape[0]
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        self._mu = _grow(self._mu, capacity, self.initial_mu)
+        self._sigma = _grow(self._sigma, capacity, self.initial_sigma)
+        self._wins = _grow(self._wins, capacity, 0)
+        self._games = _grow(self._games, capacity, 0)
+        self._win_margin = _grow(self._win_margin, capacity, 0.0)
+        self._loss_margin = _grow(self._loss_margin, capacity, 0.0)
+
+    def count(
+        self, counter: Counter[tuple[int, int]], pairs: Iterable[tuple[int, int]]
+    ):
+        """Add ``(player_id, other_id)`` pairs to one of the store's counters"""
+        counter.update(pairs)
+        self._most_frequent.pop(id(counter), None)
+
+    def most_frequent(self, counter: Counter[tuple[int, int]]) -> np.ndarray:
+        """
+        Find, for every player, the other player they appear with most in a counter.
+
+        Ties are broken in favour of the pair that was seen first. The result is
+        kept until the counter is next changed through :meth:`count`.
+
+        Returns
+        -------
+        np.ndarray
+            Object array of names, with an empty string for players that do not
+            appear in the counter.
+        """
+        cached = self._most_frequent.get(id(counter))
+        if cached is not None and cached[0] is counter:
+            return cached[1]
+        result = np.full(len(self), "", dtype=object)
+        self._most_frequent[id(counter)] = (counter, result)
+        if not counter:
+            return result
+        pairs = np.fromiter(
+            (id_ for pair in counter for id_ in pair),
+            dtype=np.int64,
+            count=2 * len(counter),
+        ).reshape(-1, 2)
+        totals = np.fromiter(counter.values(), dtype=np.int64, count=len(counter))
+        seen = np.arange(len(counter))
+        order = np.lexsort((seen, -totals, pairs[:, 0]))
+        ordered = pairs[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = ordered[1:, 0] != ordered[:-1, 0]
+        best = ordered[first]
+        names = np.array(self.names, dtype=object)
+        result[best[:, 0]] = names[best[:, 1]]
+        return result
+
+
+def _grow(array: np.ndarray, capacity: int, fill) -> np.ndarray:
+    grown = np.full(capacity, fill, dtype=array.dtype)
+    grown[: array.shape[0]] = array
+    return grown
@@ -0,0 +1,353 @@
+import math
+from dataclasses import dataclass, field
+from typing import Sequence
+
+import numpy as np
+from draw_formula import SPLITS
+from matchmaking import CourtScorer
+from ranking import Model
+
+
+@dataclass
+class RotationWeights:
+    """
+    How much each goal of a rotation counts.
+
+    Attributes
+    ----------
+    draw : float
+        Reward per unit of draw probability of a court
+    partner_history : float
+        Penalty per ``log(1 + n)`` of the ``n`` matches a pair have already
+        partnered each other in, won or lost
+    session_partner : float
+        Penalty per time a pair have already partnered each other in the session
+    """
+
+    draw: float = 1.0
+    partner_history: float = 0.01
+    session_partner: float = 0.1
+
+
+@dataclass
+class ScheduledMatch:
+    round: int
+    court: int
+    session_index: int
+    players: tuple[str, str, str, str]
+    draw_probability: float
+
+    @property
+    def team_one(self) -> tuple[str, str]:
+        return self.players[0], self.players[1]
+
+    @property
+    def team_two(self) -> tuple[str, str]:
+        return self.players[2], self.players[3]
+
+
+@dataclass
+class _Round:
+    groups: list[tuple[int, int, int, int]]
+    resting: list[int]
+    started: bool = False
+    matches: list[ScheduledMatch] = field(default_factory=list)
+    # Courts whose result has been recorded
+    completed: set[int] = field(default_factory=set)
+
+
+class Rotation:
+    """
+    The rotation for a whole session: who plays on which court in each round.
+
+    Each round the players who have played the fewest games, and then rested the
+    longest, take the courts, so rest is shared out evenly. They are grouped to
+    balance the draw probability of each court against playing with the same
+    partners, both in past sessions (``Player.wins_with`` and ``Player.loses_with``)
+    and earlier in this one.
+
+    When a match is completed its result is rated into the model and the rounds
+    that have not started yet are re-planned, lazily, as they are asked for. Each of
+    those rounds starts from its previous grouping, only swaps involving a court
+    with a player whose rating or partnerships changed are tried again, and only the
+    groups holding those players are scored again.
+
+    Matches are numbered with ``session_index`` in the order they are scheduled,
+    round by round and court by court.
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        players: Sequence[str],
+        courts: int,
+        rounds: int,
+        weights: RotationWeights | None = None,
+        max_passes: int = 20,
+        min_gain: float = 1e-3,
+    ):
+        """
+        Parameters
+        ----------
+        model : Model
+            The model holding the players' ratings and partnership history, updated
+            as matches are completed
+        players : Sequence[str]
+            Names of the players present
+        courts : int
+            Number of courts
+        rounds : int
+            Number of rounds in the session
+        weights : RotationWeights | None, optional
+            How much each goal counts, by default :class:`RotationWeights`
+        max_passes : int, optional
+            Most passes of swaps to improve each round, by default 20
+        min_gain : float, optional
+            Smallest improvement worth moving players for, by default 0.001. Keeps
+            the plan stable when a result only nudges the ratings.
+        """
+        self.model = model
+        self.names = list(dict.fromkeys(players))
+        self._index = {name: player for player, name in enumerate(self.names)}
+        self.ids = model.store.ids_of(self.names)
+        self.courts = max(0, min(courts, len(self.names) // 4))
+        self.weights = weights or RotationWeights()
+        self.max_passes = max_passes
+        self.min_gain = min_gain
+        store = model.store
+        self.scorer = CourtScorer(
+            store.mu[self.ids].tolist(),
+            store.sigma[self.ids].tolist(),
+            model.model.beta,
+        )
+        self._ids: list[int] = self.ids.tolist()
+        self._static: dict[tuple[int, ...], list[tuple[float, tuple]]] = {}
+        self.rounds: list[_Round] = [_Round([], []) for _ in range(rounds)]
+        # Rounds from here on need planning, for changes to the dirty players, or
+        # from scratch when that is None
+        self._stale = 0
+        self._dirty: set[int] | None = None
+
+    @property
+    def schedule(self) -> list[list[ScheduledMatch]]:
+        """Every round of the session"""
+        self._plan(len(self.rounds))
+        return [round_.matches for round_ in self.rounds]
+
+    def round(self, number: int) -> list[ScheduledMatch]:
+        """
+        The matches of one round, planning only as far as that round.
+
+        Parameters
+        ----------
+        number : int
+            The round, counting from zero
+
+        Returns
+        -------
+        list[ScheduledMatch]
+            The match on each court
+        """
+        self._plan(number + 1)
+        return self.rounds[number].matches
+
+    def complete(self, match: ScheduledMatch, team_one_score: int, team_two_score: int):
+        """
+        Record the result of a scheduled match.
+
+        The match's round is fixed from then on, and the rounds after it will be
+        re-planned around the new ratings when they are next asked for.
+
+        Parameters
+        ----------
+        match : ScheduledMatch
+            The match played
+        team_one_score, team_two_score : int
+            Points scored by each team
+
+        Raises
+        ------
+        ValueError
+            If the match is not on the schedule, as it was re-planned since, or its
+            result has already been recorded
+        """
+        self._plan(match.round + 1)
+        round_ = self.rounds[match.round]
+        if match.court >= len(round_.matches) or (
+            round_.matches[match.court].players != match.players
+        ):
+            raise ValueError(f"{match.players} are not playing that match")
+        if match.court in round_.completed:
+            raise ValueError(
+                f"Court {match.court} of round {match.round} is already completed"
+            )
+        round_.completed.add(match.court)
+        round_.started = True
+        players = [self._index[name] for name in match.players]
+        if team_one_score < team_two_score:
+            players = players[2:] + players[:2]
+            team_one_score, team_two_score = team_two_score, team_one_score
+        ids = self.ids[players]
+        self.model.rate_matches(
+            ids[None, :], np.array([[team_one_score, team_two_score]])
+        )
+
+        store = self.model.store
+        changed = set(players)
+        for player, id_ in zip(players, ids):
+            self.scorer.update(player, store.mu[id_], store.sigma[id_])
+        self._static = {
+            group: scores
+            for group, scores in self._static.items()
+            if changed.isdisjoint(group)
+        }
+        self._stale = min(self._stale, match.round + 1)
+        if self._dirty is not None:
+            self._dirty |= changed
+
+    def _plan(self, stop: int):
+        """Plan the stale rounds before ``stop``, keeping earlier rounds as they are"""
+        if self._stale >= stop:
+            return
+        games = [0] * len(self.names)
+        last_played = [-1] * len(self.names)
+        partnered: dict[tuple[int, int], int] = {}
+        for number, round_ in enumerate(self.rounds[:stop]):
+            if number >= self._stale and not round_.started:
+                self._plan_round(
+                    number, round_, games, last_played, partnered, self._dirty
+                )
+            for group in round_.groups:
+                for player in group:
+                    games[player] += 1
+                    last_played[player] = number
+                for pair in (group[:2], group[2:]):
+                    pair = tuple(sorted(pair))
+                    partnered[pair] = partnered.get(pair, 0) + 1
+        if stop == len(self.rounds) or self._dirty is None:
+            # Either every round is up to date or the rest have never been planned
+            self._dirty = set()
+        self._stale = stop
+
+    def _plan_round(
+        self,
+        number: int,
+        round_: _Round,
+        games: list[int],
+        last_played: list[int],
+        partnered: dict[tuple[int, int], int],
+        dirty: set[int] | None,
+    ):
+        # Fewest games first, then longest rested, rotating ties between rounds
+        order = sorted(
+            range(len(self.names)),
+            key=lambda player: (
+                games[player],
+                last_played[player],
+                (player - number * 4 * self.courts) % len(self.names),
+            ),
+        )
+        seats = 4 * self.courts
+        playing = set(order[:seats])
+        previous = [player for group in round_.groups for player in group]
+        full = dirty is None or set(previous) != playing
+        if full:
+            slots = sorted(playing, key=lambda player: self.scorer.mu[player])
+        else:
+            slots = previous
+
+        def court_score(court: int) -> tuple[float, tuple[int, int, int, int]]:
+            return self._score(tuple(slots[4 * court : 4 * court + 4]), partnered)
+
+        courts = [court_score(court) for court in range(self.courts)]
+        # The previous grouping could not be improved by any swap, and a swap between
+        # courts with no dirty players scores the same as it did then
+        if full:
+            touched = set(range(self.courts))
+        else:
+            touched = {
+                court
+                for court, (_, group) in enumerate(courts)
+                if not dirty.isdisjoint(group)
+            }
+        for _ in range(self.max_passes):
+            improved = False
+            for court_a in range(self.courts):
+                for court_b in range(court_a + 1, self.courts):
+                    if court_a not in touched and court_b not in touched:
+                        continue
+                    for a in range(4 * court_a, 4 * court_a + 4):
+                        for b in range(4 * court_b, 4 * court_b + 4):
+                            slots[a], slots[b] = slots[b], slots[a]
+                            new_a, new_b = court_score(court_a), court_score(court_b)
+                            gain = (
+                                new_a[0]
+                                + new_b[0]
+                                - courts[court_a][0]
+                                - courts[court_b][0]
+                            )
+                            if gain > self.min_gain:
+                                courts[court_a], courts[court_b] = new_a, new_b
+                                touched.update((court_a, court_b))
+                                improved = True
+                            else:
+                                slots[a], slots[b] = slots[b], slots[a]
+            if not improved:
+                break
+
+        if dirty is not None:
+            # Later rounds see the partnerships of any court that changed
+            for court, (_, group) in enumerate(courts):
+                if court >= len(round_.groups) or group != round_.groups[court]:
+                    dirty.update(group)
+        round_.groups = [group for _, group in courts]
+        round_.resting = order[seats:]
+        round_.matches = [
+            ScheduledMatch(
+                round=number,
+                court=court,
+                session_index=number * self.courts + court,
+                players=tuple(self.names[player] for player in group),
+                draw_probability=self.scorer.draw_probability(group[:2], group[2:]),
+            )
+            for court, group in enumerate(round_.groups)
+        ]
+
+    def _score(
+        self, group: tuple[int, ...], partnered: dict[tuple[int, int], int]
+    ) -> tuple[float, tuple[int, int, int, int]]:
+        """The best split of a group and its score, given the session so far"""
+        group = tuple(sorted(group))
+        splits = self._static.get(group)
+        if splits is None:
+            splits = self._static[group] = [
+                self._static_score(tuple(group[position] for position in split))
+                for split in SPLITS
+            ]
+        best = (-math.inf, group)
+        weight = self.weights.session_partner
+        for score, court in splits:
+            if partnered:
+                score -= weight * (
+                    partnered.get(court[:2], 0) + partnered.get(court[2:], 0)
+                )
+            if score > best[0]:
+                best = (score, court)
+        return best
+
+    def _static_score(
+        self, court: tuple[int, ...]
+    ) -> tuple[float, tuple[int, int, int, int]]:
+        """Draw probability less the partner history penalty of one split"""
+        store = self.model.store
+        ids = [self._ids[player] for player in court]
+        history = 0.0
+        for pair in ((ids[0], ids[1]), (ids[2], ids[3])):
+            history += math.log1p(
+                store.won_with.get(pair, 0) + store.lost_with.get(pair, 0)
+            )
+        score = (
+            self.weights.draw * self.scorer.draw_probability(court[:2], court[2:])
+            - self.weights.partner_history * history
+        )
+        return score, court
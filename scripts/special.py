@@ -0,0 +1,124 @@
+"""
+Special functions on NumPy arrays, for the kernels that cannot depend on scipy.
+
+``math.erf`` only takes one float at a time. :func:`erf` evaluates the rational
+approximations of the Cephes library element-wise instead, which agree with
+``math.erf`` to within a few units in the last place.
+"""
+
+import numpy as np
+
+# erf(x) = x T(x²) / U(x²) for |x| <= 1
+_T = np.array(
+    [
+        9.60497373987051638749e0,
+        9.00260197203842689217e1,
+        2.23200534594684319226e3,
+        7.00332514112805075473e3,
+        5.55923013010394962768e4,
+    ]
+)
+_U = np.array(
+    [
+        1.0,
+        3.35617141647503099647e1,
+        5.21357949780152679795e2,
+        4.59432382970980127987e3,
+        2.26290000613890934246e4,
+        4.92673942608635921086e4,
+    ]
+)
+# erfc(x) = exp(-x²) P(x) / Q(x) for 1 < x < 8
+_P = np.array(
+    [
+        2.46196981473530512524e-10,
+        5.64189564831068821977e-1,
+        7.46321056442269912687e0,
+        4.86371970985681366614e1,
+        1.96520832956077098242e2,
+        5.26445194995477358631e2,
+        9.34528527171957607540e2,
+        1.02755188689515710272e3,
+        5.57535335369399327526e2,
+    ]
+)
+_Q = np.array(
+    [
+        1.0,
+        1.32281951154744992508e1,
+        8.67072140885989742329e1,
+        3.54937778887819891062e2,
+        9.75708501743205489753e2,
+        1.82390916687909736289e3,
+        2.24633760818710981792e3,
+        1.65666309194161350182e3,
+        5.57535340817727675546e2,
+    ]
+)
+# erfc(x) = exp(-x²) R(x) / S(x) for x >= 8
+_R = np.array(
+    [
+        5.64189583547755073984e-1,
+        1.27536670759978104416e0,
+        5.01905042251180477414e0,
+        6.16021097993053585195e0,
+        7.40974269950448939160e0,
+        2.97886665372100240670e0,
+    ]
+)
+_S = np.array(
+    [
+        1.0,
+        2.26052863220117276590e0,
+        9.39603524938001434673e0,
+        1.20489539808096656605e1,
+        1.70814450747565897222e1,
+        9.60896809063285878198e0,
+        3.36907645100081516050e0,
+    ]
+)
+
+
+def _polynomial(coefficients: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Evaluate a polynomial, highest power first, by Horner's method"""
+    result = np.full_like(x, coefficients[0])
+    for coefficient in coefficients[1:]:
+        result *= x
+        result += coefficient
+    return result
+
+
+def erf(x: np.ndarray) -> np.ndarray:
+    """
+    The error function of every element of an array.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        The arguments
+
+    Returns
+    -------
+    np.ndarray
+        ``erf(x)`` as float64, in the shape of ``x``
+    """
+    x = np.asarray(x, dtype=np.float64)
+    xx = np.abs(x)
+    small = xx <= 1.0
+    result = np.empty_like(x)
+
+    z = x[small] * x[small]
+    result[small] = x[small] * _polynomial(_T, z) / _polynomial(_U, z)
+
+    large = ~small
+    a = xx[large]
+    middle = a < 8.0
+    # Far in the tails erf is ±1 to double precision
+    a = np.minimum(a, 27.0)
+    ratio = np.where(
+        middle,
+        _polynomial(_P, a) / _polynomial(_Q, a),
+        _polynomial(_R, a) / _polynomial(_S, a),
+    )
+    result[large] = np.copysign(1.0 - np.exp(-a * a) * ratio, x[large])
+    return result
@@ -0,0 +1,265 @@
+import math
+import sys
+from typing import Sequence
+
+import numpy as np
+
+try:
+    from special import erf
+except ModuleNotFoundError:
+    from .special import erf
+
+_SQRT2 = math.sqrt(2.0)
+_SQRT_TAU = math.sqrt(math.tau)
+_EPSILON = sys.float_info.epsilon
+
+
+def _phi_major(x: float) -> float:
+    return 0.5 * (1.0 + math.erf(x / _SQRT2))
+
+
+def _phi_minor(x: float) -> float:
+    return math.exp(x * x / -2.0) / _SQRT_TAU
+
+
+def _vw(x: float, t: float) -> tuple[float, float]:
+    """The functions :math:`V` and :math:`W` of Weng & Lin, sharing one CDF call"""
+    xt = x - t
+    denominator = _phi_major(xt)
+    if denominator < _EPSILON:
+        return -xt, 1 if x < 0 else 0
+    v = _phi_minor(xt) / denominator
+    return v, v * (v + xt)
+
+
+def _vt(x: float, t: float) -> float:
+    xx = abs(x)
+    b = _phi_major(t - xx) - _phi_major(-t - xx)
+    if b < 1e-5:
+        if x < 0:
+            return -x - t
+        return -x + t
+    a = _phi_minor(-t - xx) - _phi_minor(t - xx)
+    return (-a if x < 0 else a) / b
+
+
+def _wt(x: float, t: float) -> float:
+    xx = abs(x)
+    b = _phi_major(t - xx) - _phi_major(-t - xx)
+    if b < _EPSILON:
+        return 1.0
+    vt = _vt(x, t)
+    return ((t - xx) * _phi_minor(t - xx) + (t + xx) * _phi_minor(-t - xx)) / b + (
+        vt * vt
+    )
+
+
+def _phi_major_array(x: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + erf(x / _SQRT2))
+
+
+def _phi_minor_array(x: np.ndarray) -> np.ndarray:
+    return np.exp(x * x / -2.0) / _SQRT_TAU
+
+
+def _vw_array(x: np.ndarray, t: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Element-wise :func:`_vw`"""
+    xt = x - t
+    denominator = _phi_major_array(xt)
+    small = denominator < _EPSILON
+    with np.errstate(divide="ignore", invalid="ignore"):
+        v = _phi_minor_array(xt) / denominator
+    return (
+        np.where(small, -xt, v),
+        np.where(small, np.where(x < 0, 1.0, 0.0), v * (v + xt)),
+    )
+
+
+def _vt_wt_array(x: np.ndarray, t: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Element-wise :func:`_vt` and :func:`_wt`"""
+    xx = np.abs(x)
+    b = _phi_major_array(t - xx) - _phi_major_array(-t - xx)
+    a = _phi_minor_array(-t - xx) - _phi_minor_array(t - xx)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vt = np.where(
+            b < 1e-5, np.where(x < 0, -x - t, -x + t), np.where(x < 0, -a, a) / b
+        )
+        wt = (
+            (t - xx) * _phi_minor_array(t - xx) + (t + xx) * _phi_minor_array(-t - xx)
+        ) / b + (vt * vt)
+    return vt, np.where(b < _EPSILON, 1.0, wt)
+
+
+class ThurstoneMosteller2v2:
+    """
+    The openskill ``ThurstoneMostellerFull`` rating update, specialised to a match
+    between two teams of two.
+
+    ``openskill`` supports any number of teams of any size, and pays for that with
+    validation, deep copies and rating objects on every call. Every match we rate is
+    two pairs, so this works directly on floats and produces the same numbers as
+    ``ThurstoneMostellerFull().rate(teams, scores=scores)`` with the default model
+    options.
+
+    Players are always given in the order ``[team one a, team one b, team two a,
+    team two b]``.
+    """
+
+    def __init__(
+        self,
+        mu: float = 25.0,
+        sigma: float = 25.0 / 3.0,
+        beta: float = 25.0 / 6.0,
+        kappa: float = 0.0001,
+        epsilon: float = 0.1,
+        tau: float = 25.0 / 300.0,
+    ):
+        self.mu = float(mu)
+        self.sigma = float(sigma)
+        self.beta = beta
+        self.kappa = float(kappa)
+        self.epsilon = float(epsilon)
+        self.tau = float(tau)
+
+    def rate(
+        self,
+        mu: Sequence[float],
+        sigma: Sequence[float],
+        scores: tuple[float, float],
+    ) -> tuple[list[float], list[float]]:
+        """
+        Rate a single match.
+
+        Parameters
+        ----------
+        mu : Sequence[float]
+            Mu of the four players
+        sigma : Sequence[float]
+            Sigma of the four players
+        scores : tuple[float, float]
+            Points scored by team one and team two
+
+        Returns
+        -------
+        tuple[list[float], list[float]]
+            The new mu and sigma of the four players
+        """
+        tau_squared = self.tau * self.tau
+        sigma = [math.sqrt(s * s + tau_squared) for s in sigma]
+        team_mu = (mu[0] + mu[1], mu[2] + mu[3])
+        team_sigma_squared = (
+            sigma[0] ** 2 + sigma[1] ** 2,
+            sigma[2] ** 2 + sigma[3] ** 2,
+        )
+        c = math.sqrt(
+            team_sigma_squared[0] + team_sigma_squared[1] + (2 * self.beta**2)
+        )
+        t = self.epsilon / c
+        delta_mu = (team_mu[0] - team_mu[1]) / c
+
+        new_mu = list(mu)
+        new_sigma = list(sigma)
+        if scores[0] == scores[1]:
+            updates = [
+                self._drawn(team_sigma_squared[0], c, delta_mu, t),
+                self._drawn(team_sigma_squared[1], c, -delta_mu, t),
+            ]
+        else:
+            # Both teams are updated from the V and W of the winner's perspective
+            winner = 0 if scores[0] > scores[1] else 1
+            v, w = _vw(delta_mu if winner == 0 else -delta_mu, t)
+            updates = [(0.0, 0.0), (0.0, 0.0)]
+            for team in (0, 1):
+                sigma_squared = team_sigma_squared[team]
+                sigma_squared_to_c = sigma_squared / c
+                gamma = math.sqrt(sigma_squared) / c
+                omega = sigma_squared_to_c * v
+                updates[team] = (
+                    omega if team == winner else -sigma_squared_to_c * v,
+                    gamma * sigma_squared_to_c / c * w,
+                )
+
+        for player in range(4):
+            omega, delta = updates[player // 2]
+            share = sigma[player] ** 2 / team_sigma_squared[player // 2]
+            new_mu[player] = mu[player] + share * omega
+            new_sigma[player] = sigma[player] * math.sqrt(
+                max(1 - share * delta, self.kappa)
+            )
+        return new_mu, new_sigma
+
+    @staticmethod
+    def _drawn(
+        sigma_squared: float, c: float, delta_mu: float, t: float
+    ) -> tuple[float, float]:
+        sigma_squared_to_c = sigma_squared / c
+        gamma = math.sqrt(sigma_squared) / c
+        return (
+            sigma_squared_to_c * _vt(delta_mu, t),
+            gamma * sigma_squared_to_c / c * _wt(delta_mu, t),
+        )
+
+    def rate_batch(
+        self, mu: np.ndarray, sigma: np.ndarray, scores: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Rate many matches at once, as if each was given to :meth:`rate`.
+
+        The matches are rated independently of each other, so no player may appear
+        in more than one of them. The error function is evaluated by
+        :func:`special.erf` rather than ``math.erf``, so the results agree with
+        :meth:`rate` to within rounding rather than exactly.
+
+        Parameters
+        ----------
+        mu : np.ndarray
+            ``(n, 4)`` array of player mu
+        sigma : np.ndarray
+            ``(n, 4)`` array of player sigma
+        scores : np.ndarray
+            ``(n, 2)`` array of the points scored by team one and team two
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            ``(n, 4)`` arrays of the new mu and sigma
+        """
+        mu = np.asarray(mu, dtype=np.float64)
+        sigma = np.asarray(sigma, dtype=np.float64)
+        scores = np.asarray(scores, dtype=np.float64)
+
+        sigma = np.sqrt(sigma * sigma + self.tau * self.tau)
+        sigma_squared = sigma * sigma
+        team_mu = mu[:, 0::2] + mu[:, 1::2]
+        team_sigma_squared = sigma_squared[:, 0::2] + sigma_squared[:, 1::2]
+        c = np.sqrt(
+            team_sigma_squared[:, 0] + team_sigma_squared[:, 1] + (2 * self.beta**2)
+        )
+        t = (self.epsilon / c)[:, None]
+        delta_mu = (team_mu[:, 0] - team_mu[:, 1]) / c
+
+        # Every match is seen from both teams' side: (n, 2) arrays
+        c = c[:, None]
+        x = np.stack((delta_mu, -delta_mu), axis=1)
+        won = scores > scores[:, ::-1]
+        lost = scores < scores[:, ::-1]
+
+        # Both teams of a decided match use the V and W of the winner's perspective
+        v, w = _vw_array(np.where(lost, -x, x), t)
+        v = np.where(lost, -v, v)
+        drawn = ~(won | lost)
+        if drawn.any():
+            vt, wt = _vt_wt_array(x, t)
+            v = np.where(drawn, vt, v)
+            w = np.where(drawn, wt, w)
+        sigma_squared_to_c = team_sigma_squared / c
+        gamma = np.sqrt(team_sigma_squared) / c
+        omega = sigma_squared_to_c * v
+        delta = gamma * sigma_squared_to_c / c * w
+
+        share = sigma_squared / np.repeat(team_sigma_squared, 2, axis=1)
+        new_mu = mu + share * np.repeat(omega, 2, axis=1)
+        new_sigma = sigma * np.sqrt(
+            np.maximum(1 - share * np.repeat(delta, 2, axis=1), self.kappa)
+        )
+        return new_mu, new_sigma
@@ -0,0 +1,54 @@
+import numpy as np
+
+
+def wave_numbers(players: np.ndarray) -> np.ndarray:
+    """
+    Number the waves of matches that share no players in an ordered match stream.
+
+    Every match is placed in the wave after the latest wave holding one of its
+    players, so each player's matches stay in their original order. Rating the
+    waves one after another, with the matches inside a wave rated together,
+    therefore gives the same ratings as rating the stream in order.
+
+    Parameters
+    ----------
+    players : np.ndarray
+        ``(n, k)`` array of the player ids taking part in each match, in the order
+        the matches were played
+
+    Returns
+    -------
+    np.ndarray
+        The wave of every match, counting from zero
+    """
+    if len(players) == 0:
+        return np.empty(0, dtype=np.int64)
+    latest = [-1] * (int(players.max()) + 1)
+    get = latest.__getitem__
+    waves = []
+    for match in players.tolist():
+        wave = max(map(get, match)) + 1
+        waves.append(wave)
+        for player in match:
+            latest[player] = wave
+    return np.array(waves, dtype=np.int64)
+
+
+def split_waves(waves: np.ndarray) -> list[np.ndarray]:
+    """
+    Split an ordered stream of matches into its waves.
+
+    Parameters
+    ----------
+    waves : np.ndarray
+        The wave of every match, from :func:`wave_numbers`
+
+    Returns
+    -------
+    list[np.ndarray]
+        Indices of the matches in each wave, in ascending order
+    """
+    if len(waves) == 0:
+        return []
+    order = np.argsort(waves, kind="stable")
+    return np.split(order, np.flatnonzero(np.diff(waves[order])) + 1)
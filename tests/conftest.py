@@ -0,0 +1,95 @@
+import shutil
+import sqlite3
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from query_plans import seed
+
+# The matches from the third session of the sixth week on, at every club
+LATER = """
+SELECT "match".id
+FROM "match"
+INNER JOIN "session"
+    ON "session".id = "match".session_id
+WHERE ("session".date, "match".session_index) >= ('2020-02-05', 3)
+"""
+RATED_TABLES = {
+    "rank_history": "person_id, match_id, mu, sigma",
+    "rating_undo": "person_id, match_id, mu, sigma",
+    "current_rating": "person_id, mu, sigma",
+    "rating_snapshot": "session_id, person_id, club_id, mu, sigma",
+    "rating_watermark": "match_id",
+}
+
+
+@pytest.fixture(scope="session")
+def seeded(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """A database of two clubs, whose people play at both on the same days"""
+    path = tmp_path_factory.mktemp("seeded") / "data.db"
+    seed(str(path), clubs=2, people=30, sessions=12, matches_per_session=6)
+    return path
+
+
+@pytest.fixture
+def database(seeded: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """A copy of the seeded database, where the scripts look for it from tmp_path"""
+    path = tmp_path / "data" / "data.db"
+    path.parent.mkdir()
+    shutil.copy(seeded, path)
+    monkeypatch.chdir(tmp_path)
+    return path
+
+
+class HeldBack:
+    """The later matches of a database, taken out of it until they are ingested"""
+
+    def __init__(self, path: Path, complete: Path):
+        self.path = path
+        self.complete = complete
+
+    def ingest(self):
+        """Put the matches back, as if they had just been played"""
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.execute("ATTACH DATABASE ? AS complete", (str(self.complete),))
+            connection.execute(
+                'INSERT INTO "match" SELECT * FROM complete."match" '
+                'WHERE id NOT IN (SELECT id FROM main."match")'
+            )
+            connection.execute(
+                "INSERT INTO result SELECT * FROM complete.result "
+                "WHERE match_id NOT IN (SELECT match_id FROM main.result)"
+            )
+        connection.close()
+
+
+@pytest.fixture
+def held_back(database: Path, tmp_path: Path) -> HeldBack:
+    """The database without its later matches, to be ingested once the rest are"""
+    complete = tmp_path / "complete.db"
+    shutil.copy(database, complete)
+    connection = sqlite3.connect(database)
+    with connection:
+        connection.execute(f"DELETE FROM result WHERE match_id IN ({LATER})")
+        connection.execute(f'DELETE FROM "match" WHERE id IN ({LATER})')
+    connection.close()
+    return HeldBack(database, complete)
+
+
+@pytest.fixture
+def rated() -> Callable[[Path], dict[str, list[tuple]]]:
+    """Read every table written by rating the matches, by table name"""
+
+    def read(path: Path) -> dict[str, list[tuple]]:
+        connection = sqlite3.connect(path)
+        tables = {
+            table: connection.execute(
+                f"SELECT {columns} FROM {table} ORDER BY {columns}"
+            ).fetchall()
+            for table, columns in RATED_TABLES.items()
+        }
+        connection.close()
+        return tables
+
+    return read
@@ -0,0 +1,129 @@
+import asyncio
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import pipeline
+import pytest
+from packed_history import unpack_history
+
+from scripts import api
+from scripts.api import RankHistoryFormat, get_leaderboard, get_rank_history
+from scripts.database import Database
+
+
+def test_packed_history_decodes_to_the_json_history(database: Path):
+    pipeline.main(full=True)
+    connection = sqlite3.connect(database)
+    people = [row[0] for row in connection.execute("SELECT id FROM person")]
+    clubs = [row[0] for row in connection.execute("SELECT id FROM club")]
+    connection.close()
+
+    db = Database(str(database))
+    for person_id in people:
+        for club_id in clubs:
+            json = get_rank_history(person_id, db, RankHistoryFormat.JSON, club_id)
+            packed = get_rank_history(person_id, db, RankHistoryFormat.PACKED, club_id)
+            entries = unpack_history(packed.body)
+            assert [
+                (entry.match_id, entry.date, entry.start_time, entry.winner)
+                for entry in entries
+            ] == [
+                (entry.match_id, entry.date, entry.start_time, entry.winner)
+                for entry in json.history
+            ]
+            # The packed ratings are single precision
+            assert [(entry.mu, entry.sigma) for entry in entries] == [
+                (
+                    pytest.approx(entry.mu, rel=1e-6),
+                    pytest.approx(entry.sigma, rel=1e-6),
+                )
+                for entry in json.history
+            ]
+
+
+# Each person's rating after their last match at a club on or before a date
+LEADERBOARD_SQL = """
+SELECT person_id, mu, sigma
+FROM (
+    SELECT rh.person_id, rh.mu, rh.sigma, ROW_NUMBER() OVER (
+        PARTITION BY rh.person_id
+        ORDER BY s.date DESC, m.session_index DESC, m.id DESC
+    ) AS position
+    FROM rank_history rh
+    INNER JOIN "match" m
+        ON m.id = rh.match_id
+    INNER JOIN "session" s
+        ON s.id = m.session_id
+    WHERE s.club_id = ? AND s.date <= ?
+)
+WHERE position = 1
+"""
+
+
+def test_leaderboard_as_of_a_date_is_the_ratings_then(database: Path):
+    pipeline.main(full=True)
+    connection = sqlite3.connect(database)
+    sessions = connection.execute(
+        'SELECT club_id, date FROM "session" ORDER BY club_id, date'
+    ).fetchall()
+    db = Database(str(database))
+    for club_id, day in sessions:
+        day = date.fromisoformat(day)
+        # The day before each session, the day of it and the day after
+        for as_of in (day - timedelta(days=1), day, day + timedelta(days=1)):
+            leaderboard = get_leaderboard(club_id, db, as_of)
+            assert leaderboard.date == as_of
+            expected = connection.execute(
+                LEADERBOARD_SQL, (club_id, as_of.isoformat())
+            ).fetchall()
+            assert sorted(
+                (entry.player_id, entry.mu, entry.sigma)
+                for entry in leaderboard.players
+            ) == sorted(expected)
+            ordinals = [entry.ordinal for entry in leaderboard.players]
+            assert ordinals == sorted(ordinals, reverse=True)
+            assert all(
+                entry.ordinal == pytest.approx(entry.mu - 3 * entry.sigma)
+                for entry in leaderboard.players
+            )
+    connection.close()
+
+
+def test_requests_share_the_apps_engine(
+    database: Path, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(api, "DB_PATH", str(database))
+
+    async def serve():
+        async with api.lifespan(api.app):
+            engines = set()
+            for _ in range(3):
+                dependency = api.get_db(SimpleNamespace(app=api.app))
+                db = next(dependency)
+                assert db.players.get("player 1") is not None
+                engines.add(db.session.get_bind())
+                dependency.close()
+            assert len(engines) == 1
+            engine = engines.pop()
+            # Each request gave its connection back to the pool
+            assert engine.pool.checkedout() == 0
+            assert engine.pool.checkedin() == 1
+        return engine
+
+    engine = asyncio.run(serve())
+    # The pool was closed with the app
+    assert engine.pool.checkedin() == 0
+
+
+def test_entering_a_database_again_keeps_its_session(database: Path):
+    db = Database(str(database))
+    with db:
+        session = db.session
+        # As an endpoint does with the database its dependency entered
+        with db:
+            assert db.session is session
+            player = db.players.get("player 1")
+        assert player in session
+    assert player not in session
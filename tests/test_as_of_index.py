@@ -0,0 +1,116 @@
+import random
+import sqlite3
+from pathlib import Path
+
+import pipeline
+import pytest
+from as_of_index import AsOfIndex
+from database import Database
+from fastapi import HTTPException
+from matchmaking import assign_courts
+
+from scripts.api import MatchmakingRequest, get_matchmaking
+
+
+def small_index() -> AsOfIndex:
+    # Matches 10, 20, ... 50 in that order
+    index = AsOfIndex(
+        {match_id: ordinal for ordinal, match_id in enumerate(range(10, 60, 10))}
+    )
+    index.add(1, 20, 26.0, 8.0)
+    index.add(1, 40, 27.0, 7.0)
+    index.add(2, 10, 24.0, 8.0)
+    return index
+
+
+def test_before_the_first_rating_is_none():
+    index = small_index()
+    assert index.before(1, 10) is None
+    # A rating is only what someone had going into a match, not what it earned
+    assert index.before(1, 20) is None
+    assert index.before_many([1, 2], 10) == {}
+
+
+def test_an_exact_match_id_gives_the_rating_before_it():
+    index = small_index()
+    assert index.before(1, 30) == (26.0, 8.0)
+    assert index.before(1, 40) == (26.0, 8.0)
+    assert index.before(1, 50) == (27.0, 7.0)
+    assert index.before_many([1, 2], 40) == {1: (26.0, 8.0), 2: (24.0, 8.0)}
+
+
+def test_people_never_rated_are_left_out():
+    index = small_index()
+    assert index.before(3, 50) is None
+    assert index.before_many([3, 1, 0, 99], 50) == {1: (27.0, 7.0)}
+    assert AsOfIndex({10: 0}).before_many([1], 10) == {}
+
+
+def test_before_many_sees_ratings_added_after_it_was_asked():
+    index = small_index()
+    assert index.before_many([2], 50) == {2: (24.0, 8.0)}
+    index.add(2, 30, 23.0, 7.5)
+    index.add(3, 10, 25.0, 8.0)
+    assert index.before_many([2, 3], 50) == {2: (23.0, 7.5), 3: (25.0, 8.0)}
+
+
+def test_before_many_agrees_with_single_lookups():
+    rng = random.Random(0)
+    match_ids = rng.sample(range(10000), 500)
+    index = AsOfIndex({match_id: ordinal for ordinal, match_id in enumerate(match_ids)})
+    # Out of order, with some ratings replaced
+    for _ in range(3000):
+        index.add(rng.randrange(60), rng.choice(match_ids), rng.random(), rng.random())
+    people = list(range(-5, 70))
+    for match_id in rng.sample(match_ids, 100):
+        expected = {
+            person: rating
+            for person in people
+            if (rating := index.before(person, match_id)) is not None
+        }
+        assert index.before_many(people, match_id) == expected
+
+
+def test_matchmaking_before_a_match_uses_the_ratings_going_into_it(database: Path):
+    pipeline.main(full=True)
+    connection = sqlite3.connect(database)
+    match_id, *people = connection.execute(
+        "SELECT match_id, GROUP_CONCAT(person_id) FROM rank_history "
+        "GROUP BY match_id ORDER BY match_id DESC LIMIT 1"
+    ).fetchone()
+    people = [int(person) for person in people[0].split(",")]
+    expected = {}
+    for person in people:
+        row = connection.execute(
+            'SELECT r.mu, r.sigma FROM rank_history r JOIN "match" m '
+            'ON r.match_id = m.id JOIN "session" s ON m.session_id = s.id '
+            "WHERE r.person_id = ? AND (s.date, m.session_index, m.id) < "
+            '(SELECT s.date, m.session_index, m.id FROM "match" m '
+            'JOIN "session" s ON m.session_id = s.id WHERE m.id = ?) '
+            "ORDER BY s.date DESC, m.session_index DESC, m.id DESC LIMIT 1",
+            (person, match_id),
+        ).fetchone()
+        if row is not None:
+            expected[person] = row
+    connection.close()
+    assert len(expected) == len(people) == 4
+
+    with Database(str(database)) as db:
+        index = db.rank_history.as_of_index(people)
+        assert index.before_many(people, match_id) == expected
+        assert len(index) == sum(
+            1 for person in people for _ in db.rank_history.get_all(person)
+        )
+
+    request = MatchmakingRequest(player_ids=people, courts=1, before_match_id=match_id)
+    court = get_matchmaking(request, Database(str(database))).courts[0]
+    ratings = [expected.get(person, (25, 25 / 3)) for person in people]
+    assignment = assign_courts(
+        [mu for mu, _ in ratings], [sigma for _, sigma in ratings], 1
+    )
+    assert court.draw_probability == assignment.probabilities[0]
+
+    request.before_match_id = -1
+    with pytest.raises(HTTPException) as error:
+        get_matchmaking(request, Database(str(database)))
+    assert error.value.status_code == 404
@@ -0,0 +1,123 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+from database import Database, connect, pragmas_for
+from sqlalchemy import event, text
+
+
+def test_busy_timeout_is_set_first(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("DB_PRAGMA_BUSY_TIMEOUT", "100")
+    for profile in ("reader", "ingest"):
+        pragmas = pragmas_for(profile)
+        assert next(iter(pragmas)) == "busy_timeout"
+        assert pragmas["busy_timeout"] == 100
+    assert list(pragmas_for("default", {"journal_mode": "wal", "busy_timeout": 5})) == [
+        "busy_timeout",
+        "journal_mode",
+    ]
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [
+        ("journal_mode", "WAL; DROP TABLE person"),
+        ("mmap_size", "1 OR 1"),
+        ("synchronous", "SOMETIMES"),
+        ("user_version", 3),
+        ("cache_size = 1; PRAGMA query_only", 0),
+    ],
+)
+def test_pragmas_are_checked(name: str, value: str | int):
+    with pytest.raises(ValueError):
+        pragmas_for("default", {name: value})
+
+
+def test_pragmas_from_the_environment_are_checked(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("DB_PRAGMA_CACHE_SIZE", "-2000; DROP TABLE person")
+    with pytest.raises(ValueError):
+        pragmas_for("ingest")
+
+
+def test_profile_is_set_on_each_connection(tmp_path: Path):
+    path = tmp_path / "data.db"
+    sqlite3.connect(path).close()
+    engine = connect(str(path), profile="reader", pragmas={"cache_size": "-1000"})
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == -1000
+        assert connection.execute(text("PRAGMA query_only")).scalar() == 1
+    engine.dispose()
+
+
+def count_queries(db: Database) -> list[str]:
+    statements: list[str] = []
+    event.listen(
+        db.session.get_bind(),
+        "before_cursor_execute",
+        lambda _connection, _cursor, statement, *_: statements.append(statement),
+    )
+    return statements
+
+
+def test_names_are_queried_once(database: Path):
+    with Database(str(database)) as db:
+        statements = count_queries(db)
+        player = db.players.get("player 1")
+        assert player is not None
+        assert db.players.get("player 1") is player
+        assert db.players.get("nobody") is None
+        assert db.players.get("nobody") is None
+        # A name not found is asked for again, as it may have been added since
+        assert len(statements) == 3
+
+
+def test_preloaded_names_need_no_queries(database: Path):
+    with Database(str(database)) as db:
+        db.clubs.preload()
+        db.people.preload()
+        statements = count_queries(db)
+        assert db.people.get("person 1").name == "person 1"
+        assert db.people.get("nobody") is None
+        assert db.clubs.get_or_create("new club") is db.clubs.get("new club")
+        assert statements == []
+
+
+def test_created_rows_are_remembered_until_rolled_back(database: Path):
+    with Database(str(database)) as db:
+        player = db.players.get_or_create("new")
+        statements = count_queries(db)
+        assert db.players.get_or_create("new") is player
+        assert db.players.get("new") is player
+        assert statements == []
+
+        db.rollback()
+        assert db.players.get("new") is None
+
+
+def test_people_linked_outside_the_cache_are_found(database: Path):
+    with Database(str(database)) as db:
+        db.people.preload()
+        db.players.get_or_create("new")
+        db.session.flush()
+        db.people.link_unassociated()
+        person = db.people.get("new")
+        assert person is not None
+        linked = text("SELECT person_id FROM player WHERE name = 'new'")
+        assert db.session.execute(linked).scalar() == person.id
+
+
+def test_teams_are_found_by_exactly_their_members(database: Path):
+    with Database(str(database)) as db:
+        one, two, three = (db.players.get(f"player {id_}") for id_ in (1, 2, 3))
+        team = db.teams.get_or_create([one, two])
+        assert db.teams.get([two, one]) is team
+        # Neither a part of a team nor more than it
+        assert db.teams.get([one]) is None
+        assert db.teams.get([one, two, three]) is None
+
+        new = db.players.get_or_create("new")
+        pair = db.teams.get_or_create([one, new])
+        assert pair.key == db.teams.key([one.id, new.id])
+        assert db.teams.get([new, one]) is pair
@@ -0,0 +1,111 @@
+import math
+import random
+from itertools import combinations
+
+import numpy as np
+import pytest
+from draws import (
+    SPLITS,
+    _spread_bound,
+    draw_margin,
+    draw_probabilities,
+    top_draw_probabilities,
+)
+from ranking import Model
+from special import erf
+
+
+def test_erf_matches_math_erf():
+    rng = np.random.default_rng(0)
+    x = np.concatenate([np.linspace(-10, 10, 20001), rng.normal(0, 3, 20000)])
+    assert erf(x).tolist() == pytest.approx(
+        [math.erf(value) for value in x.tolist()], rel=1e-15, abs=1e-15
+    )
+    assert erf(np.array([-np.inf, 0.0, np.inf])).tolist() == [-1.0, 0.0, 1.0]
+
+
+def test_predict_draws_yields_every_match_once():
+    rng = random.Random(0)
+    model = Model(progress=False)
+    players = [str(player) for player in range(11)]
+    model.store.ids_of(players)
+    model.store.mu[:] = [rng.uniform(15, 35) for _ in players]
+    model.store.sigma[:] = [rng.uniform(1, 8) for _ in players]
+
+    chunks = list(model.predict_draws(chunk_size=16))
+    assert len(chunks) > 1
+    found = {
+        tuple(match): probability
+        for matches, probabilities in chunks
+        for match, probability in zip(matches.tolist(), probabilities.tolist())
+    }
+    expected = {
+        tuple(group[position] for position in split)
+        for group in combinations(range(len(players)), 4)
+        for split in SPLITS.tolist()
+    }
+    assert set(found) == expected
+    assert sum(len(matches) for matches, _ in chunks) == len(expected)
+    ratings = [model.get_rating(player) for player in players]
+    for match, probability in found.items():
+        teams = [
+            [ratings[match[0]], ratings[match[1]]],
+            [ratings[match[2]], ratings[match[3]]],
+        ]
+        assert probability == pytest.approx(
+            model.model.predict_draw(teams), rel=1e-12, abs=1e-15
+        )
+
+
+def teams(match) -> frozenset:
+    return frozenset((frozenset(match[:2]), frozenset(match[2:])))
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_top_draw_probabilities_matches_brute_force(seed: int):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(4, 17))
+    k = int(rng.integers(1, 60))
+    mu = rng.uniform(15, 35, n)
+    sigma = rng.uniform(0.5, 8, n)
+    if seed % 4 == 1:
+        # Everyone equally certain, leaving mu alone to tell matches apart
+        sigma[:] = 3.0
+    if seed % 4 == 2:
+        # Far apart, so that few matches are close to even
+        mu = rng.uniform(0, 100, n)
+
+    # Small chunks, so that the spread grows and its bound is relied on
+    matches, probabilities = top_draw_probabilities(mu, sigma, k, chunk_size=64)
+    every = [
+        (probability, group[list(split)].tolist())
+        for groups, chunk in draw_probabilities(mu, sigma)
+        for group, row in zip(groups, chunk)
+        for split, probability in zip(SPLITS, row.tolist())
+    ]
+    every.sort(key=lambda entry: -entry[0])
+    expected = every[:k]
+    assert probabilities.tolist() == pytest.approx(
+        [probability for probability, _ in expected], rel=1e-12
+    )
+    assert {teams(match) for match in matches.tolist()} == {
+        teams(match) for _, match in expected
+    }
+
+
+def test_spread_bound_is_the_highest_probability_beyond_the_spread():
+    margin = draw_margin(25 / 6)
+    c = np.linspace(6.0, 14.0, 801)
+    for spread in np.linspace(0.0, 30.0, 121).tolist():
+        d = spread + np.linspace(0.0, 5.0, 21)[:, None]
+        highest = float(
+            (
+                0.5
+                * (
+                    erf((margin - d) / (c * math.sqrt(2)))
+                    - erf((-margin - d) / (c * math.sqrt(2)))
+                )
+            ).max()
+        )
+        bound = _spread_bound(spread, margin, 6.0, 14.0)
+        assert highest <= bound <= highest + 1e-5
@@ -0,0 +1,53 @@
+import random
+from itertools import combinations
+
+import pytest
+from matchmaking import CourtScorer, Objective, assign_courts
+
+
+def brute_force(scorer: CourtScorer, players: int, courts: int, objective: Objective):
+    """The value of the best assignment, trying every set of groups"""
+    best = None
+    for groups in combinations(combinations(range(players), 4), courts):
+        playing = [player for group in groups for player in group]
+        if len(set(playing)) != len(playing):
+            continue
+        scores = [scorer.score(group) for group in groups]
+        value = min(scores) if objective == Objective.MINIMUM else sum(scores)
+        if best is None or value > best:
+            best = value
+    return best
+
+
+@pytest.mark.parametrize("objective", list(Objective))
+@pytest.mark.parametrize("players, courts", [(4, 1), (7, 1), (8, 2), (10, 2), (12, 2)])
+def test_exact_search_matches_brute_force(
+    players: int, courts: int, objective: Objective
+):
+    rng = random.Random(players * 10 + courts)
+    mu = [rng.uniform(15, 35) for _ in range(players)]
+    sigma = [rng.uniform(1, 8) for _ in range(players)]
+    assignment = assign_courts(mu, sigma, courts, objective)
+
+    value = assignment.minimum if objective == Objective.MINIMUM else assignment.total
+    expected = brute_force(CourtScorer(mu, sigma), players, courts, objective)
+    assert value == pytest.approx(expected, rel=1e-12)
+    assert len(assignment.courts) == courts
+    playing = [player for court in assignment.courts for player in court]
+    assert sorted(playing + assignment.resting) == list(range(players))
+
+
+def test_local_search_fills_every_court():
+    rng = random.Random(40)
+    mu = [rng.uniform(15, 35) for _ in range(40)]
+    sigma = [rng.uniform(1, 8) for _ in range(40)]
+    assignment = assign_courts(mu, sigma, 4)
+
+    playing = [player for court in assignment.courts for player in court]
+    assert len(assignment.courts) == 4
+    assert len(set(playing)) == 16
+    assert sorted(playing + assignment.resting) == list(range(40))
+    scorer = CourtScorer(mu, sigma)
+    assert assignment.probabilities == [
+        scorer.draw_probability(court[:2], court[2:]) for court in assignment.courts
+    ]
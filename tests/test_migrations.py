@@ -0,0 +1,104 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from alembic import command
+from alembic.config import Config
+
+ROOT = Path(__file__).parent.parent
+
+
+def migrate(path: Path, revision: str):
+    config = Config(str(ROOT / "alembic.ini"))
+    config.set_main_option("script_location", str(ROOT / "alembic"))
+    config.set_main_option("prepend_sys_path", str(ROOT))
+    config.set_main_option("sqlalchemy.url", f"sqlite:///{path}")
+    command.upgrade(config, revision)
+
+
+def test_unique_names_merge_duplicates_first(tmp_path: Path):
+    path = tmp_path / "data.db"
+    migrate(path, "f3a7c2e9b814")
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executemany(
+            "INSERT INTO club (id, name) VALUES (?, ?)", [(1, "a"), (2, "b"), (3, "a")]
+        )
+        # The duplicate club has a session on a day the first has one, and another
+        connection.executemany(
+            'INSERT INTO "session" (id, date, club_id) VALUES (?, ?, ?)',
+            [(1, "2020-01-01", 1), (2, "2020-01-01", 3), (3, "2020-01-02", 3)],
+        )
+        connection.executemany(
+            "INSERT INTO person (id, name) VALUES (?, ?)",
+            [(1, "p"), (2, "q"), (3, "p")],
+        )
+        connection.executemany(
+            "INSERT INTO player (id, name, person_id) VALUES (?, ?, ?)",
+            [(1, "x", None), (2, "y", 2), (3, "x", 3), (4, "z", 1), (5, "w", 2)],
+        )
+        # Team 2 is team 1 once player 3 is merged into player 1
+        connection.executemany(
+            "INSERT INTO team (id, key) VALUES (?, ?)",
+            [(1, "1,2"), (2, "2,3"), (3, "4,5")],
+        )
+        connection.executemany(
+            "INSERT INTO team_member (player_id, team_id) VALUES (?, ?)",
+            [(1, 1), (2, 1), (2, 2), (3, 2), (4, 3), (5, 3)],
+        )
+        connection.executemany(
+            'INSERT INTO "match" (id, session_id, session_index, winner_score, '
+            "loser_score, margin, duration, type, start_time, end_time) "
+            "VALUES (?, ?, ?, 21, 15, 6, 600, 'UNDEFINED', '10:00:00', '10:10:00')",
+            [(1, 1, 0), (2, 1, 1), (3, 2, 0), (4, 3, 0)],
+        )
+        connection.executemany(
+            "INSERT INTO result (team_id, match_id, winner) VALUES (?, ?, ?)",
+            [(team, match, team != 3) for match in range(1, 5) for team in (2, 3)],
+        )
+        connection.execute(
+            "INSERT INTO rank_history (person_id, match_id, mu, sigma) "
+            "VALUES (3, 1, 25, 8)"
+        )
+    connection.close()
+
+    migrate(path, "c8e2f5a1d639")
+    connection = sqlite3.connect(path)
+
+    def rows(sql: str) -> list[tuple]:
+        return connection.execute(sql).fetchall()
+
+    assert rows("SELECT id, name FROM club ORDER BY id") == [(1, "a"), (2, "b")]
+    assert rows('SELECT id, date, club_id FROM "session" ORDER BY id') == [
+        (1, "2020-01-01", 1),
+        (3, "2020-01-02", 1),
+    ]
+    # Numbered after the matches of the session it was merged into
+    assert rows('SELECT id, session_id, session_index FROM "match" ORDER BY id') == [
+        (1, 1, 0),
+        (2, 1, 1),
+        (3, 1, 2),
+        (4, 3, 0),
+    ]
+    assert rows("SELECT id, name FROM person ORDER BY id") == [(1, "p"), (2, "q")]
+    # Player 1 takes the person of the player merged into it
+    assert rows("SELECT id, name, person_id FROM player ORDER BY id") == [
+        (1, "x", 1),
+        (2, "y", 2),
+        (4, "z", 1),
+        (5, "w", 2),
+    ]
+    assert rows("SELECT id, key FROM team ORDER BY id") == [(1, "1,2"), (3, "4,5")]
+    assert rows("SELECT player_id, team_id FROM team_member ORDER BY team_id, 1") == [
+        (1, 1),
+        (2, 1),
+        (4, 3),
+        (5, 3),
+    ]
+    assert rows("SELECT DISTINCT team_id FROM result ORDER BY 1") == [(1,), (3,)]
+    # The ratings are made again from the merged matches by the next run
+    assert rows("SELECT * FROM rank_history") == []
+    with pytest.raises(sqlite3.IntegrityError):
+        connection.execute("INSERT INTO player (name) VALUES ('x')")
+    connection.close()
@@ -0,0 +1,87 @@
+import csv
+import sqlite3
+from dataclasses import asdict, fields
+from pathlib import Path
+
+import pandas as pd
+import pipeline
+from database import Database
+from ranking import PartitionedModel, read_matches
+from thurstone import ThurstoneMosteller2v2
+
+
+def test_full_run_rates_in_the_order_played(database: Path):
+    pipeline.main(full=True)
+
+    connection = sqlite3.connect(database)
+    rows = connection.execute("""
+        SELECT "match".id, "match".winner_score, "match".loser_score,
+            result.winner, player.person_id
+        FROM "match"
+        INNER JOIN "session" ON "session".id = "match".session_id
+        INNER JOIN result ON result.match_id = "match".id
+        INNER JOIN team_member ON team_member.team_id = result.team_id
+        INNER JOIN player ON player.id = team_member.player_id
+        ORDER BY "session".date, "match".session_index, "match".id,
+            result.winner DESC, player.person_id
+        """).fetchall()
+    stored = {
+        (person_id, match_id): (mu, sigma)
+        for person_id, match_id, mu, sigma in connection.execute(
+            "SELECT person_id, match_id, mu, sigma FROM rank_history"
+        )
+    }
+    connection.close()
+
+    model = ThurstoneMosteller2v2()
+    ratings: dict[int, tuple[float, float]] = {}
+    expected = {}
+    for start in range(0, len(rows), 4):
+        match_id, winner_score, loser_score = rows[start][:3]
+        people = [row[4] for row in rows[start : start + 4]]
+        before = [ratings.get(person, (model.mu, model.sigma)) for person in people]
+        mu, sigma = model.rate(
+            [mu for mu, _ in before],
+            [sigma for _, sigma in before],
+            (winner_score, loser_score),
+        )
+        for person, rating in zip(people, zip(mu, sigma)):
+            ratings[person] = expected[person, match_id] = rating
+    assert stored == expected
+
+
+def test_incremental_run_matches_full_run(database: Path, held_back, rated):
+    pipeline.main()
+    held_back.ingest()
+    pipeline.main()
+    incremental = rated(database)
+
+    pipeline.main(full=True)
+    assert incremental == rated(database)
+
+
+def test_leaderboards_match_ranking(database: Path, tmp_path: Path):
+    db = Database(path=str(database))
+    with db:
+        rows = db.views.matches()
+        # Chunks smaller than a day of matches
+        sink = pipeline.LeaderboardSink(tmp_path, chunk_size=5)
+        pipeline.run(db, pipeline.RatingCache(db, True), [sink], full=True)
+        db.rollback()
+    # Written and read as data_extraction.py and ranking.py do
+    with open(tmp_path / "matches.csv", "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(
+            file, fieldnames=[field.name for field in fields(rows[0])]
+        )
+        writer.writeheader()
+        writer.writerows(asdict(row) for row in rows)
+    model = PartitionedModel()
+    model.update(read_matches(tmp_path / "matches.csv"))
+
+    expected = model.results()
+    assert sink.model.results().keys() == expected.keys()
+    for partition, results in sink.model.results().items():
+        pd.testing.assert_frame_equal(
+            results.sort_values("Player", ignore_index=True),
+            expected[partition].sort_values("Player", ignore_index=True),
+        )
@@ -0,0 +1,37 @@
+import re
+
+import pytest
+from query_plans import explain, seed
+
+
+@pytest.fixture(scope="module")
+def plans(tmp_path_factory: pytest.TempPathFactory):
+    path = str(tmp_path_factory.mktemp("query_plans") / "query_plans.db")
+    seed(path, clubs=2, people=40, sessions=10, matches_per_session=5)
+    return explain(path)
+
+
+def test_every_query_is_explained(plans):
+    names = {plan.name for plan in plans}
+    assert "ViewsRepo.matches(club_name)" in names
+    assert all(plan.detail for plan in plans if plan.statement.lstrip()[:6] == "SELECT")
+
+
+def test_queries_use_their_indexes(plans):
+    assert {plan.name: plan.unexpected for plan in plans if plan.unexpected} == {}
+
+
+@pytest.mark.parametrize(
+    "name, index",
+    [
+        ("PlayerRepo.get", "ix_player_name"),
+        ("PersonRepo.get", "ix_person_name"),
+        ("ClubRepo.get", "ix_club_name"),
+        ("TeamRepo.get", "ix_team_key"),
+    ],
+)
+def test_lookups_probe_their_unique_index(plans, name: str, index: str):
+    details = [detail for plan in plans if plan.name == name for detail in plan.detail]
+    assert any(
+        re.search(rf"USING (COVERING )?INDEX {index}\b", detail) for detail in details
+    )
@@ -0,0 +1,92 @@
+import sqlite3
+from pathlib import Path
+
+import pipeline
+import ranking_history
+
+# The third match of the second club's second session
+CORRECTED = 81
+# A match added to the end of the first club's third session
+INSERTED = 1000
+
+
+def winning_team(connection: sqlite3.Connection, match_id: int) -> int:
+    return connection.execute(
+        "SELECT team_id FROM result WHERE match_id = ? AND winner", (match_id,)
+    ).fetchone()[0]
+
+
+def test_recompute_then_replay_matches_full_run(database: Path, held_back, rated):
+    connection = sqlite3.connect(database)
+    with connection:
+        # Someone whose only match is the one to be corrected
+        connection.execute("INSERT INTO person (id, name) VALUES (100, 'new')")
+        connection.execute(
+            "INSERT INTO player (id, name, person_id) VALUES (100, 'new', 100)"
+        )
+        team_id = winning_team(connection, CORRECTED)
+        partner = connection.execute(
+            "SELECT MIN(player_id) FROM team_member WHERE team_id = ?", (team_id,)
+        ).fetchone()[0]
+        connection.execute(
+            "INSERT INTO team (id, key) VALUES (1000, ?)", (f"{partner},100",)
+        )
+        connection.executemany(
+            "INSERT INTO team_member (player_id, team_id) VALUES (?, 1000)",
+            [(partner,), (100,)],
+        )
+        connection.execute(
+            "UPDATE result SET team_id = 1000 WHERE match_id = ? AND winner",
+            (CORRECTED,),
+        )
+    pipeline.main()
+
+    with connection:
+        # The new person is taken out of the match again
+        connection.execute(
+            "UPDATE result SET team_id = ? WHERE match_id = ? AND winner",
+            (team_id, CORRECTED),
+        )
+        connection.execute(
+            'INSERT INTO "match" (id, session_id, session_index, winner_score, '
+            "loser_score, margin, duration, type, start_time, end_time) "
+            "SELECT ?, session_id, 6, 21, 19, 2, duration, type, start_time, "
+            'end_time FROM "match" WHERE id = 13',
+            (INSERTED,),
+        )
+        connection.executemany(
+            "INSERT INTO result (team_id, match_id, winner) VALUES (?, ?, ?)",
+            [(1, INSERTED, True), (2, INSERTED, False)],
+        )
+    connection.close()
+    held_back.ingest()
+    assert ranking_history.recompute([CORRECTED, INSERTED]) > 0
+    pipeline.main()
+    recomputed = rated(database)
+    assert 100 not in {row[0] for row in recomputed["current_rating"]}
+
+    pipeline.main(full=True)
+    assert recomputed == rated(database)
+
+
+def test_retract_matches_full_run(database: Path, rated):
+    pipeline.main(full=True)
+    # Matches on the same day at both clubs, and one at the first club after them
+    retracted = [20, 21, 92, 40]
+    assert ranking_history.retract(retracted) > len(retracted)
+    retracted_tables = rated(database)
+
+    pipeline.main(full=True)
+    assert retracted_tables == rated(database)
+
+
+def test_retract_before_ingested_matches_are_rated(database: Path, held_back, rated):
+    pipeline.main(full=True)
+    held_back.ingest()
+    # Played in March, after the last match rated
+    assert ranking_history.retract([130]) == 0
+    pipeline.main()
+    retracted_tables = rated(database)
+
+    pipeline.main(full=True)
+    assert retracted_tables == rated(database)
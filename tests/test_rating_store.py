@@ -0,0 +1,17 @@
+from rating_store import RatingStore
+
+
+def test_most_frequent_is_kept_until_the_counter_changes():
+    store = RatingStore()
+    a, b, c = store.ids_of(["a", "b", "c"]).tolist()
+    store.count(store.won_with, [(a, b), (b, a), (a, c), (a, c)])
+
+    found = store.most_frequent(store.won_with)
+    assert found.tolist() == ["c", "a", ""]
+    assert store.most_frequent(store.won_with) is found
+    assert store.most_frequent(store.lost_with).tolist() == ["", "", ""]
+
+    store.count(store.won_with, [(a, b), (a, b), (c, a)])
+    assert store.most_frequent(store.won_with).tolist() == ["b", "a", "a"]
+    store.id_of("d")
+    assert store.most_frequent(store.won_with).tolist() == ["b", "a", "a", ""]
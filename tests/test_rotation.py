@@ -0,0 +1,92 @@
+import random
+
+import pytest
+from ranking import Model
+from rotation import Rotation
+
+PLAYERS = [f"player {number}" for number in range(18)]
+
+
+def rotation(rounds: int = 6) -> Rotation:
+    rng = random.Random(0)
+    model = Model(progress=False)
+    ids = model.store.ids_of(PLAYERS)
+    model.store.mu[ids] = [rng.uniform(15, 35) for _ in PLAYERS]
+    model.store.sigma[ids] = [rng.uniform(1, 8) for _ in PLAYERS]
+    return Rotation(model, PLAYERS, courts=4, rounds=rounds)
+
+
+def test_plan_shares_out_the_courts():
+    schedule = rotation().schedule
+
+    games = dict.fromkeys(PLAYERS, 0)
+    for number, matches in enumerate(schedule):
+        assert [match.court for match in matches] == [0, 1, 2, 3]
+        assert [match.session_index for match in matches] == [
+            4 * number + court for court in range(4)
+        ]
+        playing = [player for match in matches for player in match.players]
+        assert len(set(playing)) == 16
+        for player in playing:
+            games[player] += 1
+    # Rest is shared out evenly
+    assert max(games.values()) - min(games.values()) <= 1
+
+
+def test_round_plans_only_as_far_as_asked():
+    planned = rotation()
+    first = planned.round(0)
+    assert planned._stale == 1
+    assert planned.schedule[0] == first
+
+
+def test_complete_rates_the_match_and_replans_later_rounds():
+    planned = rotation()
+    schedule = planned.schedule
+    match = schedule[1][2]
+    store = planned.model.store
+    before = store.mu[store.ids_of(match.players)].tolist()
+
+    planned.complete(match, 21, 3)
+    after = store.mu[store.ids_of(match.players)].tolist()
+    assert after[0] > before[0] and after[1] > before[1]
+    assert after[2] < before[2] and after[3] < before[3]
+    assert store.games[store.ids_of(match.players)].tolist() == [1, 1, 1, 1]
+
+    replanned = planned.schedule
+    # The rounds up to the match's stay as they were
+    assert replanned[:2] == schedule[:2]
+    for matches in replanned[2:]:
+        playing = [player for match in matches for player in match.players]
+        assert len(set(playing)) == 16
+    scorer = planned.scorer
+    for matches in replanned[2:]:
+        for scheduled in matches:
+            court = [planned._index[name] for name in scheduled.players]
+            assert scheduled.draw_probability == scorer.draw_probability(
+                court[:2], court[2:]
+            )
+
+
+def test_complete_refuses_a_match_twice():
+    planned = rotation()
+    match = planned.round(0)[0]
+    planned.complete(match, 21, 15)
+    with pytest.raises(ValueError):
+        planned.complete(match, 21, 15)
+    # The other courts of the round can still be completed
+    planned.complete(planned.round(0)[1], 12, 21)
+
+
+def test_complete_refuses_a_match_no_longer_scheduled():
+    planned = rotation()
+    match = planned.round(3)[0]
+    stale = type(match)(
+        round=match.round,
+        court=match.court,
+        session_index=match.session_index,
+        players=tuple(reversed(match.players)),
+        draw_probability=match.draw_probability,
+    )
+    with pytest.raises(ValueError):
+        planned.complete(stale, 21, 10)
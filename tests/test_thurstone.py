@@ -0,0 +1,135 @@
+import random
+
+import numpy as np
+import pytest
+from draws import draw_probability
+from openskill.models import ThurstoneMostellerFull
+from ranking import Model
+from thurstone import ThurstoneMosteller2v2
+
+
+def random_match(rng: random.Random) -> tuple[list[float], list[float], list[int]]:
+    mu = [rng.uniform(5, 45) for _ in range(4)]
+    sigma = [rng.uniform(0.5, 25 / 3) for _ in range(4)]
+    winner = rng.randrange(22)
+    # One match in ten is drawn
+    scores = [winner, winner] if rng.random() < 0.1 else [21, rng.randrange(21)]
+    return mu, sigma, scores
+
+
+def openskill_rate(
+    model: ThurstoneMostellerFull,
+    mu: list[float],
+    sigma: list[float],
+    scores: list[int],
+) -> tuple[list[float], list[float]]:
+    ratings = [model.rating(mu=m, sigma=s) for m, s in zip(mu, sigma)]
+    teams = model.rate([ratings[:2], ratings[2:]], scores=scores)
+    players = [player for team in teams for player in team]
+    return [player.mu for player in players], [player.sigma for player in players]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_rate_matches_openskill(seed: int):
+    rng = random.Random(seed)
+    model = ThurstoneMostellerFull()
+    kernel = ThurstoneMosteller2v2()
+    for _ in range(500):
+        mu, sigma, scores = random_match(rng)
+        assert kernel.rate(mu, sigma, tuple(scores)) == openskill_rate(
+            model, mu, sigma, scores
+        )
+
+
+def test_rate_matches_openskill_either_way_round():
+    # A loss for team one is the same match as a win for team two
+    model = ThurstoneMostellerFull()
+    kernel = ThurstoneMosteller2v2()
+    mu, sigma = [30.0, 20.0, 26.0, 24.0], [3.0, 6.0, 4.0, 5.0]
+    assert kernel.rate(mu, sigma, (12, 21)) == openskill_rate(
+        model, mu, sigma, [12, 21]
+    )
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_rate_batch_matches_openskill(seed: int):
+    rng = random.Random(seed)
+    model = ThurstoneMostellerFull()
+    kernel = ThurstoneMosteller2v2()
+    matches = [random_match(rng) for _ in range(500)]
+    # Lopsided matches, whose probabilities are far in the tails
+    matches.append(([200.0, 30.0, 5.0, 5.0], [1.0, 2.0, 1.0, 2.0], [12, 21]))
+    matches.append(([200.0, 30.0, 5.0, 5.0], [1.0, 2.0, 1.0, 2.0], [21, 21]))
+    mu, sigma = kernel.rate_batch(
+        np.array([match[0] for match in matches]),
+        np.array([match[1] for match in matches]),
+        np.array([match[2] for match in matches]),
+    )
+    # Sums and differences of erf cancel in the tails, magnifying its last bit
+    for index, match in enumerate(matches):
+        expected_mu, expected_sigma = openskill_rate(model, *match)
+        assert mu[index].tolist() == pytest.approx(expected_mu, rel=1e-10)
+        assert sigma[index].tolist() == pytest.approx(expected_sigma, rel=1e-10)
+
+
+def test_rate_batch_rates_every_match_on_its_own():
+    rng = random.Random(0)
+    kernel = ThurstoneMosteller2v2()
+    matches = [random_match(rng) for _ in range(100)]
+    mu, sigma, scores = (np.array([match[i] for match in matches]) for i in range(3))
+    batch = kernel.rate_batch(mu, sigma, scores)
+    for index in range(len(matches)):
+        one = kernel.rate_batch(
+            mu[index : index + 1], sigma[index : index + 1], scores[index : index + 1]
+        )
+        assert one[0].tolist() == batch[0][index : index + 1].tolist()
+        assert one[1].tolist() == batch[1][index : index + 1].tolist()
+
+
+@pytest.mark.parametrize("players", [8, 200])
+def test_rate_matches_matches_openskill_in_order(players: int):
+    rng = random.Random(players)
+    model = ThurstoneMostellerFull()
+    ratings = {player: (model.mu, model.sigma) for player in range(players)}
+    lineups = np.array([rng.sample(range(players), 4) for _ in range(2000)])
+    scores = np.array([[21, rng.randrange(21)] for _ in range(2000)], dtype=float)
+    for lineup, score in zip(lineups.tolist(), scores.tolist()):
+        mu, sigma = openskill_rate(
+            model,
+            [ratings[player][0] for player in lineup],
+            [ratings[player][1] for player in lineup],
+            score,
+        )
+        ratings.update(zip(lineup, zip(mu, sigma)))
+
+    rated = Model(progress=False)
+    ids = rated.store.ids_of([str(player) for player in range(players)])
+    rated.rate_matches(ids[lineups], scores)
+    assert rated.store.mu[ids].tolist() == [ratings[p][0] for p in range(players)]
+    assert rated.store.sigma[ids].tolist() == [ratings[p][1] for p in range(players)]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_draw_probability_matches_openskill(seed: int):
+    rng = random.Random(seed)
+    model = ThurstoneMostellerFull()
+    matches = [random_match(rng)[:2] for _ in range(200)]
+    mu = np.array([m for m, _ in matches])
+    sigma_squared = np.array([s for _, s in matches]) ** 2
+    probabilities = draw_probability(
+        mu[:, 0] + mu[:, 1],
+        sigma_squared[:, 0] + sigma_squared[:, 1],
+        mu[:, 2] + mu[:, 3],
+        sigma_squared[:, 2] + sigma_squared[:, 3],
+        model.beta,
+    )
+    expected = [
+        model.predict_draw(
+            [
+                [model.rating(mu=m[0], sigma=s[0]), model.rating(mu=m[1], sigma=s[1])],
+                [model.rating(mu=m[2], sigma=s[2]), model.rating(mu=m[3], sigma=s[3])],
+            ]
+        )
+        for m, s in matches
+    ]
+    assert probabilities.tolist() == pytest.approx(expected, rel=1e-12, abs=1e-15)
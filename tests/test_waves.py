@@ -0,0 +1,50 @@
+import random
+
+import numpy as np
+import pytest
+from ranking import Model
+from waves import split_waves, wave_numbers
+
+
+def random_lineups(rng: random.Random, players: int, matches: int) -> np.ndarray:
+    return np.array([rng.sample(range(players), 4) for _ in range(matches)])
+
+
+@pytest.mark.parametrize("players", [4, 9, 1000])
+def test_waves_keep_every_players_matches_in_order(players: int):
+    lineups = random_lineups(random.Random(players), players, 3000)
+    waves = split_waves(wave_numbers(lineups))
+    assert sorted(np.concatenate(waves).tolist()) == list(range(len(lineups)))
+
+    seen: dict[int, list[int]] = {}
+    for wave in waves:
+        # No player is in two matches of a wave
+        assert len(np.unique(lineups[wave])) == 4 * len(wave)
+        for match in wave.tolist():
+            for player in lineups[match].tolist():
+                seen.setdefault(player, []).append(match)
+    assert all(matches == sorted(matches) for matches in seen.values())
+
+
+@pytest.mark.parametrize("players", [40, 4000])
+def test_rating_in_waves_matches_rating_in_order(players: int):
+    rng = random.Random(players)
+    lineups = random_lineups(rng, players, 20000)
+    scores = np.array(
+        [[21, 21] if rng.random() < 0.05 else [21, rng.randrange(21)] for _ in lineups],
+        dtype=float,
+    )
+
+    sequential = Model(progress=False)
+    ids = sequential.store.ids_of([str(player) for player in range(players)])
+    store = sequential.store
+    for lineup, score in zip(ids[lineups], scores.tolist()):
+        store.mu[lineup], store.sigma[lineup] = sequential.kernel.rate(
+            store.mu[lineup].tolist(), store.sigma[lineup].tolist(), score
+        )
+
+    waves = Model(progress=False)
+    ids = waves.store.ids_of([str(player) for player in range(players)])
+    waves.rate_matches(ids[lineups], scores)
+    assert waves.store.mu.tolist() == pytest.approx(store.mu.tolist(), rel=1e-10)
+    assert waves.store.sigma.tolist() == pytest.approx(store.sigma.tolist(), rel=1e-10)